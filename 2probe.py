@@ -4,9 +4,8 @@ import time
 import timeit
 import numpy as np
 import matplotlib.pyplot as plt
-from sigfig import round
 import pandas as pd
-from GPIB_instruments import Agilent2400_SourceMeter
+from GPIB_instruments import Agilent2400_SourceMeter, format_list
 
 '''
 class Two_Probe():
@@ -39,7 +38,7 @@ SM = Agilent2400_SourceMeter('GPIB0::20::INSTR')
         
 def sweep_list(start, stop, step):
     arr = np.arange(start, stop, step)
-    curr = ','.join([str(round(i, sigfigs=2)) for i in arr])
+    curr = format_list(arr, 2)
     return curr
 
 #def measure(start, stop, step):
@@ -2,10 +2,139 @@ import sys
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
-from device import MeasurementDevice
+import hashlib
+from device import MeasurementDevice, join_commands
 import time
 
+def format_list(values, digits=7):
+    """
+    Format values as a comma separated SCPI list, converting the array to
+    Python floats in one call instead of element by element.
+    
+    Parameters:
+    - values (list/numpy.ndarray): The values.
+    - digits (int): Significant digits. (Default to be 7)
+    
+    Returns:
+    - str: The list, e.g. "0.001,-0.001".
+    """
+    return ",".join(map(f"%.{digits}g".__mod__, np.asarray(values, dtype=float).ravel().tolist()))
+
+def wait_settled(read, target, tolerance, timeout=0.3, count=2, interval=0):
+    """
+    Poll a readback until it settles at the target: count consecutive readings
+    within tolerance of the target. Returns as soon as it has settled, and
+    after timeout at the latest.
+    
+    Parameters:
+    - read (function): Returns one reading as a float.
+    - target (float): The expected reading.
+    - tolerance (float): Largest accepted deviation from the target.
+    - timeout (float): Longest wait(s). (Default to be 0.3)
+    - count (int): Consecutive readings within tolerance required. (Default to be 2)
+    - interval (float): Pause(s) between readings. (Default to be 0)
+    
+    Returns:
+    - tuple: Time(s) waited, and whether the readback settled.
+    """
+    start = time.perf_counter()
+    within = 0
+    while True:
+        reading = read()
+        elapsed = time.perf_counter() - start
+        within = within + 1 if abs(reading - target) <= tolerance else 0
+        if within >= count:
+            return elapsed, True
+        if elapsed >= timeout:
+            return elapsed, False
+        if interval:
+            time.sleep(interval)
+
+def settle_together(waits):
+    """
+    Wait for several supplies to settle at once. Each round sends MEAS:CURR?
+    to every supply still settling before reading any of them, so the
+    digitizing measurements overlap and the whole wait lasts as long as the
+    slowest supply's. Each supply's own settle parameters apply (see
+    Agilent6613C_PowerSupply.wait_settled()).
+    
+    Parameters:
+    - waits (list of tuple): (supply, reason) pairs, e.g. from source_I(..., wait=False).
+                             Pairs with a None reason are skipped, a supply listed twice
+                             is waited for once.
+    
+    Returns:
+    - float: Time(s) waited.
+    
+    Raises:
+    - Exception: If any issues with communication or data retrieval occur.
+    """
+    # One wait per supply, a relay flip outweighs a compliance change
+    reasons = {}
+    for supply, reason in waits:
+        if reason is not None and reasons.get(supply) != "relay":
+            reasons[supply] = reason
+    # Nothing to settle with the output off
+    waiting = [(supply, reason) for supply, reason in reasons.items()
+               if supply.cached_state().get("OUTP") != "0"]
+    within = {id(supply): 0 for supply, reason in waiting}
+    start = time.perf_counter()
+    while waiting:
+        try:
+            handles = [supply.send_query("MEAS:CURR?") for supply, reason in waiting]
+            readings = [supply.collect(handle) for (supply, reason), handle in zip(waiting, handles)]
+        except Exception:
+            for supply, reason in waiting:
+                supply.discard_query()
+            raise
+        elapsed = time.perf_counter() - start
+        still = []
+        for (supply, reason), reading in zip(waiting, readings):
+            target = abs(supply.curr)
+            ok = abs(float(reading) - target) <= supply.settle_tolerance + supply.settle_relative*target
+            within[id(supply)] = within[id(supply)] + 1 if ok else 0
+            if within[id(supply)] >= supply.settle_count:
+                supply.log_settle(reason, elapsed, True)
+            elif elapsed >= supply.settle_timeout:
+                supply.log_settle(reason, elapsed, False)
+            else:
+                still.append((supply, reason))
+        waiting = still
+    return time.perf_counter() - start
+
+def move_vector(moves):
+    """
+    Move several supplies to new setpoints, e.g. the X and Y magnets for one
+    field vector. Every supply gets its compliance, relay and current before
+    any of them is waited on, then they settle together (see settle_together()).
+    
+    Parameters:
+    - moves (list of tuple): (supply, current(A), relay reversed or None, compliance voltage(V) or None)
+                             per supply.
+    
+    Returns:
+    - float: Time(s) waited for the outputs to settle.
+    
+    Raises:
+    - Exception: If any issues with communication or data retrieval occur.
+    """
+    waits = []
+    for supply, curr, rel, volt in moves:
+        if volt is not None:
+            waits.append((supply, supply.compliance_level(volt, wait=False)))
+        waits.append((supply, supply.source_I(curr, rel, wait=False)))
+    return settle_together(waits)
+
 class Agilent6613C_PowerSupply(MeasurementDevice):
+    max_line_length = 256
+    # Settle detection, see wait_settled()
+    settle_tolerance = 1e-4     # A
+    settle_relative = 1e-3      # of the setpoint
+    settle_timeout = 0.3        # s
+    settle_count = 2
+    settle_on_relay = True
+    # ReadbackPolicy of read_I(), None to measure every call
+    readback_policy = None
     
     def initialize(self):
         """
@@ -17,14 +146,19 @@ class Agilent6613C_PowerSupply(MeasurementDevice):
         """
         try:
             super().connect()
-            self.set_values("*RST")
-            self.set_values("*CLS")
-            self.set_values("SENSe:SWEep:POINts 256")
+            with self.transaction():
+                self.set_values("*RST")
+                self.set_values("*CLS")
+                self.set_values("SENSe:SWEep:POINts 256")
             self.volt = 0
             self.curr = 0
             self.rel = 1
+            self.settle_log = []
+            self.measured = True
+            if self.readback_policy is not None:
+                self.readback_policy.reset()
         except:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             
     def output(self, output=False):
         """
@@ -38,11 +172,11 @@ class Agilent6613C_PowerSupply(MeasurementDevice):
         """
         try:
             if output == True:
-                self.set_values("OUTP 1")
+                self.set_state("OUTP", 1)
             else:
-                self.set_values("OUTP 0")
+                self.set_state("OUTP", 0)
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent6613C_PowerSupply: Invalid output input: {str(e)}")
         
         
@@ -54,20 +188,26 @@ class Agilent6613C_PowerSupply(MeasurementDevice):
         - relay (boolean): Relay on/off, when it is on, negative current will be sourced;
                            otherwise, positive current will be sourced. (Default to be off)
         
+        Returns:
+        - boolean: True if the polarity was switched.
+        
         Raises
         - Exception: Invalid input of relay parameter or communication issue.
         """
         try:
-            if rel == True:
-                self.set_values("OUTP:REL ON")
-                self.set_values("OUTP:REL:POL REV")
-                self.rel = -1
-            else:
-                self.set_values("OUTP:REL ON")
-                self.set_values("OUTP:REL:POL NORM")
-                self.rel = 1
+            with self.transaction(check_errors=False):
+                # Only the settings that change are sent
+                if rel == True:
+                    self.set_state("OUTP:REL", "ON")
+                    switched = self.set_state("OUTP:REL:POL", "REV")
+                    self.rel = -1
+                else:
+                    self.set_state("OUTP:REL", "ON")
+                    switched = self.set_state("OUTP:REL:POL", "NORM")
+                    self.rel = 1
+            return switched
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent6613C_PowerSupply: Invalid relay input: {str(e)}")
         
     def source_V(self, volt=0):
@@ -83,34 +223,47 @@ class Agilent6613C_PowerSupply(MeasurementDevice):
         self.volt = volt
         try:
             if volt <= 51 and volt >= 0:
-                self.set_values("VOLT " + str(volt))
+                self.set_state("VOLT", volt)
             else:
                 print(f"Agilent6613C_PowerSupply: Output voltage exceeds limitation.")
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent6613C_PowerSupply: Invalid voltage input(value must : {str(e)}")
         
-    def source_I(self, curr=0):
+    def source_I(self, curr=0, rel=None, wait=True):
         """
         Set the output current(compliance). 
         
         Parameters:
         - curr(float): Value of current(A). (Default to be 0)
+        - rel(boolean): Relay polarity to use, e.g. from a sweep plan, which matters
+                        for a zero current. (Default to be reversed for negative currents)
+        - wait(boolean): Wait for the output to settle after a relay flip. (Default to be on)
+        
+        Returns:
+        - str: "relay" if the output still has to settle (wait off), else None.
         
         Raises:
         - Exception: Invalid input of current parameter or communication issue.
         """
         self.curr = curr
         try:
-            if curr < 0:
-                self.relay(True)
-            else:
-                self.relay(False)
-            curr = abs(curr)
-            if curr <= 1.1 and curr >= 0 :
-                self.set_values("CURR " + str(curr))
+            if rel is None:
+                rel = curr < 0
+            elif curr != 0 and rel != (curr < 0):
+                raise Exception(f"Relay polarity does not match the sign of {curr} A")
+            # Relay and setpoint go out as one message
+            with self.transaction(check_errors=False):
+                switched = self.relay(rel)
+                curr = abs(curr)
+                if curr <= 1.1 and curr >= 0 :
+                    self.set_state("CURR", curr)
+            if switched and self.settle_on_relay:
+                if not wait:
+                    return "relay"
+                self.wait_settled("relay")
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent6613C_PowerSupply: Invalid current input: {str(e)}")
         
     def source_VI(self, volt=0, curr=0):
@@ -128,42 +281,114 @@ class Agilent6613C_PowerSupply(MeasurementDevice):
             self.source_volt(volt)
             self.source_curr(curr)
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent6613C_PowerSupply: Invalid voltage or current input: {str(e)}")
             
-    def compliance_level(self):
-        if (abs(self.curr) > 0.015) and (self.volt != 51):
-            self.set_values("VOLT 51")
-            self.volt = 51
-            time.sleep(.3)
-            #time.sleep(.1)
-        elif (abs(self.curr) > 0.001) and (abs(self.curr) < 0.015) and (self.volt != 1):
-            self.set_values("VOLT 1")
-            self.volt = 1
-            time.sleep(.3)
-            #time.sleep(.1)
-        elif (abs(self.curr) < 0.001) and (self.volt != 0.05):
-            self.set_values("VOLT 0.1")
-            self.volt = 0.05
-            time.sleep(.3)
-            #time.sleep(.1)
+    def compliance_level(self, volt=None, wait=True):
+        """
+        Set the voltage compliance for the present current setpoint, waiting
+        for the output to settle only when the compliance actually changes.
+        
+        Parameters:
+        - volt(float): Compliance voltage(V) to use, e.g. from a sweep plan. (Default to the band
+                       of the present current setpoint)
+        - wait(boolean): Wait for the output to settle after a change. (Default to be on)
+        
+        Returns:
+        - str: "compliance" if the output still has to settle (wait off), else None.
+        """
+        if volt is None:
+            if abs(self.curr) > 0.015:
+                volt = 51
+            elif (abs(self.curr) > 0.001) and (abs(self.curr) < 0.015):
+                volt = 1
+            elif abs(self.curr) < 0.001:
+                volt = 0.1
+            else:
+                return
+        if self.set_state("VOLT", volt):
+            self.volt = volt
+            if not wait:
+                return "compliance"
+            self.wait_settled("compliance")
+    
+    def wait_settled(self, reason="settle"):
+        """
+        Wait for the output current to settle at the setpoint after a relay or
+        compliance change, by polling the readback (see wait_settled()). The
+        time waited is kept in self.settle_log, journaled, and recorded by the
+        latency recorder as "SETTLE:<reason>".
+        
+        Parameters:
+        - reason (str): What changed, for the log. (Default to be "settle")
+        
+        Returns:
+        - float: Time(s) waited.
+        
+        Raises:
+        - Exception: If any issues with communication or data retrieval occur.
+        """
+        if self._state.get("OUTP") == "0":
+            # Nothing to settle with the output off
+            return 0.0
+        target = abs(self.curr)
+        elapsed, settled = wait_settled(lambda: float(self.get_values("MEAS:CURR?")), target,
+                                        self.settle_tolerance + self.settle_relative*target,
+                                        self.settle_timeout, self.settle_count)
+        return self.log_settle(reason, elapsed, settled)
+    
+    def log_settle(self, reason, elapsed, settled):
+        """
+        Keep a settle wait in self.settle_log, the journal and the latency recorder.
+        
+        Returns:
+        - float: Time(s) waited.
+        """
+        self.settle_log.append((reason, elapsed, settled))
+        self.journal.log(self.visa_address, "settle",
+                         f"{reason} {elapsed*1000:.1f} ms" + ("" if settled else " (timed out)"))
+        if self.recorder is not None:
+            self.recorder.record(self.visa_address, "SETTLE:" + reason.upper(), elapsed)
+        return elapsed
     
     def read_I(self, in_float=True):
         """
-        Read the output current. 
+        Read the output current. With a readback_policy the current may be
+        inferred from the setpoint instead of measured; self.measured tells
+        which one the returned value is.
         
         Raises:
         - Exception: If any issues with communication or data retrieval occur.
         """
         try:
-            result = self.get_values("MEAS:CURR?")
-            if in_float == True:
-                return self.rel*float(result)
-            else:
-                return self.get_values("MEAS:CURR?")
+            if not self._readback_due(in_float):
+                return self.readback_policy.estimate(self.curr)
+            return self._readback_value(self.get_values("MEAS:CURR?"), in_float)
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Failed to read current from the Agilent6613C_PowerSupply: {str(e)}")
+
+    def _readback_due(self, in_float=True):
+        # Ask the readback policy whether to measure, setting the points it asks for
+        policy = self.readback_policy
+        if policy is None or in_float != True:
+            return True
+        points = policy.decide(self.curr, self.rel)
+        if points is None:
+            self.measured = False
+            return False
+        self.set_state("SENS:SWE:POIN", points)
+        return True
+
+    def _readback_value(self, result, in_float=True):
+        # The measured current, as the policy sees it
+        self.measured = True
+        if in_float != True:
+            return result
+        value = self.rel*float(result)
+        if self.readback_policy is not None:
+            self.readback_policy.observe(self.curr, value)
+        return value
             
     def read_V(self):
         """
@@ -175,12 +400,26 @@ class Agilent6613C_PowerSupply(MeasurementDevice):
         try:
             self.get_values("MEAS:VOLT?")
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Failed to read voltage from the Agilent6613C_PowerSupply: {str(e)}")
         
         
     
 class Agilent2400_SourceMeter(MeasurementDevice):
+    max_line_length = 1024
+    error_queue_all = "SYST:ERR:ALL?"
+    # Reads of this many readings or more are transferred as binary blocks
+    binary_threshold = 100
+    # Readings the trace buffer holds
+    trace_limit = 2500
+    # Values per SOUR:LIST command, and their significant digits
+    list_limit = 100
+    list_digits = 7
+    counts = 1
+    elements = 1
+    # Source lists averaged on the instrument, see reversal_average()
+    reversal = False
+
     def str_float(self, raw, sep=','):
         return [float(i) for i in raw.split(sep)]
         
@@ -191,7 +430,7 @@ class Agilent2400_SourceMeter(MeasurementDevice):
             elif func == "VOLT":
                 self.set_values("SOUR:FUNC VOLT")
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent2400_SourceMeter: Invalid source function input: {str(e)}")
     
     def sense_func(self, func="VOLT"):
@@ -201,7 +440,7 @@ class Agilent2400_SourceMeter(MeasurementDevice):
             elif func == "VOLT":
                 self.set_values("SENS:FUNC \"VOLT\"")
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent2400_SourceMeter: Invalid sense function input: {str(e)}")
     
     def source_curr_mode(self, option="LIST"):
@@ -211,7 +450,7 @@ class Agilent2400_SourceMeter(MeasurementDevice):
             elif option == "LIST":
                 self.set_values("SOUR:CURR:MODE LIST")
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent2400_SourceMeter: Invalid source current mode input: {str(e)}")
     
     def source_curr_range(self, curr_range=0.001):
@@ -219,7 +458,7 @@ class Agilent2400_SourceMeter(MeasurementDevice):
             self.set_values("SOUR:CURR:RANG " + str(curr_range))
             self.curr_range = curr_range
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent2400_SourceMeter: Invalid source current range input: {str(e)}")
     
     def sense_volt_range(self, volt_range=2):
@@ -227,14 +466,15 @@ class Agilent2400_SourceMeter(MeasurementDevice):
             self.set_values("SENS:VOLT:RANG " + str(volt_range))
             self.volt_range = volt_range
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent2400_SourceMeter: Invalid sense voltage range input: {str(e)}")
       
     def form_element(self, option="VOLT"):
         try:
             self.set_values("FORM:ELEM " + option)
+            self.elements = len(option.split(","))
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent2400_SourceMeter: Invalid form input: {str(e)}")
     
     def initialize(self, scfunc="CURR", ssfunc="VOLT", scmode="LIST", scrange=0.001, svrange=10, fe="VOLT"):
@@ -248,22 +488,24 @@ class Agilent2400_SourceMeter(MeasurementDevice):
         """
         try:
             super().connect()
-            self.set_values("*RST")
-            self.set_values("*CLS")
-            self.source_func(scfunc)
-            self.sense_func(ssfunc)
-            self.source_curr_mode(scmode)
-            self.source_curr_range(scrange)
-            self.sense_volt_range(svrange)
-            self.form_element(fe)
+            with self.transaction():
+                self.set_values("*RST")
+                self.set_values("*CLS")
+                self.source_func(scfunc)
+                self.sense_func(ssfunc)
+                self.source_curr_mode(scmode)
+                self.source_curr_range(scrange)
+                self.sense_volt_range(svrange)
+                self.form_element(fe)
+            self.reversal = False
         except:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
     
     def NPLC(self, nplc=0.03):
         try:
-            self.set_values("NPLC " + str(nplc))
+            self.set_state("NPLC", nplc)
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent2400_SourceMeter: Invalid NPLC input: {str(e)}")
         
     def output(self, output=False):
@@ -278,11 +520,11 @@ class Agilent2400_SourceMeter(MeasurementDevice):
         """
         try:
             if output == True:
-                self.set_values("OUTP 1")
+                self.set_state("OUTP", 1)
             else:
-                self.set_values("OUTP 0")
+                self.set_state("OUTP", 0)
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent2400_SourceMeter: Invalid output input: {str(e)}")
         
         
@@ -298,9 +540,10 @@ class Agilent2400_SourceMeter(MeasurementDevice):
         - Exception: Invalid input of relay parameter or communication issue.
         """
         try:
-            self.set_values("TRIG:COUN " + str(counts))
+            self.set_state("TRIG:COUN", counts)
+            self.counts = counts
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent2400_SourceMeter: Invalid trigger count input: {str(e)}")
         
     def source_V(self, volt=0):
@@ -319,7 +562,7 @@ class Agilent2400_SourceMeter(MeasurementDevice):
             else:
                 print(f"Agilent2400_SourceMeter: Voltage input exceeds sourcing voltage range.")
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent2400_SourceMeter: Invalid voltage input(value must : {str(e)}")
     
     def source_I(self, curr=0):
@@ -338,38 +581,74 @@ class Agilent2400_SourceMeter(MeasurementDevice):
             else:
                 print(f"Agilent2400_SourceMeter: Current input exceeds sourcing current range.")
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent2400_SourceMeter: Invalid current input: {str(e)}")
     
     def curr_list(self, curr, pts):
-        curr_input = ''
-        curr_input += str(curr)
-        for i in range(pts-1):
-            curr_input += ','+str(curr)
-        return curr_input
+        return format_list(np.repeat(curr, pts), self.list_digits)
     
     def source_list_I(self, curr):
         """
         Set a list of output current values. 
         
         Parameters:
-        - curr(str/list): A list of values of current(A).
+        - curr(str/list/numpy.ndarray): A list of values of current(A).
+        
+        Returns:
+        - boolean: True if the list was uploaded, False if the instrument already held it.
         
         Raises:
         - Exception: Invalid input of current parameter or communication issue.
         """
         try:
             if type(curr) == str:
-                self.set_values("SOUR:LIST:CURR " + curr)
-                self.trigger_count(len(self.str_float(curr)))
-            else:
-                c = ','.join([str(i) for i in curr])
-                self.set_values("SOUR:LIST:CURR " + c)
-                self.trigger_count(len(curr))
+                curr = self.str_float(curr)
+            return self.load_list("CURR", curr)
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent2400_SourceMeter: Invalid current input, must be either a string of values or a list of values{str(e)}")
     
+    def load_list(self, function, values):
+        """
+        Upload a source list, unless the instrument already holds the same one.
+        The list is formatted to list_digits significant digits and sent in
+        segments of list_limit values, the first one replacing the list and
+        the others appended to it. A digest of the formatted list is kept in
+        the state cache, so it is forgotten on *RST and reconnect like any
+        other setting.
+        
+        Parameters:
+        - function (str): "CURR" or "VOLT".
+        - values (list/numpy.ndarray): The source values.
+        
+        Returns:
+        - boolean: True if the list was uploaded.
+        
+        Raises:
+        - Exception: Empty list, or communication issue.
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        if values.size == 0:
+            raise Exception("Agilent2400_SourceMeter: Empty source list")
+        header = "SOUR:LIST:" + function
+        segments = [format_list(values[first:first + self.list_limit], self.list_digits)
+                    for first in range(0, len(values), self.list_limit)]
+        digest = hashlib.sha1(",".join(segments).encode("ascii")).hexdigest()
+        uploaded = self.cached_state().get(header) != digest
+        try:
+            with self.transaction():
+                if uploaded:
+                    for i, segment in enumerate(segments):
+                        self.set_values((header if i == 0 else header + ":APP") + " " + segment)
+                self.trigger_count(len(values))
+        except Exception:
+            self.invalidate_state(header)
+            raise
+        if uploaded:
+            self.update_state([(header, digest)])
+        self.list_currents = [float(i) for i in values]
+        return uploaded
+    
     '''
     def source_list_I(self, *curr, pts):
         """
@@ -394,24 +673,283 @@ class Agilent2400_SourceMeter(MeasurementDevice):
             elif type(curr) == list:
                 self.set_values("SOUR:LIST:CURR " + str(curr*pts))[1:-1]
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent2400_SourceMeter: Invalid current input: {str(e)}")
     '''
     
     
-    def read_buffer(self):
+    def data_format(self, binary=False):
+        """
+        Select the format readings are transferred in.
+        
+        Parameter:
+        - binary (boolean): Little-endian single precision binary blocks if on,
+                            ASCII otherwise. (Default to be off)
+        
+        Raises
+        - Exception: Communication issue.
+        """
+        try:
+            with self.transaction(check_errors=False):
+                if binary == True:
+                    self.set_state("FORM:DATA", "SREAL")
+                    self.set_state("FORM:BORD", "SWAP")
+                else:
+                    self.set_state("FORM:DATA", "ASC")
+        except Exception as e:
+            self.report_errors()
+            raise Exception(f"Agilent2400_SourceMeter: Invalid data format input: {str(e)}")
+    
+    def read_buffer(self, binary=None):
+        """
+        Trigger the source list and read the readings. 
+        
+        Parameter:
+        - binary (boolean): Transfer the readings as a binary block. (Default to be on
+                            when the trigger count times the elements per reading
+                            reaches binary_threshold)
+        
+        Raises:
+        - Exception: If any issues with communication or data retrieval occur.
+        """
+        return self.collect_buffer(self.trigger_buffer(binary))
+    
+    def trigger_buffer(self, binary=None):
+        """
+        Trigger the source list without waiting for the readings, so that
+        other instruments can be read while it runs. Read the readings with
+        collect_buffer() before the next command to the sourcemeter.
+        
+        Parameter:
+        - binary (boolean): Transfer the readings as a binary block. (Default as in read_buffer())
+        
+        Returns:
+        - PendingQuery: The handle to pass to collect_buffer().
+        
+        Raises:
+        - Exception: If any issues with communication occur.
+        """
+        try:
+            if self.reversal:
+                self.data_format(False)
+                self.set_state("TRAC:POIN", self.counts)
+                return self.send_query(self.reversal_query())
+            if binary is None:
+                binary = self.counts*self.elements >= self.binary_threshold
+            self.data_format(binary)
+            return self.send_query("READ?", "<f4" if binary == True else None)
+        except Exception as e:
+            self.report_errors()
+            raise Exception(f"Agilent2400_SourceMeter: Failed to trigger buffer: {str(e)}")
+    
+    def collect_buffer(self, handle):
         """
-        Read the output current. 
+        Read the readings of a source list started by trigger_buffer().
+        
+        Returns:
+        - numpy.ndarray or list: The readings, an array when they were transferred in binary,
+                                 or a list of the one differential voltage with reversal_average() on.
         
         Raises:
         - Exception: If any issues with communication or data retrieval occur.
         """
         try:
-            return self.str_float(self.get_values("READ?"))
+            values = self.collect(handle)
+            if handle.dtype is not None:
+                return values.astype(np.float64)
+            if self.reversal:
+                return self.reversal_volt(values)
+            return self.str_float(values)
         except Exception as e:
-            print(self.get_values("SYST:ERR?"))
+            self.report_errors()
             raise Exception(f"Agilent2400_SourceMeter: Failed to read buffer: {str(e)}")
-            
+
+    def reversal_average(self, on=True):
+        """
+        Average the source list on the instrument. CALC1 divides every voltage
+        reading by its source current, the trace buffer keeps the quotients of
+        one source list and CALC3 returns their mean, so read_buffer() gets one
+        short reply instead of every reading. The mean quotient times the mean
+        current amplitude, signed as the first current, is the differential
+        voltage (sum(pos) - sum(neg))/n of a square wave, with the thermal
+        offset cancelled; of a constant list it is the plain average. This
+        only holds for lists of one current amplitude, with as many +I as -I
+        readings or a single polarity; other lists are refused.
+        
+        Parameter:
+        - on (boolean): Reversal averaging on/off. (Default to be on)
+        
+        Raises:
+        - Exception: A source list of other currents, or communication issue.
+        """
+        try:
+            if on == True:
+                self.reversal_amplitude()
+                with self.transaction():
+                    self.set_state("CALC1:MATH:EXPR:NAME", '"REVERSAL"')
+                    self.set_state("CALC1:MATH:EXPR", "(VOLT/CURR)")
+                    self.set_state("CALC1:MATH:NAME", '"REVERSAL"')
+                    self.set_state("CALC1:STAT", "ON")
+                    self.set_state("CALC3:FORM", "MEAN")
+                    self.set_state("TRAC:FEED", "CALC1")
+            else:
+                with self.transaction():
+                    self.set_values("TRAC:FEED:CONT NEV")
+                    self.set_state("TRAC:FEED", "SENS")
+                    self.set_state("CALC1:STAT", "OFF")
+            self.reversal = on == True
+        except Exception as e:
+            self.report_errors()
+            raise Exception(f"Agilent2400_SourceMeter: Invalid reversal averaging input: {str(e)}")
+    
+    def reversal_query(self):
+        """
+        Return the program message that runs the source list into the cleared
+        trace buffer and queries the mean of its quotients.
+        """
+        return join_commands(["TRAC:CLE", "TRAC:FEED:CONT NEXT", "INIT", "*WAI", "CALC3:DATA?"],
+                             self.max_line_length)[0]
+    
+    def reversal_amplitude(self):
+        """
+        Return the signed amplitude of the loaded source list, the first
+        current, which scales the mean quotient of reversal averaging.
+
+        Raises:
+        - Exception: No list is loaded, or its currents differ in amplitude, are
+                     zero, or are not as many positive as negative.
+        """
+        currents = np.asarray(getattr(self, "list_currents", None) or [], dtype=float)
+        if currents.size == 0:
+            raise Exception("the source list must be loaded")
+        amplitude = abs(currents[0])
+        # The list is uploaded with list_digits significant digits
+        if amplitude == 0 or np.any(np.abs(np.abs(currents) - amplitude) > amplitude*10.0**(1 - self.list_digits)):
+            raise Exception("the source list currents must be +I and -I of one nonzero amplitude")
+        positive = int(np.count_nonzero(currents > 0))
+        if positive not in (0, currents.size) and 2*positive != currents.size:
+            raise Exception(f"the source list has {positive} positive of {currents.size} currents, "
+                            "reversal needs as many of each polarity")
+        return float(currents[0])
+
+    def reversal_volt(self, raw):
+        """
+        Convert the reply to reversal_query() into a list of the one differential voltage(V).
+
+        Raises:
+        - Exception: The loaded source list is not valid for reversal averaging.
+        """
+        return [self.str_float(raw)[0]*self.reversal_amplitude()]
+
+    def arm_buffer(self, points):
+        """
+        Arm the trigger model for a block of field points: each bus trigger
+        (trigger_point()) runs the source list once and stores its readings
+        in the trace buffer, which read_trace() reads at the end of the block.
+        The source list is run once first, at the present field, to time it;
+        wait_point() holds each point for that time.
+
+        Parameter:
+        - points (int): Field points of the block, at most trace_limit // counts.
+
+        Raises:
+        - Exception: Too many points for the trace buffer, or communication issue.
+        """
+        if self.reversal:
+            raise Exception(f"Agilent2400_SourceMeter: The trace buffer is in use by reversal_average()")
+        if points*self.counts > self.trace_limit:
+            raise Exception(f"Agilent2400_SourceMeter: {points} points of {self.counts} readings exceed the trace buffer")
+        try:
+            # Time one source list takes on the instrument, with its source delays and
+            # auto-zero, the field is held that long after each trigger
+            self.set_state("ARM:SOUR", "IMM")
+            self.set_state("ARM:COUN", 1)
+            start = time.perf_counter()
+            self.get_values("INIT;*OPC?")
+            self.list_time = time.perf_counter() - start
+            self.data_format(True)
+            with self.transaction():
+                self.set_values("TRAC:CLE")
+                self.set_state("TRAC:POIN", points*self.counts)
+                self.set_state("TRAC:FEED", "SENS")
+                self.set_values("TRAC:FEED:CONT NEXT")
+                self.set_state("ARM:SOUR", "BUS")
+                self.set_state("ARM:COUN", points)
+                self.set_values("INIT")
+            self.triggered = 0
+            self.triggered_at = None
+        except Exception as e:
+            self.report_errors()
+            raise Exception(f"Agilent2400_SourceMeter: Failed to arm buffer: {str(e)}")
+
+    def trigger_point(self):
+        """
+        Send the bus trigger of the next point of an armed block.
+
+        Raises:
+        - Exception: Communication issue.
+        """
+        try:
+            self.set_values("*TRG")
+            self.triggered_at = time.perf_counter()
+            self.triggered += 1
+        except Exception as e:
+            self.report_errors()
+            raise Exception(f"Agilent2400_SourceMeter: Failed to trigger point: {str(e)}")
+
+    def wait_point(self):
+        """
+        Hold the field until the readings of the last trigger are taken, by
+        time alone: the instrument is not queried during the block, the count
+        of stored readings is checked once by read_trace().
+        """
+        if self.triggered_at is None:
+            return
+        remaining = self.triggered_at + self.list_time - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def read_trace(self):
+        """
+        Read the trace buffer of a block in binary, once, and split it into
+        the readings of each field point.
+
+        Returns:
+        - numpy.ndarray: One row of counts*elements readings per trigger, in order.
+
+        Raises:
+        - Exception: A trigger was not stored, or communication issue.
+        """
+        try:
+            stored = int(self.get_values("TRAC:POIN:ACT?"))
+            if stored != self.triggered*self.counts:
+                raise Exception(f"{stored} readings stored for {self.triggered} triggers of {self.counts}")
+            values = self.get_block("TRAC:DATA?", "<f4").astype(np.float64)
+            if values.size != self.triggered*self.counts*self.elements:
+                raise Exception(f"{values.size} values stored for {self.triggered} triggers")
+            return values.reshape(self.triggered, self.counts*self.elements)
+        except Exception as e:
+            self.report_errors()
+            raise Exception(f"Agilent2400_SourceMeter: Failed to read trace: {str(e)}")
+
+    def disarm_buffer(self):
+        """
+        Return the trigger model to immediate arming, with the trace buffer off.
+
+        Raises:
+        - Exception: Communication issue.
+        """
+        try:
+            with self.transaction():
+                self.set_values("ABOR")
+                self.set_values("TRAC:FEED:CONT NEV")
+                self.set_state("ARM:SOUR", "IMM")
+                self.set_state("ARM:COUN", 1)
+            self.triggered_at = None
+        except Exception as e:
+            self.report_errors()
+            raise Exception(f"Agilent2400_SourceMeter: Failed to disarm buffer: {str(e)}")
+
             
 if __name__ == "__main__":
     try:
@@ -1,3 +1,6 @@
+import os
+import sys
+import asyncio
 import pyvisa
 import time
 import timeit
@@ -8,6 +11,10 @@ import zhinst.core
 import pickle
 import csv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from device import sessions, MeasurementDevice
+from async_instruments import AsyncMeasurementDevice
+
 X_magnet_GPA = 132.3129
 Y_magnet_GPA = 129.76684
 X_HHC_GPA = 31.72649
@@ -18,16 +25,21 @@ shunt10k = 9887.211007
 shunt100k = 98352.2549
 shunt2M = 2022572
 
-rm = pyvisa.ResourceManager()
-print(rm.list_resources())
+# Initialize instrument object using the shared pyvisa session registry
+#addr5 = sessions.acquire('GPIB0::5::INSTR')
+#addr9 = sessions.acquire('GPIB0::9::INSTR')
+addr10 = sessions.acquire('GPIB0::10::INSTR')
+addr19 = sessions.acquire('GPIB0::19::INSTR')
+addr20 = sessions.acquire('GPIB0::20::INSTR')
+addr26 = sessions.acquire('GPIB0::26::INSTR')
+
+# Async handles on the same sessions, to read the DMM and the nanovoltmeter together.
+# The nanovoltmeter has no IEEE-488.2 status byte, its read simply blocks, nor a SCPI error queue.
+dmm = AsyncMeasurementDevice(MeasurementDevice('GPIB0::10::INSTR'))
+nvm = AsyncMeasurementDevice(MeasurementDevice('GPIB0::26::INSTR', error_check_interval=0), poll_status=False)
 
-# Initialize instrument object using pyvisa
-#addr5 = rm.open_resource('GPIB0::5::INSTR')
-#addr9 = rm.open_resource('GPIB0::9::INSTR')
-addr10 = rm.open_resource('GPIB0::10::INSTR')
-addr19 = rm.open_resource('GPIB0::19::INSTR')
-addr20 = rm.open_resource('GPIB0::20::INSTR')
-addr26 = rm.open_resource('GPIB0::26::INSTR')
+async def read_shunt_and_dc():
+    return await asyncio.gather(dmm.get_values("MEAS:VOLT:AC?"), nvm.get_values('F0'))
 
 addr19.write('*CLS')
 addr19.write('*RST')
@@ -156,7 +168,8 @@ def sensitivity_measure(volt, freq, switch_position, MTJ_curr=0.003):
 
     # ==================================== Sensitivity calculation =====================================
 
-    shuntVolt = float(addr10.query("MEAS:VOLT:AC?"))
+    shunt_reading, dc_reading = asyncio.run(read_shunt_and_dc())
+    shuntVolt = float(shunt_reading)
     shunt = {
              'Pos 1': shunt5,
              'Pos 2': shunt1k,
@@ -167,7 +180,7 @@ def sensitivity_measure(volt, freq, switch_position, MTJ_curr=0.003):
     HHC_Ipp = shuntVolt/shunt[switch_position]*np.sqrt(2)*2
     GPA = X_HHC_GPA
     HHC_Hpp = HHC_Ipp * GPA
-    dc_component = float(addr26.query('F0')[4:])
+    dc_component = float(dc_reading[4:])
     print('Shunt voltage: ', shuntVolt)
     print('H field calculated: ', HHC_Hpp)
     print('DC component: ', dc_component)
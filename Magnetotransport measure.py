@@ -6,16 +6,19 @@ import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 import Instr_lib as instrlib
+from device import sessions
+from instrumentation import LatencyRecorder, InstrumentedResource
+from GPIB_instruments import wait_settled
+from sweep_planner import plan_sweep
 
 my_path = os.path.dirname(os.path.abspath(__file__))
 
-rm = pyvisa.ResourceManager()
-print(rm.list_resources())
-
-# Initialize instrument object using pyvisa
-addr5 = rm.open_resource('GPIB0::5::INSTR')
-addr9 = rm.open_resource('GPIB0::9::INSTR')
-addr20 = rm.open_resource('GPIB0::20::INSTR')
+# Initialize instrument object using the shared pyvisa session registry
+# Every call is timed per command; the summary is printed after each run
+latency = LatencyRecorder()
+addr5 = InstrumentedResource(sessions.acquire('GPIB0::5::INSTR'), latency, 'PS X (5)')
+addr9 = InstrumentedResource(sessions.acquire('GPIB0::9::INSTR'), latency, 'PS Y (9)')
+addr20 = InstrumentedResource(sessions.acquire('GPIB0::20::INSTR'), latency, 'SM (20)')
 
 # Agilent 6613C is the power supply for the electromagnet, which sweeps from 0A to 1A, 0A to -1A 
 # back and forth of each. (in increments of 0.3mA at default)
@@ -23,13 +26,8 @@ addr20 = rm.open_resource('GPIB0::20::INSTR')
 # level of 
 
 # Agilent 6613C initalization
-addr5.write("*RST")
-addr5.write("*CLS")
-addr5.write("SENSe:SWEep:POINts 256")              # Reading speed control
-
-addr9.write("*RST")
-addr9.write("*CLS")
-addr9.write("SENSe:SWEep:POINts 256")              # Reading speed control
+addr5.write("*RST;*CLS;:SENSe:SWEep:POINts 256")   # Reading speed control
+addr9.write("*RST;*CLS;:SENSe:SWEep:POINts 256")   # Reading speed control
 
 # Agilent 2400 autozero
 zero2400 = False
@@ -82,6 +80,13 @@ diagram_top = 5400
 diagram_left = -133
 diagram_right = 133
 
+# Wait for the magnet current to settle after a relay or compliance change,
+# instead of a fixed 0.3 s. The time waited is recorded as SETTLE:<reason>.
+def settle(X_field, setpoint, reason):
+    elapsed, settled = wait_settled(lambda: float(X_field.query("MEAS:CURR?")), setpoint,
+                                    1e-4 + 1e-3*setpoint, timeout=0.3)
+    latency.record('PS X (5)', 'SETTLE:' + reason, elapsed)
+
 def measure_transfer_curve(X_field, Y_field, min_curr, max_curr, step, loop, curr_sample, compliance, bias_y, bias_ON, live_display):
     curr_sample_arr = np.repeat([curr_sample, -curr_sample],(pts_per_hfcycle))
     X_field.write("VOLT " + str(compliance))
@@ -89,11 +94,9 @@ def measure_transfer_curve(X_field, Y_field, min_curr, max_curr, step, loop, cur
     
     # Biasing field in y-axis
     if bias_y < 0:
-        Y_field.write("OUTP:REL ON")
-        Y_field.write("OUTP:REL:POL REV")
+        Y_field.write("OUTP:REL ON;:OUTP:REL:POL REV")
     else:
-        Y_field.write("OUTP:REL ON")
-        Y_field.write("OUTP:REL:POL NORM") 
+        Y_field.write("OUTP:REL ON;:OUTP:REL:POL NORM")
     if bias_ON == True:
         Y_field.write("VOLT 51")
         Y_field.write("CURR " + str(abs(bias_y)))
@@ -117,6 +120,10 @@ def measure_transfer_curve(X_field, Y_field, min_curr, max_curr, step, loop, cur
     for i in range(loop):
         seq = np.concatenate((seq, seq_1))
     seq = np.concatenate((seq, seq_asc))
+    
+    # Relay polarity and compliance band of every point, keeping the order
+    plan = plan_sweep(seq, bands=((0.001, 0.05), (0.015, 1), (1.1, 51)))
+    print(plan.summary())
 
     # Input a signal array of current    seq, seq,
     addr20.write("SOUR:LIST:CURR " + curr_input)
@@ -130,6 +137,7 @@ def measure_transfer_curve(X_field, Y_field, min_curr, max_curr, step, loop, cur
     resist_arr = []
     time_arr = []
     relay = 1
+    setpoint = 0
 
     # Plotting
     fig = plt.figure(figsize=(12,9), dpi=100)
@@ -146,39 +154,26 @@ def measure_transfer_curve(X_field, Y_field, min_curr, max_curr, step, loop, cur
     start = timeit.default_timer()
 
     # Execution loop
-    for i in seq:
+    for i, reverse, volt in plan.steps():
         # Agilent 6613C Relay function
-        if (i < 0) and (relay == 1):
-            X_field.write("OUTP:REL ON")
-            X_field.write("OUTP:REL:POL REV")
+        if reverse and (relay == 1):
+            X_field.write("OUTP:REL ON;:OUTP:REL:POL REV")
             relay = -1
-            print('relay')
-            time.sleep(.3)
-        elif (i > 0) and (relay == -1):
-            X_field.write("OUTP:REL ON")
-            X_field.write("OUTP:REL:POL NORM")
+            settle(X_field, setpoint, 'RELAY')
+        elif (not reverse) and (relay == -1):
+            X_field.write("OUTP:REL ON;:OUTP:REL:POL NORM")
             relay = 1
-            time.sleep(.3)
+            settle(X_field, setpoint, 'RELAY')
         cycle_count += 1
         
-        if (abs(i) > 0.015) and (compliance != 51):
-            X_field.write("VOLT 51")
-            compliance = 51
-            time.sleep(.3)
-            #time.sleep(.1)
-        elif (abs(i) > 0.001) and (abs(i) < 0.015) and (compliance != 1):
-            X_field.write("VOLT 1")
-            compliance = 1
-            time.sleep(.3)
-            #time.sleep(.1)
-        elif (abs(i) < 0.001) and (compliance != 0.05):
-            X_field.write("VOLT 0.05")
-            compliance = 0.05
-            time.sleep(.3)
-            #time.sleep(.1)
+        if volt != compliance:
+            X_field.write("VOLT " + str(volt))
+            compliance = volt
+            settle(X_field, setpoint, 'COMPLIANCE')
         
         # Agilent 6613C output and measure the current to the electromagnet
         curr = relay*(float(X_field.query("CURR " + str(abs(i)) + ";MEAS:CURR?")))
+        setpoint = abs(i)
         curr_arr.append(curr)
         X_gauss = curr*X_magnet_GPA
         X_gauss_arr.append(X_gauss)
@@ -231,6 +226,7 @@ def measure_transfer_curve(X_field, Y_field, min_curr, max_curr, step, loop, cur
     print('Time: ', stop - start, 's')
     print("Data points: ", len(seq))
     print('Time per measurement: ', str((stop - start)/(len(seq))*1000), 'ms')
+    print(latency.summary(points=len(seq)))
 
 
     
@@ -239,6 +235,8 @@ def measure_transfer_curve(X_field, Y_field, min_curr, max_curr, step, loop, cur
     data = np.vstack((time_arr, seq, X_gauss_arr, resist_arr)).T
     df = pd.DataFrame(data)
     df.to_csv(my_path + '/Data/Transfer curve Raw data max_G ' + str(stop_gauss) + ', Biasing_y ' + str(bias_y) + '.csv', index=False, header=False)
+    latency.to_json(my_path + '/Data/Transfer curve latency max_G ' + str(stop_gauss) + ', Biasing_y ' + str(bias_y) + '.json')
+    latency.reset()
 
     # Final plot
     ax1.scatter(X_gauss_arr, resist_arr, s=1)
@@ -274,6 +272,10 @@ print(error5)
 error20 = addr20.query("STAT:QUE?")
 print(error20)
 
+# Sessions stay open in the registry for the next run
+for address in ('GPIB0::5::INSTR', 'GPIB0::9::INSTR', 'GPIB0::20::INSTR'):
+    sessions.release(address)
+
 
 # Show runtime plot
 '''
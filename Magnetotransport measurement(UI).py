@@ -1,5 +1,6 @@
 import os
 import sys
+import asyncio
 import pyvisa
 import time
 import timeit
@@ -10,12 +11,18 @@ import pandas as pd
 import device
 from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QGridLayout
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from GPIB_instruments import Agilent6613C_PowerSupply, Agilent2400_SourceMeter
+from GPIB_instruments import Agilent6613C_PowerSupply, Agilent2400_SourceMeter, move_vector
+from async_instruments import AsyncAgilent6613C_PowerSupply, AsyncAgilent2400_SourceMeter
+from sweep_planner import plan_sweep, band_of, loop_branches, grid_order, AdaptiveStepper, COMPLIANCE_BANDS
+import sweep_compiler
+from sweep_compiler import compile_sweep, compliance_first, execute_sweep, execute_sweep_buffered
+from readback_policy import infer
+from nplc_calibration import calibrate, pareto_front, choose, save_setting, load_setting, differential_volt
 
 class TransferCurve():
     
     # Initialize instruments and parameters
-    def __init__(self, NPLC=0.03):
+    def __init__(self, NPLC=0.03, sample=None):
         # Default variables
         self.X_magnet_GPA = 132.3129
         self.Y_magnet_GPA = 129.76684
@@ -34,6 +41,13 @@ class TransferCurve():
         self.y_address="GPIB0::9::INSTR"
         self.sm_address="GPIB0::20::INSTR"
         self.NPLC=NPLC
+        
+        # NPLC and cycle length calibrated for the sample, see calibrate_NPLC()
+        self.sample = sample
+        setting = load_setting(sample)
+        if setting is not None:
+            self.NPLC = setting["nplc"]
+            self.default_cycle_length = setting["cycle_length"]
         self.PowerSupply_X = Agilent6613C_PowerSupply(self.x_address)
         self.PowerSupply_Y = Agilent6613C_PowerSupply(self.y_address)
         self.SourceMeter = Agilent2400_SourceMeter(self.sm_address)
@@ -42,7 +56,12 @@ class TransferCurve():
         self.PowerSupply_X.initialize()
         self.PowerSupply_Y.initialize()
         self.SourceMeter.initialize()
-        self.SourceMeter.NPLC()
+        self.SourceMeter.NPLC(self.NPLC)
+        
+        # Async counterparts to overlap the readbacks of a point
+        self.PowerSupply_X_async = AsyncAgilent6613C_PowerSupply(self.PowerSupply_X)
+        self.SourceMeter_async = AsyncAgilent2400_SourceMeter(self.SourceMeter)
+        self.event_loop = asyncio.new_event_loop()
         
         self.my_path = os.path.dirname(os.path.abspath(__file__))
         #self.plotter = PlotCanvas()
@@ -52,12 +71,12 @@ class TransferCurve():
         if GPA == 'X':
             return a*self.X_magnet_GPA
         elif GPA == 'Y':
-            return a*self.X_magnet_GPA
+            return a*self.Y_magnet_GPA
             
     # Gauss/Ampere conversion
     def g_to_a(self, g, GPA='Y'):
         if GPA == 'X':
-            return g/self.Y_magnet_GPA
+            return g/self.X_magnet_GPA
         elif GPA == 'Y':
             return g/self.Y_magnet_GPA
     
@@ -158,33 +177,40 @@ class TransferCurve():
         return MTJ_curr_arr
     
     # Measure the votlage across the sample under one single magnetic field
-    def measure_single_point(self, EM_curr):
-        # Check compliance
-        self.PowerSupply_X.compliance_level()
-        
-        # PS source and measure
-        self.PowerSupply_X.source_I(EM_curr)
-        curr_PS_read = self.PowerSupply_X.read_I()
+    def measure_single_point(self, EM_curr, compliance=None, rel=None):
+        return self.event_loop.run_until_complete(self.measure_single_point_async(EM_curr, compliance, rel))
+    
+    async def measure_single_point_async(self, EM_curr, compliance=None, rel=None):
+        # PS source, with the compliance (planned, or from the previous setpoint) lowered only
+        # after the current went down, in the order compile_sweep uses
+        if compliance == None or compliance_first(compliance, self.PowerSupply_X.cached_state()):
+            await self.PowerSupply_X_async.compliance_level(compliance)
+            await self.PowerSupply_X_async.source_I(EM_curr, rel)
+        else:
+            await self.PowerSupply_X_async.source_I(EM_curr, rel)
+            await self.PowerSupply_X_async.compliance_level(compliance)
         
-        # SM source and measure
-        volt_arr_SM_read = self.SourceMeter.read_buffer()
+        # PS measure and SM source and measure, converting at the same time
+        curr_PS_read, volt_arr_SM_read = await asyncio.gather(self.PowerSupply_X_async.read_I(),
+                                                              self.SourceMeter_async.read_buffer())
         
-        # Calculate volt average
-        if self.default_square_wave == True:
-            volt_SM_read = (sum(volt_arr_SM_read[0::2]) - sum(volt_arr_SM_read[1::2])) / len(volt_arr_SM_read)
-        else:
-            volt_SM_read = sum(volt_arr_SM_read)/len(volt_arr_SM_read)
-        return curr_PS_read, volt_SM_read
+        return curr_PS_read, self.average_volt(volt_arr_SM_read)
+    
+    # Calculate volt average
+    def average_volt(self, volt_arr_SM_read):
+        # (sum(pos) - sum(neg))/n, or the one voltage averaged on the sourcemeter (reversal_average)
+        return differential_volt(volt_arr_SM_read, self.SourceMeter.list_currents)
             
-    def render_data(self, t, i, v, r):
-        data = np.vstack((t, i, v, r)).T
+    def render_data(self, t, i, v, r, measured=None):
+        # An optional fifth column flags the field currents that were measured (1) or inferred (0)
+        data = np.vstack((t, i, v, r) if measured is None else (t, i, v, r, measured)).T
         df = pd.DataFrame(data)
         df.to_csv(self.my_path + '/Data/Transfer curve Raw data max_G ' + str(self.stop_gauss) + ', Biasing_y ' + str(self.bias_gauss) + '.csv', index=False, header=False)
 
     
     def measure_transfer_curve_amp(self, start_curr=None, stop_curr=None, step_curr=None, loop=None,
                                MTJ_operating_curr=None, cycle_length=None, square_wave=None,
-                               bias_gauss=None, bias_ON=False):
+                               bias_gauss=None, bias_ON=False, readback=None, buffered=False, reversal=False):
         # Volt Compliance
         self.PowerSupply_X.source_I(0.1)
         
@@ -198,12 +224,21 @@ class TransferCurve():
         if self.start_curr == None:
             self.PS_params_gauss(start_curr, stop_curr, step_curr, loop)
         
-        # SM set input value
+        # SM set input value, averaged on the sourcemeter with reversal on
         self.SourceMeter.source_list_I(curr_input)
+        self.SourceMeter.reversal_average(reversal)
         # Preloop variables
         
         seq = self.PS_curr_seq()
+        
+        # Group the points by relay polarity and compliance band, keeping their order
+        plan = plan_sweep(seq)
+        print(plan.summary())
+        # Precompute the supply messages of every point
+        programs = compile_sweep(plan, self.PowerSupply_X.cached_state(), policy=readback)
+        print(sweep_compiler.summary(programs))
         curr_arr = []
+        measured_arr = []
         volt_arr = []
         resist_arr = []
         time_arr = []
@@ -212,36 +247,196 @@ class TransferCurve():
         # Start timing
         start = timeit.default_timer()
         
+        # Collect time stamps as each point is sourced, buffered readings arrive per block
+        def stamp(index):
+            time_arr.append(timeit.default_timer()-start)
+        
         # Execute loop 
         self.output_on()
-        for i in seq:
-            curr_out, volt_out = self.measure_single_point(i)
+        execute = execute_sweep_buffered if buffered else execute_sweep
+        for curr_out, measured, volt_arr_SM_read in execute(programs, self.PowerSupply_X, self.SourceMeter, before=stamp):
+            volt_out = self.average_volt(volt_arr_SM_read)
             
             # Concatenate data
             curr_arr.append(curr_out)
+            measured_arr.append(measured)
             volt_arr.append(volt_out)
             
-            # Collect time stamps
-            time_stamp = timeit.default_timer()
-            time_arr.append(time_stamp-start)
-            
             # Calculate resistance results
             resist = volt_out/self.MTJ_curr
             resist_arr.append(resist)
             # Plot real-time 
             
+        # Errors of the whole sweep, read once
+        self.PowerSupply_X.check_errors()
+        self.SourceMeter.check_errors()
+        
+        # Currents that were not read back, between the measured ones
+        curr_arr = list(infer(plan.points, curr_arr, measured_arr))
+        
         # Render data 
-        self.render_data(curr_arr, volt_arr, resist_arr, time_arr)
+        self.render_data(curr_arr, volt_arr, resist_arr, time_arr, measured_arr)
         # Final plot
         
         self.output_on(False, False, False)
         return time_arr, curr_arr, volt_arr, resist_arr
-    
-    
+
+
+    def measure_transfer_curve_adaptive(self, stop_curr=None, min_step=None, max_step=None, resist_step=1, loop=None,
+                               MTJ_operating_curr=None, cycle_length=None, square_wave=None,
+                               bias_gauss=None, bias_ON=False, reversal=False):
+        # Default parameters
+        if stop_curr == None: stop_curr = self.g_to_a(self.default_gauss_stop)
+        if min_step == None: min_step = self.default_curr_step
+        if max_step == None: max_step = 20*min_step
+        if loop == None: loop = self.default_loop
+        self.stop_gauss = self.a_to_g(stop_curr)
+
+        # Bias Y field
+        self.bias_y(bias_ON, bias_gauss)
+
+        # SM set input value, averaged on the sourcemeter with reversal on
+        self.SourceMeter.source_list_I(self.SM_MTJ_curr(MTJ_operating_curr, cycle_length, square_wave))
+        self.SourceMeter.reversal_average(reversal)
+
+        curr_arr = []
+        volt_arr = []
+        resist_arr = []
+        time_arr = []
+
+        # Switching fields found per sweep direction, refined on the next branch of that direction
+        edges = {1: [], -1: []}
+        # Zero current keeps the relay polarity of the previous point, as in plan_sweep
+        rel = None
+
+        # Start timing
+        start = timeit.default_timer()
+
+        # Execute loop, the next field is chosen from the resistance just measured
+        self.output_on()
+        for branch_start, branch_stop in loop_branches(stop_curr, loop):
+            stepper = AdaptiveStepper(branch_start, branch_stop, min_step, max_step, resist_step,
+                                      edges=edges[1 if branch_stop >= branch_start else -1])
+            for i in stepper:
+                if i != 0: rel = i < 0
+                curr_out, volt_out = self.measure_single_point(i, COMPLIANCE_BANDS[band_of(i)][1], rel)
+                resist = volt_out/self.MTJ_curr
+                stepper.record(i, resist)
+
+                curr_arr.append(curr_out)
+                volt_arr.append(volt_out)
+                resist_arr.append(resist)
+                time_arr.append(timeit.default_timer()-start)
+            if stepper.detected:
+                edges[stepper.direction] = stepper.detected
+        print(f"{len(curr_arr)} points")
+
+        # Errors of the whole sweep, read once
+        self.PowerSupply_X.check_errors()
+        self.SourceMeter.check_errors()
+
+        # Render data
+        self.render_data(curr_arr, volt_arr, resist_arr, time_arr)
+
+        self.output_on(False, False, False)
+        return time_arr, curr_arr, volt_arr, resist_arr
+
+
     def measure_transfer_curve_gauss(self, start_gauss=None, stop_gauss=None, step_gauss=None, loop=None,
                                MTJ_operating_curr=None, cycle_length=None, square_wave=None,
                                bias_gauss=None, bias_ON=False):
         self.measure_transfer_curve_amp(self.g_to_a(start_gauss), self.g_to_a(stop_gauss), self.g_to_a(step_gauss), loop, MTJ_operating_curr, cycle_length, square_wave, bias_gauss, bias_ON)
+
+
+    # Fastest NPLC and cycle length meeting the resistance resolution(Ohm) at a fixed field, stored for the sample
+    def calibrate_NPLC(self, resolution, sample=None, field_curr=0, MTJ_operating_curr=None, square_wave=True, repeats=20):
+        if sample == None: sample = self.sample
+        if MTJ_operating_curr == None: MTJ_operating_curr = self.default_MTJ_operating_curr
+        
+        self.output_on()
+        move_vector([(self.PowerSupply_X, field_curr, None, COMPLIANCE_BANDS[band_of(field_curr)][1])])
+        points = calibrate(self.SourceMeter, MTJ_operating_curr, repeats=repeats, square_wave=square_wave)
+        self.output_on(False, False, False)
+        
+        front = pareto_front(points)
+        for point in front:
+            print(point)
+        best = choose(points, resolution)
+        print('Chosen: ' + str(best))
+        if sample != None:
+            save_setting(sample, best, resolution)
+        
+        # Later measurements of this run use it as well
+        self.NPLC = best.nplc
+        self.SourceMeter.NPLC(best.nplc)
+        self.default_cycle_length = best.cycle_length
+        return best, front
+
+    # Move both magnets to a field vector, settling them at the same time
+    def set_field_amp(self, x_curr, y_curr):
+        return move_vector([(self.PowerSupply_X, x_curr, None, COMPLIANCE_BANDS[band_of(x_curr)][1]),
+                            (self.PowerSupply_Y, y_curr, None, COMPLIANCE_BANDS[band_of(y_curr)][1])])
+
+    def set_field_gauss(self, x_gauss, y_gauss):
+        return self.set_field_amp(self.g_to_a(x_gauss, 'X'), self.g_to_a(y_gauss, 'Y'))
+
+    def render_map(self, x_curr, y_curr, resist_map, rows):
+        name = 'Field map max_X ' + str(self.a_to_g(max(abs(x_curr)))) + ', max_Y ' + str(self.a_to_g(max(abs(y_curr)), 'Y'))
+        pd.DataFrame(resist_map, index=y_curr, columns=x_curr).to_csv(self.my_path + '/Data/' + name + '.csv')
+        pd.DataFrame(rows, columns=['t', 'x_set', 'y_set', 'x_read', 'x_measured', 'volt', 'resist']).to_csv(
+            self.my_path + '/Data/' + name + ' Raw data.csv', index=False)
+
+    # Resistance over a grid of X and Y fields in one run
+    def measure_field_map_amp(self, x_start, x_stop, x_step, y_start, y_stop, y_step, order="hilbert",
+                              MTJ_operating_curr=None, cycle_length=None, square_wave=None, readback=None):
+        x_curr = np.arange(x_start, x_stop + x_step/2, x_step)
+        y_curr = np.arange(y_start, y_stop + y_step/2, y_step)
+
+        # SM set input value
+        self.SourceMeter.source_list_I(self.SM_MTJ_curr(MTJ_operating_curr, cycle_length, square_wave))
+
+        # Visiting order with small field steps, then relay and compliance plans per supply
+        cells = grid_order(len(x_curr), len(y_curr), order)
+        plan_x = plan_sweep([x_curr[ix] for ix, iy in cells])
+        plan_y = plan_sweep([y_curr[iy] for ix, iy in cells])
+        print('X: ' + plan_x.summary())
+        print('Y: ' + plan_y.summary())
+        programs = compile_sweep(plan_x, self.PowerSupply_X.cached_state(), policy=readback)
+        y_steps = list(plan_y.steps())
+
+        # Results stream into the grid, unmeasured cells stay NaN
+        resist_map = np.full((len(y_curr), len(x_curr)), np.nan)
+        rows = []
+
+        # Y is set before X and both settle together
+        def move_y(index):
+            if index == 0 or y_steps[index] != y_steps[index - 1]:
+                curr, rel, compliance = y_steps[index]
+                return [(self.PowerSupply_Y, self.PowerSupply_Y.compliance_level(compliance, wait=False)),
+                        (self.PowerSupply_Y, self.PowerSupply_Y.source_I(curr, rel, wait=False))]
+
+        start = timeit.default_timer()
+        self.output_on(True, True, True)
+        points = execute_sweep(programs, self.PowerSupply_X, self.SourceMeter, before=move_y)
+        for (ix, iy), (curr_out, measured, volt_arr_SM_read) in zip(cells, points):
+            volt_out = self.average_volt(volt_arr_SM_read)
+            resist_map[iy, ix] = volt_out/self.MTJ_curr
+            rows.append((timeit.default_timer()-start, x_curr[ix], y_curr[iy], curr_out, measured, volt_out, resist_map[iy, ix]))
+
+        # Errors of the whole map, read once
+        self.PowerSupply_X.check_errors()
+        self.PowerSupply_Y.check_errors()
+        self.SourceMeter.check_errors()
+
+        self.render_map(x_curr, y_curr, resist_map, rows)
+        self.output_on(False, False, False)
+        return x_curr, y_curr, resist_map
+
+    def measure_field_map_gauss(self, x_start, x_stop, x_step, y_start, y_stop, y_step, order="hilbert",
+                                MTJ_operating_curr=None, cycle_length=None, square_wave=None, readback=None):
+        return self.measure_field_map_amp(self.g_to_a(x_start, 'X'), self.g_to_a(x_stop, 'X'), self.g_to_a(x_step, 'X'),
+                                          self.g_to_a(y_start, 'Y'), self.g_to_a(y_stop, 'Y'), self.g_to_a(y_step, 'Y'),
+                                          order, MTJ_operating_curr, cycle_length, square_wave, readback)
     
     
 
@@ -335,7 +530,7 @@ if __name__ == "__main__":
         bias_gauss (float):             default = 0, 
         bias_ON (boolean):              default = False.
         '''
-        TC.PS_params_amps(start_curr=0, stop_curr=0.1, stop_curr=0.01, loop=1)
+        TC.PS_params_amps(start_curr=0, stop_curr=0.1, step_curr=0.01, loop=1)
         T, I, V, R = TC.measure_transfer_curve_amp()
         
         curve = PlotCanvas()
@@ -2,19 +2,24 @@ from pymeasure.instruments.keithley import Keithley2400
 from pymeasure.log import console_log
 from pymeasure.display.Qt import QtWidgets
 from pymeasure.display.windows import ManagedWindow
-from pymeasure.experiment import Procedure, Results, IntegerParameter, FloatParameter, Parameter, unique_filename
+from pymeasure.experiment import Procedure, Results, IntegerParameter, FloatParameter, BooleanParameter, Parameter, unique_filename
 from time import sleep
 import numpy as np
 import sys
 import tempfile
 
 from pymeasure.log import log, console_log
+from device import journal
 
 class TransferCurveProcedure(Procedure):
 
     data_points = IntegerParameter('Data points', default=20)
     max_current = FloatParameter('Maximum Current', units='A', default=0.001)
     min_current = FloatParameter('Minimum Current', units='A', default=-0.001)
+    hardware_sweep = BooleanParameter('Sweep on the sourcemeter', default=True)
+    block_points = IntegerParameter('Points per block', default=100)
+    
+    compliance_voltage = 10.0
 
     #DATA_COLUMNS = ['Current (A)', 'Voltage (V)', 'Voltage Std (V)', 'Resistance (V/A)']
     DATA_COLUMNS = ['Current (A)', 'Voltage (V)', 'Resistance (V/A)']
@@ -23,10 +28,16 @@ class TransferCurveProcedure(Procedure):
     def startup(self):
         log.info("Connecting and configuring the instrument")
         self.sourcemeter = Keithley2400("GPIB::20")
+        # The stock driver has no instrument sweep, ours is in pymeasure/keithley of this repository
+        if self.hardware_sweep and not hasattr(self.sourcemeter, 'sweep_chunks'):
+            raise Exception("TransferCurveProcedure: The installed Keithley2400 driver has no sweep_chunks(); "
+                            "copy pymeasure/keithley/keithley2400.py and buffer.py into "
+                            "pymeasure/instruments/keithley, or turn 'Sweep on the sourcemeter' off")
+        journal.attach(self.sourcemeter.adapter, "GPIB::20")
         self.sourcemeter.reset()
         self.sourcemeter.use_front_terminals()
         self.sourcemeter.nplc = 0.01
-        self.sourcemeter.apply_current(100e-3, 10.0)  # current_range = 100e-3, compliance_voltage = 10.0
+        self.sourcemeter.apply_current(100e-3, self.compliance_voltage)  # current_range = 100e-3, compliance_voltage = 10.0
         self.sourcemeter.measure_voltage(0.01, 1.0)  # nplc = 0.01, voltage_range = 1.0
         sleep(0.1)  # wait here to give the instrument time to react
         self.sourcemeter.stop_buffer()
@@ -38,12 +49,15 @@ class TransferCurveProcedure(Procedure):
             self.max_current,
             num=self.data_points
         )
+        # The whole sweep runs on the sourcemeter, the results arrive block by block
+        if self.hardware_sweep:
+            self.execute_hardware_sweep(currents)
+            return
         self.sourcemeter.enable_source()
         # Loop through each current point, measure and record the voltage
         for i, current in enumerate(currents):
-            log.info("Setting the current to %g A" % current)
+            log.debug("Setting the current to %g A" % current)
             self.sourcemeter.source_current = current
-            log.info("Waiting for the buffer to fill with measurements")
 
             data = {
                 'Current (A)': current,
@@ -57,6 +71,27 @@ class TransferCurveProcedure(Procedure):
                 log.info("User aborted the procedure")
                 break
                 
+    def execute_hardware_sweep(self, currents):
+        blocks = self.sourcemeter.sweep_chunks(currents, self.compliance_voltage, delay=10e-3, chunk=self.block_points)
+        done = 0
+        try:
+            for block in blocks:
+                # Current and voltage, the first element read
+                for current, voltage in block[:, :2]:
+                    data = {
+                        'Current (A)': current,
+                        'Voltage (V)': voltage,
+                        'Resistance (V/A)': voltage / current
+                    }
+                    self.emit('results', data)
+                done += len(block)
+                self.emit('progress', 100. * done / self.data_points)
+                if self.should_stop():
+                    log.info("User aborted the procedure")
+                    break
+        finally:
+            blocks.close()
+                
     def get_estimates(self, sequence_length=None, sequence=None):
 
         return self.data_points * 0.05
@@ -69,8 +104,8 @@ class IVWindow(ManagedWindow):
 
     def __init__(self):
         super().__init__(
-            procedure_class=IVProcedure,
-            inputs=['data_points', 'min_current', 'max_current'],
+            procedure_class=TransferCurveProcedure,
+            inputs=['data_points', 'min_current', 'max_current', 'hardware_sweep', 'block_points'],
             displays=['data_points', 'min_current', 'max_current'],
             x_axis='Current (A)',
             y_axis='Voltage (V)'
@@ -4,17 +4,15 @@ import timeit
 import numpy as np
 import pandas as pd
 import Instr_lib as instrlib
+from device import sessions
 
 
-rm = pyvisa.ResourceManager()
-print(rm.list_resources())
-
 # Agilent 6613C initalization
-addr5 = rm.open_resource('GPIB0::5::INSTR')
-addr9 = rm.open_resource('GPIB0::9::INSTR')
-addr10 = rm.open_resource('GPIB0::10::INSTR')
-addr19 = rm.open_resource('GPIB0::19::INSTR')
-addr20 = rm.open_resource('GPIB0::20::INSTR')
+addr5 = sessions.acquire('GPIB0::5::INSTR')
+addr9 = sessions.acquire('GPIB0::9::INSTR')
+addr10 = sessions.acquire('GPIB0::10::INSTR')
+addr19 = sessions.acquire('GPIB0::19::INSTR')
+addr20 = sessions.acquire('GPIB0::20::INSTR')
 #addr9.write("ABOR")
 addr5.write("*RST")
 addr5.write("*RST")
@@ -11,6 +11,8 @@ import tempfile
 import timeit
 
 from pymeasure.log import log, console_log
+from device import journal
+from sweep_planner import plan_sweep
 
 class SensitivityProcedure(Procedure):
     
@@ -83,6 +85,7 @@ class SensitivityProcedure(Procedure):
         
         # Initialization of the Keithley 2400 Sourcemeter
         self.SourceMeter = Keithley2400("GPIB::20")
+        journal.attach(self.SourceMeter.adapter, "GPIB::20")
         self.SourceMeter.reset()
         self.SourceMeter.use_front_terminals()
         sleep(0.1)  # wait here to give the instrument time to react
@@ -91,10 +94,12 @@ class SensitivityProcedure(Procedure):
         
         # Initialization of the Agilent6613C PowerSupply.
         self.PowerSupply_X = Agilent6613C("GPIB::5")
+        journal.attach(self.PowerSupply_X.adapter, "GPIB::5")
         self.PowerSupply_X.reset()
         
         # Initialization of the Agilent6613C PowerSupply.
         self.PowerSupply_Y = Agilent6613C("GPIB::9")
+        journal.attach(self.PowerSupply_Y.adapter, "GPIB::9")
         self.PowerSupply_Y.reset()
         
     # Convert the input in gauss to in amp
@@ -157,13 +162,15 @@ class SensitivityProcedure(Procedure):
             
         # PowerSupply configs
         self.PowerSupply_X.enable_output()
-        self.PowerSupply_X.output_voltage = abs(start_amp)*50
         
         # Biasing field
         self.bias_y()
         
-        # Sequence of current sourcing
+        # Sequence of current sourcing, grouped by relay polarity and compliance band
         curr_seq = self.PS_curr_seq(self.start_amp, self.min_amp, self.max_amp, self.step_amp, self.loop)
+        plan = plan_sweep(curr_seq)
+        log.info(plan.summary())
+        compliance = None
         
         # SourceMeter sourcing constant current for MTJ operation
         self.SourceMeter.enable_source()
@@ -177,11 +184,21 @@ class SensitivityProcedure(Procedure):
         
         # For loop 
         # Iterating the current sequence for the power supply
-        for i, curr in enumerate(curr_seq):
-            log.info("Setting the current to %g A" % curr)
+        for i, (curr, reverse, compliance_volt) in enumerate(plan.steps()):
+            log.debug("Setting the current to %g A" % curr)
+            
+            # Compliance of the planned band, written only when it changes: raised
+            # before the current, lowered after it (see sweep_compiler.compliance_first)
+            lower = compliance is not None and compliance_volt < compliance
+            if compliance_volt != compliance and not lower:
+                self.PowerSupply_X.output_voltage = compliance_volt
+                compliance = compliance_volt
             
             # Output current to the electromagnet (using the function with built-in relay)
-            self.PowerSupply_X.output_current_relay(curr)
+            self.PowerSupply_X.output_current_relay(curr, reverse)
+            if lower:
+                self.PowerSupply_X.output_voltage = compliance_volt
+                compliance = compliance_volt
             
             # Averaging the measured voltages across the sample
             volt = np.average(np.absolute(self.SourceMeter.voltage))
@@ -192,11 +209,6 @@ class SensitivityProcedure(Procedure):
             # Resistance of the sample
             resistance = volt/self.MTJ_operating_curr
             
-            print("t: ", time)
-            print("v: ", volt)
-            print("i: ", curr)
-            print("r: ", resistance, "\n")
-            
             # Render data in a tuple
             data = {
                 'Time (s)': time,
@@ -0,0 +1,258 @@
+"""
+Asyncio counterparts of MeasurementDevice and the GPIB_instruments classes.
+
+A query is split into write, wait and read. The bus is only held while bytes
+move; while an instrument converts, the coroutine polls its status byte for
+MAV (message available) and lets the other instruments use the bus. Queries
+to different instruments started together with asyncio.gather therefore
+overlap their conversion times:
+
+    ps = AsyncAgilent6613C_PowerSupply(Agilent6613C_PowerSupply('GPIB0::5::INSTR'))
+    sm = AsyncAgilent2400_SourceMeter(Agilent2400_SourceMeter('GPIB0::20::INSTR'))
+    curr, volt = await asyncio.gather(ps.read_I(), sm.read_buffer())
+
+The blocking pyvisa calls run in worker threads, one at a time per instrument.
+"""
+import asyncio
+import time
+import weakref
+
+# One lock per GPIB board and event loop, the bus carries one transfer at a time
+_bus_locks = weakref.WeakKeyDictionary()
+
+# Message available bit of the IEEE-488.2 status byte
+MAV = 16
+
+
+def bus_lock(visa_address):
+    """
+    Return the asyncio lock of the interface board the address is on.
+    """
+    board = visa_address.split("::")[0].upper()
+    locks = _bus_locks.setdefault(asyncio.get_running_loop(), {})
+    if board not in locks:
+        locks[board] = asyncio.Lock()
+    return locks[board]
+
+
+class AsyncMeasurementDevice:
+    # Interval(s) between status byte polls while waiting for a response
+    poll_interval = 0.001
+
+    def __init__(self, device, poll_status=True):
+        """
+        Initialize the asynchronous counterpart of a MeasurementDevice.
+
+        Parameters:
+        - device (MeasurementDevice): The device to drive. It is connected on first use.
+        - poll_status (boolean): Wait for MAV by serial poll before reading. Turn it off for
+                                 instruments without an IEEE-488.2 status byte. (Default to be True)
+        """
+        self.device = device
+        self.poll_status = poll_status
+        self._locks = weakref.WeakKeyDictionary()
+
+    def get_address(self):
+        return self.device.get_address()
+
+    @property
+    def _lock(self):
+        # Excludes concurrent calls to this device within the running loop
+        loop = asyncio.get_running_loop()
+        if loop not in self._locks:
+            self._locks[loop] = asyncio.Lock()
+        return self._locks[loop]
+
+    async def connect(self):
+        """
+        Connect the underlying device.
+
+        Raises:
+        - Exception: If the connection to the device fails.
+        """
+        if self.device.instrument is None:
+            await asyncio.to_thread(self.device.connect)
+
+    async def call(self, function, *args, **kwargs):
+        """
+        Run a blocking method of the device in a worker thread, excluding
+        other calls to the same device meanwhile.
+        """
+        await self.connect()
+        async with self._lock:
+            return await asyncio.to_thread(function, *args, **kwargs)
+
+    async def set_values(self, configuration):
+        """
+        Set configuration values on the connected device.
+
+        Parameters:
+        - configuration (str): Configuration settings to be set on the device.
+
+        Raises:
+        - Exception: If there is an issue with communication or setting values.
+        """
+        await self.connect()
+        async with self._lock:
+            async with bus_lock(self.device.visa_address):
+                await asyncio.to_thread(self.device.set_values, configuration)
+
+    async def get_values(self, configuration="READ?"):
+        """
+        Retrieve measurement values from the connected device, releasing the
+        bus while the device converts.
+
+        Returns:
+        - str: Measurement values obtained from the device.
+
+        Raises:
+        - Exception: If there is an issue with communication or data retrieval.
+        """
+        return await self._query(configuration)
+
+    async def get_block(self, configuration, dtype="<f4"):
+        """
+        Retrieve measurement values sent as an IEEE-488.2 binary block,
+        releasing the bus while the device converts.
+
+        Returns:
+        - numpy.ndarray: Measurement values obtained from the device.
+
+        Raises:
+        - Exception: If there is an issue with communication or data retrieval.
+        """
+        return await self._query(configuration, dtype)
+
+    async def _query(self, configuration, dtype=None):
+        # send_query and collect keep the device's journal, recorder, state cache
+        # and error polling; only the wait for MAV happens here
+        await self.connect()
+        device = self.device
+        async with self._lock:
+            async with bus_lock(device.visa_address):
+                handle = await asyncio.to_thread(device.send_query, configuration, dtype)
+            # Only this call's own query is discarded on failure, a query pending
+            # from elsewhere made send_query raise above
+            try:
+                if self.poll_status:
+                    await self._wait_for_response(device.instrument)
+                async with bus_lock(device.visa_address):
+                    return await asyncio.to_thread(device.collect, handle)
+            except BaseException:
+                if device._pending is handle:
+                    device.discard_query()
+                raise
+
+    async def _wait_for_response(self, instrument):
+        deadline = time.perf_counter() + instrument.timeout/1000.0
+        while time.perf_counter() < deadline:
+            async with bus_lock(self.device.visa_address):
+                status = await asyncio.to_thread(instrument.read_stb)
+            if status & MAV:
+                return
+            await asyncio.sleep(self.poll_interval)
+        # Let the read itself raise the timeout
+
+
+class AsyncAgilent6613C_PowerSupply(AsyncMeasurementDevice):
+
+    async def initialize(self):
+        await self.call(self.device.initialize)
+
+    async def output(self, output=False):
+        await self.call(self.device.output, output)
+
+    async def relay(self, rel=False):
+        await self.call(self.device.relay, rel)
+
+    async def source_I(self, curr=0, rel=None):
+        await self.call(self.device.source_I, curr, rel)
+
+    async def compliance_level(self, volt=None):
+        await self.call(self.device.compliance_level, volt)
+
+    async def read_I(self, in_float=True):
+        """
+        Read the output current, following the readback_policy of the device
+        (see Agilent6613C_PowerSupply.read_I).
+
+        Raises:
+        - Exception: If any issues with communication or data retrieval occur.
+        """
+        device = self.device
+        try:
+            if not await self.call(device._readback_due, in_float):
+                return device.readback_policy.estimate(device.curr)
+            return device._readback_value(await self.get_values("MEAS:CURR?"), in_float)
+        except Exception as e:
+            raise Exception(f"Failed to read current from the Agilent6613C_PowerSupply: {str(e)}")
+
+
+class AsyncAgilent2400_SourceMeter(AsyncMeasurementDevice):
+
+    async def initialize(self, *args, **kwargs):
+        await self.call(self.device.initialize, *args, **kwargs)
+
+    async def output(self, output=False):
+        await self.call(self.device.output, output)
+
+    async def NPLC(self, nplc=0.03):
+        await self.call(self.device.NPLC, nplc)
+
+    async def source_list_I(self, curr):
+        await self.call(self.device.source_list_I, curr)
+
+    async def read_buffer(self, binary=None):
+        """
+        Trigger the source list and read the readings, as a binary block
+        when the reading count is large (see Agilent2400_SourceMeter.read_buffer).
+
+        Raises:
+        - Exception: If any issues with communication or data retrieval occur.
+        """
+        try:
+            device = self.device
+            if device.reversal:
+                await self.call(device.data_format, False)
+                await self.call(device.set_state, "TRAC:POIN", device.counts)
+                return device.reversal_volt(await self.get_values(device.reversal_query()))
+            if binary is None:
+                binary = device.counts*device.elements >= device.binary_threshold
+            await self.call(device.data_format, binary)
+            if binary == True:
+                return (await self.get_block("READ?", "<f4")).astype("float64")
+            return device.str_float(await self.get_values("READ?"))
+        except Exception as e:
+            raise Exception(f"Agilent2400_SourceMeter: Failed to read buffer: {str(e)}")
+
+
+if __name__ == "__main__":
+    import simulation
+    from GPIB_instruments import Agilent6613C_PowerSupply, Agilent2400_SourceMeter
+
+    # Sequential versus concurrent readback of the supply and the sourcemeter
+    simulation.enable()
+    ps = Agilent6613C_PowerSupply('GPIB0::5::INSTR')
+    sm = Agilent2400_SourceMeter('GPIB0::20::INSTR')
+    ps.initialize()
+    sm.initialize()
+    sm.source_list_I([0.001, -0.001])
+    ps.output(True)
+    sm.output(True)
+    ps.source_I(0.1)
+
+    async def compare(n=50):
+        aps = AsyncAgilent6613C_PowerSupply(ps)
+        asm = AsyncAgilent2400_SourceMeter(sm)
+        t0 = time.perf_counter()
+        for i in range(n):
+            await aps.read_I()
+            await asm.read_buffer()
+        t1 = time.perf_counter()
+        for i in range(n):
+            await asyncio.gather(aps.read_I(), asm.read_buffer())
+        t2 = time.perf_counter()
+        print('Sequential: ', (t1 - t0)/n*1000, 'ms')
+        print('Concurrent: ', (t2 - t1)/n*1000, 'ms')
+
+    asyncio.run(compare())
@@ -1,28 +1,465 @@
+import atexit
+import collections
+import contextlib
+import re
+import threading
+import time
+import numpy as np
 import pyvisa
 
+class SessionRegistry:
+    def __init__(self, resource_manager=None):
+        """
+        Process-wide pool of open VISA sessions, shared by address.
+
+        A single ResourceManager is created lazily and every address is opened
+        at most once. Sessions are reference counted and stay open when the
+        last user releases them, so the next connect() to the same address
+        returns immediately. The settings cache of an address (see
+        MeasurementDevice.set_state()) is kept with its session, so every
+        device object on the address shares it.
+
+        Parameters:
+        - resource_manager (pyvisa.ResourceManager): Manager used to open sessions.
+                                                     (Default to a pyvisa.ResourceManager()
+                                                     created on first use)
+        """
+        self._resource_manager = resource_manager
+        self._sessions = {}
+        self._lock = threading.RLock()
+
+    def resource_manager(self):
+        """
+        Return the shared ResourceManager, creating it on first use.
+        """
+        with self._lock:
+            if self._resource_manager is None:
+                self._resource_manager = pyvisa.ResourceManager()
+            return self._resource_manager
+
+    def use(self, resource_manager):
+        """
+        Replace the ResourceManager, closing every pooled session first.
+
+        Parameters:
+        - resource_manager (pyvisa.ResourceManager): The new manager.
+        """
+        with self._lock:
+            self.close_all()
+            self._resource_manager = resource_manager
+
+    def acquire(self, visa_address):
+        """
+        Return an open session for the address, opening it only if needed.
+
+        Parameters:
+        - visa_address (str): The VISA address of the measurement device.
+
+        Returns:
+        - The pyvisa resource for the address.
+        """
+        with self._lock:
+            entry = self._sessions.get(visa_address)
+            if entry is not None and not self._is_open(entry[0]):
+                del self._sessions[visa_address]
+                entry = None
+            if entry is None:
+                resource = self.resource_manager().open_resource(visa_address)
+                entry = self._sessions[visa_address] = [resource, 0, {}]
+            # The new user may change settings without going through the cache
+            entry[2].clear()
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, visa_address, close=False):
+        """
+        Drop one reference to the session of the address.
+
+        Parameters:
+        - visa_address (str): The VISA address of the measurement device.
+        - close (boolean): Close the session once no reference is left,
+                           instead of keeping it pooled. (Default to be False)
+        """
+        with self._lock:
+            entry = self._sessions.get(visa_address)
+            if entry is None:
+                return
+            entry[1] = max(entry[1] - 1, 0)
+            if close and entry[1] == 0:
+                del self._sessions[visa_address]
+                entry[0].close()
+
+    def state(self, visa_address):
+        """
+        Return the settings cache of the address, {header: value} of the
+        settings the instrument is known to hold. It is cleared whenever the
+        session is acquired again.
+        """
+        with self._lock:
+            entry = self._sessions.get(visa_address)
+            return {} if entry is None else entry[2]
+
+    def invalidate(self, visa_address):
+        """
+        Forget the settings cached for the address, e.g. after writing to its
+        session directly.
+        """
+        self.state(visa_address).clear()
+
+    def refcount(self, visa_address):
+        """
+        Return the number of users currently holding the address.
+        """
+        with self._lock:
+            entry = self._sessions.get(visa_address)
+            return 0 if entry is None else entry[1]
+
+    def addresses(self):
+        """
+        Return the addresses of every pooled session.
+        """
+        with self._lock:
+            return list(self._sessions)
+
+    def close_all(self):
+        """
+        Close every pooled session regardless of its reference count.
+        """
+        with self._lock:
+            for resource, _, _ in self._sessions.values():
+                try:
+                    resource.close()
+                except Exception:
+                    pass
+            self._sessions.clear()
+
+    @staticmethod
+    def _is_open(resource):
+        try:
+            return resource.session is not None
+        except Exception:
+            return False
+
+
+# Shared by every MeasurementDevice and by the measurement scripts
+sessions = SessionRegistry()
+atexit.register(sessions.close_all)
+
+
+def join_commands(commands, max_length):
+    """
+    Join SCPI commands into as few program messages as the line length allows.
+    Every command but the common (*) ones is made absolute with a leading ':',
+    so a command is never parsed relative to the previous one's subsystem.
+
+    Parameters:
+    - commands (list of str): The commands, in execution order.
+    - max_length (int): Maximum length of one program message.
+
+    Returns:
+    - list of str: The program messages.
+    """
+    messages = []
+    message = ""
+    for command in commands:
+        command = command.strip().rstrip(";")
+        if not command.startswith((":", "*")):
+            command = ":" + command
+        if message and len(message) + 1 + len(command) > max_length:
+            messages.append(message)
+            message = ""
+        message = command if not message else message + ";" + command
+    if message:
+        messages.append(message)
+    return messages
+
+
+def parse_block(data, dtype="<f4"):
+    """
+    Parse an IEEE-488.2 arbitrary block response into a NumPy array.
+    Both the definite length form (#<digits><length><bytes>) and the
+    indefinite length form (#0<bytes> terminated by a newline) are accepted.
+
+    Parameters:
+    - data (bytes): The response, starting with '#'.
+    - dtype (str): NumPy type of the values, including the byte order, e.g. '<f4' for
+                   little-endian single precision, '>f4' for big-endian. (Default to be '<f4')
+
+    Returns:
+    - numpy.ndarray: The values.
+
+    Raises:
+    - Exception: If the response is not a valid block.
+    """
+    if data[:1] != b"#" or not data[1:2].isdigit():
+        raise Exception(f"Invalid binary block header: {bytes(data[:12])!r}")
+    digits = int(data[1:2])
+    if digits == 0:
+        payload = data[2:]
+        if payload.endswith(b"\n") and len(payload) % np.dtype(dtype).itemsize:
+            payload = payload[:-1]
+    else:
+        length = int(data[2:2 + digits])
+        payload = data[2 + digits:2 + digits + length]
+        if len(payload) < length:
+            raise Exception(f"Binary block truncated: {len(payload)} of {length} bytes")
+    return np.frombuffer(payload, dtype=dtype)
+
+
+def read_block(resource, dtype="<f4", terminated=True):
+    """
+    Read an IEEE-488.2 arbitrary block from a resource into a NumPy array.
+    The header is read first, so the payload is read with its exact length
+    and a newline byte inside the data does not end the read.
+
+    Parameters:
+    - resource: The pyvisa resource, after the query has been written.
+    - dtype (str): NumPy type of the values, including the byte order. (Default to be '<f4')
+    - terminated (boolean): Consume the newline the instrument sends after the block. (Default to be True)
+
+    Returns:
+    - numpy.ndarray: The values.
+
+    Raises:
+    - Exception: If the response is not a valid block.
+    """
+    header = resource.read_bytes(2)
+    if header[:1] != b"#" or not header[1:2].isdigit():
+        raise Exception(f"Invalid binary block header: {header!r}")
+    digits = int(header[1:2])
+    if digits == 0:
+        return parse_block(header + resource.read_raw(), dtype)
+    length = resource.read_bytes(digits)
+    payload = resource.read_bytes(int(length)) if int(length) else b""
+    if terminated:
+        resource.read_bytes(1)
+    return parse_block(header + length + payload, dtype)
+
+
+class CommandJournal:
+    def __init__(self, maxlen=10000, path="command_journal.log"):
+        """
+        Bounded in-memory record of the commands sent to and the responses
+        read from the instruments, replacing console prints in the I/O path.
+        Entries are appended to a deque, which is thread-safe without a lock,
+        and the oldest entries are dropped once maxlen is reached. Nothing is
+        written to disk until dump() is called; MeasurementDevice dumps it
+        when a command fails. Dumped entries stay in the journal, so errors
+        read later are still attributed to the commands before them.
+
+        Parameters:
+        - maxlen (int): Number of entries kept. (Default to be 10000)
+        - path (str): File dump() writes to. (Default to be "command_journal.log")
+        """
+        self.entries = collections.deque(maxlen=maxlen)
+        self.path = path
+        # Last entry written by dump()
+        self._dumped = None
+
+    def log(self, address, kind, text):
+        """
+        Append one entry.
+
+        Parameters:
+        - address (str): VISA address or name of the instrument.
+        - kind (str): "write", "query", "read" or "error".
+        - text (str): The command or response.
+        """
+        self.entries.append((time.time(), address, kind, text))
+
+    def tail(self, n=20, address=None):
+        """
+        Return the last n entries, optionally of one instrument only.
+        """
+        entries = [e for e in list(self.entries) if address is None or e[1] == address]
+        return entries[-n:]
+
+    def since(self, t, address=None, kinds=("write", "query")):
+        """
+        Return the entries logged at or after time t, optionally of one
+        instrument and of some kinds only.
+        """
+        return [e for e in list(self.entries)
+                if e[0] >= t and (address is None or e[1] == address) and e[2] in kinds]
+
+    def format(self, entries=None):
+        """
+        Return entries (Default to every entry) as text, one line each.
+        """
+        lines = []
+        for t, address, kind, text in list(self.entries) if entries is None else entries:
+            stamp = time.strftime("%H:%M:%S", time.localtime(t)) + f".{int(t % 1*1e6):06d}"
+            lines.append(f"{stamp} {address} {kind:<5} {str(text).rstrip()}")
+        return "\n".join(lines)
+
+    def dump(self, path=None):
+        """
+        Append the entries not dumped before to a text file. The journal
+        keeps them, see clear().
+
+        Parameters:
+        - path (str): File to write to. (Default to self.path)
+
+        Returns:
+        - str: The path written to.
+        """
+        path = path or self.path
+        entries = []
+        # Newest first, back to the last entry dumped, or every entry once it was dropped
+        for entry in reversed(list(self.entries)):
+            if entry is self._dumped:
+                break
+            entries.append(entry)
+        entries.reverse()
+        if entries:
+            self._dumped = entries[-1]
+            with open(path, "a") as fp:
+                fp.write(self.format(entries) + "\n")
+        return path
+
+    def clear(self):
+        self.entries.clear()
+        self._dumped = None
+
+    def attach(self, adapter, name=None):
+        """
+        Journal the write/read calls of a pymeasure adapter.
+
+        Parameters:
+        - adapter: The pymeasure adapter of an instrument.
+        - name (str): Instrument name in the journal. (Default to the adapter's class name)
+        """
+        name = name or type(adapter).__name__
+        write, read = adapter.write, adapter.read
+
+        def journaled_write(command, **kwargs):
+            self.log(name, "write", command)
+            write(command, **kwargs)
+
+        def journaled_read(**kwargs):
+            response = read(**kwargs)
+            self.log(name, "read", response)
+            return response
+
+        adapter.write = journaled_write
+        adapter.read = journaled_read
+        return adapter
+
+
+# Shared by every MeasurementDevice
+journal = CommandJournal()
+
+
+def parse_errors(response):
+    """
+    Parse an error queue response, e.g. '-113,"Undefined header",-222,"Data out of range"',
+    into (code, message) tuples, leaving out '0,"No error"'.
+    """
+    errors = []
+    for code, message in re.findall(r'([-+]?\d+)\s*,\s*"([^"]*)"', response):
+        if int(code) != 0:
+            errors.append((int(code), message))
+    return errors
+
+
+class InstrumentError(Exception):
+    def __init__(self, address, errors, commands=()):
+        """
+        Errors read from an instrument's error queue.
+
+        Parameters:
+        - address (str): The VISA address of the instrument.
+        - errors (list of tuple): (code, message) of every error, oldest first.
+        - commands (list of str): The commands sent since the last clean check, oldest first.
+                                  One of them caused the errors.
+        """
+        self.address = address
+        self.errors = errors
+        self.commands = list(commands)
+        text = "; ".join(f'{code},"{message}"' for code, message in errors)
+        if self.commands:
+            text += " after: " + " | ".join(self.commands[-5:])
+        super().__init__(f"{address} reported {text}")
+
+
+class PendingQuery:
+    def __init__(self, device, configuration, dtype, sent_at):
+        """
+        A query sent by MeasurementDevice.send_query() whose response has not been read yet.
+
+        Parameters:
+        - device (MeasurementDevice): The device the query was sent to.
+        - configuration (str): The program message sent.
+        - dtype (str): NumPy type of a binary block response, None for an ASCII response.
+        - sent_at (float): perf_counter() time the query was sent.
+        """
+        self.device = device
+        self.configuration = configuration
+        self.dtype = dtype
+        self.sent_at = sent_at
+
+    def collect(self):
+        return self.device.collect(self)
+
+    def __repr__(self):
+        return f"PendingQuery({self.device.visa_address}, {self.configuration!r})"
+
+
+# Commands that return every setting of an instrument to a known state
+RESET_COMMANDS = ("*RST", "*RCL", "SYST:PRES", "SYSTEM:PRESET")
+
+
 class MeasurementDevice:
-    def __init__(self, visa_address):
+    # Longest program message the instrument accepts
+    max_line_length = 512
+    # LatencyRecorder timing every get_values/set_values, see instrumentation.enable()
+    recorder = None
+    # CommandJournal of every command and response
+    journal = journal
+    # Serial poll for queued errors once per this many operations, 0 to disable
+    error_check_interval = 100
+    # Query returning the whole error queue at once, if the instrument has one
+    error_queue_all = None
+
+    def __init__(self, visa_address, error_check_interval=None):
         """
         Initialize the MeasurementDevice object with the VISA address.
 
         Parameters:
         - visa_address (str): The VISA address of the measurement device.
+        - error_check_interval (int): Operations between serial polls for queued errors, 0 for
+                                      instruments without a SCPI error queue (e.g. the Keithley 182),
+                                      whose status byte bit 2 means something else.
+                                      (Default to be the class attribute, 100)
         """
         self.visa_address = visa_address
+        if error_check_interval is not None:
+            self.error_check_interval = error_check_interval
         self.instrument = None
+        self._batch = None
+        self._state = {}
+        self._operations = 0
+        self._checked_at = time.time()
+        self._checking = False
+        self._pending = None
         
     def get_visa(self):
         return visa_address
 
     def connect(self):
         """
-        Connect to the measurement device using VISA.
+        Connect to the measurement device using VISA. The session is taken
+        from the shared registry, so reconnecting to an address that is
+        already open does not reopen it.
 
         Raises:
         - Exception: If the connection to the device fails.
         """
+        if self.instrument is not None:
+            return
         try:
-            self.instrument = pyvisa.ResourceManager().open_resource(self.visa_address)
+            self.instrument = sessions.acquire(self.visa_address)
+            self._state = sessions.state(self.visa_address)
             print(f"Connected to the device at {self.visa_address}")
         except Exception as e:
             raise Exception(f"Failed to connect to the device: {str(e)}")
@@ -37,11 +474,158 @@ class MeasurementDevice:
         Raises:
         - Exception: If there is an issue with communication or data retrieval.
         """
+        self._track_reset(configuration)
+        self._check_pending()
         try:
+            configuration = self._flush_batch(configuration)
+            self.journal.log(self.visa_address, "query", configuration)
+            t0 = time.perf_counter()
             values = self.instrument.query(configuration)  # Replace with the actual command for reading values
-            return values
+            if self.recorder is not None:
+                self.recorder.record(self.visa_address, configuration, time.perf_counter() - t0,
+                                     len(configuration), len(values))
+            self.journal.log(self.visa_address, "read", values)
+        except Exception as e:
+            self._journal_error(e)
+            raise Exception(f"Failed to get values from the device: {str(e)}")
+        self._count_operation()
+        return values
+
+    def get_block(self, configuration, dtype="<f4"):
+        """
+        Retrieve measurement values sent as an IEEE-488.2 binary block,
+        e.g. after FORM:DATA SREAL.
+
+        Parameters:
+        - configuration (str): The query.
+        - dtype (str): NumPy type of the values, including the byte order. (Default to be '<f4')
+
+        Returns:
+        - numpy.ndarray: Measurement values obtained from the device.
+
+        Raises:
+        - Exception: If there is an issue with communication or data retrieval.
+        """
+        self._track_reset(configuration)
+        self._check_pending()
+        try:
+            configuration = self._flush_batch(configuration)
+            self.journal.log(self.visa_address, "query", configuration)
+            t0 = time.perf_counter()
+            self.instrument.write(configuration)
+            values = read_block(self.instrument, dtype)
+            if self.recorder is not None:
+                self.recorder.record(self.visa_address, configuration, time.perf_counter() - t0,
+                                     len(configuration), values.nbytes)
+            self.journal.log(self.visa_address, "read", f"<block of {values.size} {values.dtype} values>")
+        except Exception as e:
+            self._journal_error(e)
+            raise Exception(f"Failed to get values from the device: {str(e)}")
+        self._count_operation()
+        return values
+
+    def send_query(self, configuration, dtype=None):
+        """
+        Send a query without waiting for the response, so that other devices
+        can be addressed while this one measures. Read the response with
+        collect() before the next command to this device.
+
+        Parameters:
+        - configuration (str): The query.
+        - dtype (str): NumPy type of a binary block response, e.g. '<f4'. (Default to be None, for ASCII)
+
+        Returns:
+        - PendingQuery: The handle to collect the response with.
+
+        Raises:
+        - Exception: If there is an issue with communication, or a query is already pending.
+        """
+        self._track_reset(configuration)
+        self._check_pending()
+        try:
+            configuration = self._flush_batch(configuration)
+            self.journal.log(self.visa_address, "query", configuration)
+            t0 = time.perf_counter()
+            self.instrument.write(configuration)
         except Exception as e:
+            self._journal_error(e)
+            raise Exception(f"Failed to send query to the device: {str(e)}")
+        self._pending = PendingQuery(self, configuration, dtype, t0)
+        return self._pending
+
+    def collect(self, handle=None):
+        """
+        Read the response of the query sent by send_query().
+
+        Parameters:
+        - handle (PendingQuery): The pending query. (Default to be the one pending on this device)
+
+        Returns:
+        - str or numpy.ndarray: The response, an array if the query was sent with a dtype.
+
+        Raises:
+        - Exception: If there is an issue with communication, or no query is pending.
+        """
+        if handle is None:
+            handle = self._pending
+        if handle is None or handle is not self._pending:
+            raise Exception(f"{self.visa_address}: No such pending query to collect")
+        self._pending = None
+        try:
+            if handle.dtype is None:
+                values = self.instrument.read()
+                nbytes, text = len(values), values
+            else:
+                values = read_block(self.instrument, handle.dtype)
+                nbytes, text = values.nbytes, f"<block of {values.size} {values.dtype} values>"
+            if self.recorder is not None:
+                self.recorder.record(self.visa_address, handle.configuration, time.perf_counter() - handle.sent_at,
+                                     len(handle.configuration), nbytes)
+            self.journal.log(self.visa_address, "read", text)
+        except Exception as e:
+            self._journal_error(e)
             raise Exception(f"Failed to get values from the device: {str(e)}")
+        self._count_operation()
+        return values
+
+    def discard_query(self):
+        """
+        Drop the pending query, if any, after a failure. The device is cleared
+        so that its unread response cannot answer the next query.
+        """
+        if self._pending is None:
+            return
+        self._pending = None
+        try:
+            self.instrument.clear()
+        except Exception as e:
+            self.journal.log(self.visa_address, "error", f"Failed to clear the device: {str(e)}")
+
+    def _check_pending(self):
+        # Any other message would make the device discard the pending response
+        if self._pending is not None:
+            raise Exception(f"{self.visa_address}: Response to {self._pending.configuration!r} not collected")
+
+    def _flush_batch(self, configuration):
+        # Pending transaction commands go out in the same message as the query
+        if not self._batch:
+            return configuration
+        messages = join_commands(self._batch + [configuration], self.max_line_length)
+        self._batch = []
+        for message in messages[:-1]:
+            self.journal.log(self.visa_address, "write", message)
+            t0 = time.perf_counter()
+            self.instrument.write(message)
+            if self.recorder is not None:
+                self.recorder.record(self.visa_address, message, time.perf_counter() - t0, len(message))
+            # The message being completed polls for errors, if due
+            self._count_operation(poll=False)
+        return messages[-1]
+
+    def _journal_error(self, error):
+        # Keep the commands that led to the failure
+        self.journal.log(self.visa_address, "error", str(error))
+        self.journal.dump()
 
     def set_values(self, configuration):
         """
@@ -53,21 +637,244 @@ class MeasurementDevice:
         Raises:
         - Exception: If there is an issue with communication or setting values.
         """
+        self._track_reset(configuration)
+        if self._batch is not None:
+            self._batch.append(configuration)
+            return
+        self._check_pending()
         try:
+            self.journal.log(self.visa_address, "write", configuration)
+            t0 = time.perf_counter()
             self.instrument.write(configuration)  # Replace with the actual command for setting values
-            print(f"Config set: {configuration}")
+            if self.recorder is not None:
+                self.recorder.record(self.visa_address, configuration, time.perf_counter() - t0, len(configuration))
         except Exception as e:
+            self._journal_error(e)
             raise Exception(f"Failed to set values on the device: {str(e)}")
+        self._count_operation()
+
+    def status_byte(self):
+        """
+        Read the IEEE-488.2 status byte, by serial poll where the interface supports it.
+        """
+        try:
+            return self.instrument.read_stb()
+        except (AttributeError, NotImplementedError):
+            return int(self.get_values("*STB?"))
 
-    def disconnect(self):
+    def drain_errors(self):
         """
-        Disconnect from the measurement device.
+        Read the whole error queue in one burst and journal every error.
+
+        Returns:
+        - list of tuple: (code, message) of every error, oldest first.
+
+        Raises:
+        - Exception: If there is an issue with communication.
+        """
+        self._checking = True
+        try:
+            if self.error_queue_all:
+                return self._journal_errors(parse_errors(self.get_values(self.error_queue_all)))
+            errors = []
+            # The queue holds at most a few dozen entries, stop on a stuck instrument
+            for i in range(64):
+                error = parse_errors(self.get_values("SYST:ERR?"))
+                if not error:
+                    break
+                errors.extend(error)
+            return self._journal_errors(errors)
+        finally:
+            self._checking = False
+
+    def check_errors(self):
+        """
+        Drain the error queue and raise if it held any error. The error is
+        attributed to the commands journaled since the last clean check.
+
+        Raises:
+        - InstrumentError: If the instrument reported errors.
+        """
+        since = self._checked_at
+        errors = self.drain_errors()
+        self._checked_at = time.time()
+        self._operations = 0
+        if errors:
+            commands = [e[3] for e in self.journal.since(since, self.visa_address)
+                        if not e[3].upper().lstrip(":").startswith(("SYST:ERR", "*STB"))]
+            raise InstrumentError(self.visa_address, errors, commands)
+
+    def poll_errors(self):
+        """
+        Read the status byte and check the error queue only if its error
+        available bit (2) is set. Cheap enough to call once per point. A serial
+        poll is not ordered with the commands still being parsed, so an error
+        of the latest command may only show at the next poll; use
+        check_errors() where it has to be caught at once.
+
+        Raises:
+        - InstrumentError: If the instrument reported errors.
+        """
+        self._operations = 0
+        if self.status_byte() & 4:
+            self.check_errors()
+
+    def report_errors(self):
+        """
+        Drain and print the error queue after a failure, dumping the journal.
+
+        Returns:
+        - list of tuple: (code, message) of every error, oldest first.
+        """
+        try:
+            errors = self.drain_errors()
+        except Exception as e:
+            errors = []
+            self.journal.log(self.visa_address, "error", f"Failed to read the error queue: {str(e)}")
+        self._checked_at = time.time()
+        self.journal.dump()
+        if errors:
+            print(f"{self.visa_address}: " + "; ".join(f'{code},"{message}"' for code, message in errors))
+        return errors
+
+    def _journal_errors(self, errors):
+        for code, message in errors:
+            self.journal.log(self.visa_address, "error", f'{code},"{message}"')
+        return errors
+
+    def _count_operation(self, poll=True):
+        if self._checking or not self.error_check_interval:
+            return
+        self._operations += 1
+        if poll and self._operations >= self.error_check_interval:
+            self.poll_errors()
+
+    def set_state(self, header, value):
+        """
+        Write a setting unless the state cache shows the device already holds
+        the value. The cache belongs to the pooled session, so device objects
+        on the same address share it; it is cleared on *RST, whenever the
+        session is acquired (by connect() or a direct sessions.acquire()) and
+        by invalidate_state().
+
+        Parameters:
+        - header (str): Header of the setting, e.g. "OUTP:REL:POL". Use the same spelling every time.
+        - value: Value of the setting, compared as a string.
+
+        Returns:
+        - boolean: True if the command was sent.
+
+        Raises:
+        - Exception: If there is an issue with communication or setting values.
+        """
+        key = header.strip().lstrip(":").upper()
+        value = str(value)
+        if self._state.get(key) == value:
+            return False
+        try:
+            self.set_values(f"{header} {value}")
+        except Exception:
+            self._state.pop(key, None)
+            raise
+        self._state[key] = value
+        return True
+
+    def cached_state(self):
+        """
+        Return a copy of the state cache, {header: value} of the settings the device is known to hold.
+        """
+        return dict(self._state)
+
+    def update_state(self, settings):
+        """
+        Record settings that were sent without set_state(), e.g. inside a
+        precompiled program message, so that set_state() stays consistent.
+
+        Parameters:
+        - settings (list of tuple): (header, value) of every setting sent.
+        """
+        for header, value in settings:
+            self._state[header.strip().lstrip(":").upper()] = str(value)
+
+    def invalidate_state(self, header=None):
+        """
+        Forget the cached value of one setting, or of every setting, e.g. after
+        the instrument was changed from its front panel.
+
+        Parameters:
+        - header (str): Header of the setting. (Default to be None, for every setting)
+        """
+        if header is None:
+            self._state.clear()
+        else:
+            self._state.pop(header.strip().lstrip(":").upper(), None)
+
+    def _track_reset(self, configuration):
+        for command in configuration.split(";"):
+            if command.strip().lstrip(":").upper().startswith(RESET_COMMANDS):
+                self._state.clear()
+                return
+
+    @contextlib.contextmanager
+    def transaction(self, check_errors=True):
+        """
+        Collect the set_values() calls made inside the block and send them as
+        semicolon-joined program messages when the block exits, instead of
+        one write per command. A get_values() inside the block carries the
+        pending commands with it. Nested transactions join the outermost one.
+
+        Parameters:
+        - check_errors (boolean): Drain the error queue once after the commands are sent. (Default to be True)
+
+        Raises:
+        - Exception: If there is an issue with communication.
+        - InstrumentError: If the instrument reports an error.
+        """
+        if self._batch is not None:
+            yield self
+            return
+        self._batch = []
+        try:
+            yield self
+        except Exception:
+            # The cached settings of the block were never sent
+            self._batch = None
+            self._state.clear()
+            raise
+        commands, self._batch = self._batch, None
+        messages = join_commands(commands, self.max_line_length)
+        try:
+            for message in messages:
+                self.set_values(message)
+        except Exception:
+            self._state.clear()
+            raise
+        if check_errors and messages:
+            try:
+                self.check_errors()
+            except InstrumentError:
+                self._state.clear()
+                self.journal.dump()
+                raise
+
+    def disconnect(self, close=False):
+        """
+        Disconnect from the measurement device. The session goes back to
+        the shared registry and stays open for the next connect().
+
+        Parameters:
+        - close (boolean): Close the VISA session if no other device uses it. (Default to be False)
 
         Raises:
         - Exception: If there is an issue with disconnection.
         """
+        if self.instrument is None:
+            return
         try:
-            self.instrument.close()
+            sessions.release(self.visa_address, close)
+            self.instrument = None
+            self._state = {}
+            self._pending = None
             print("Disconnected from the device")
         except Exception as e:
             raise Exception(f"Failed to disconnect from the device: {str(e)}")
@@ -0,0 +1,288 @@
+"""
+Per-command latency instrumentation of the instrument I/O.
+
+Each (instrument, command mnemonic) pair keeps a call count, byte counts and
+a log-spaced latency histogram. Recording costs one perf_counter() pair and a
+dict lookup per call, so it can stay on for whole runs.
+
+    recorder = instrumentation.enable()              # every MeasurementDevice
+    addr5 = InstrumentedResource(addr5, recorder)    # raw pyvisa resources
+    instrument_adapter(keithley.adapter, recorder)   # pymeasure adapters
+    ...
+    print(recorder.summary())
+    recorder.to_json('latency.json')
+"""
+import csv
+import json
+import math
+import time
+
+
+def mnemonic(command):
+    """
+    Return the headers of a program message without their arguments,
+    e.g. "CURR 0.1;MEAS:CURR?" -> "CURR;MEAS:CURR?".
+    """
+    return ";".join(c.split(None, 1)[0].lstrip(":") for c in command.strip().upper().split(";") if c.strip())
+
+
+class CommandStats:
+    def __init__(self, nbins):
+        """
+        Counters of one (instrument, mnemonic) pair.
+        """
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.histogram = [0]*nbins
+
+    def percentile(self, q, edges):
+        """
+        Estimate a latency percentile in seconds from the histogram, at the upper bin edge.
+        """
+        target = q/100*self.count
+        seen = 0
+        for i, n in enumerate(self.histogram):
+            seen += n
+            if n and seen >= target:
+                return min(edges[i + 1], self.max)
+        return self.max
+
+
+class LatencyRecorder:
+    def __init__(self, lowest=1e-5, highest=10.0, bins_per_decade=10):
+        """
+        Collect latency histograms, byte counts and call counts per instrument
+        and command mnemonic.
+
+        Parameters:
+        - lowest (float): Upper edge of the first histogram bin in seconds. (Default to be 1e-5)
+        - highest (float): Lower edge of the overflow bin in seconds. (Default to be 10)
+        - bins_per_decade (int): Histogram resolution. (Default to be 10)
+        """
+        self.lowest = lowest
+        self.bins_per_decade = bins_per_decade
+        decades = math.log10(highest/lowest)
+        nbins = int(round(decades*bins_per_decade))
+        # Bin 0 collects everything below lowest, the last bin everything above highest
+        self.edges = [0.0] + [lowest*10**(i/bins_per_decade) for i in range(nbins + 1)] + [math.inf]
+        self._log_lowest = math.log10(lowest)
+        self._nbins = nbins + 2
+        self.stats = {}
+        self.started = time.time()
+
+    def record(self, instrument, command, seconds, bytes_written=0, bytes_read=0):
+        """
+        Add one call to the statistics.
+
+        Parameters:
+        - instrument (str): Name or VISA address of the instrument.
+        - command (str): The program message sent.
+        - seconds (float): Latency of the call.
+        - bytes_written (int): Bytes sent to the instrument.
+        - bytes_read (int): Bytes received from the instrument.
+        """
+        key = (instrument, mnemonic(command))
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = CommandStats(self._nbins)
+        stats.count += 1
+        stats.total += seconds
+        if seconds < stats.min:
+            stats.min = seconds
+        if seconds > stats.max:
+            stats.max = seconds
+        stats.bytes_written += bytes_written
+        stats.bytes_read += bytes_read
+        if seconds < self.lowest:
+            index = 0
+        else:
+            index = min(int((math.log10(seconds) - self._log_lowest)*self.bins_per_decade) + 1, self._nbins - 1)
+        stats.histogram[index] += 1
+
+    def reset(self):
+        self.stats = {}
+        self.started = time.time()
+
+    def rows(self):
+        """
+        Return one summary dict per (instrument, mnemonic), slowest total first.
+        """
+        rows = []
+        for (instrument, command), stats in self.stats.items():
+            rows.append({
+                "instrument": instrument,
+                "command": command,
+                "count": stats.count,
+                "total_s": stats.total,
+                "mean_ms": stats.total/stats.count*1000,
+                "min_ms": stats.min*1000,
+                "p50_ms": stats.percentile(50, self.edges)*1000,
+                "p90_ms": stats.percentile(90, self.edges)*1000,
+                "max_ms": stats.max*1000,
+                "bytes_written": stats.bytes_written,
+                "bytes_read": stats.bytes_read,
+            })
+        return sorted(rows, key=lambda r: r["total_s"], reverse=True)
+
+    def summary(self, points=None, top=10):
+        """
+        Return a text table of the commands that took the most time.
+
+        Parameters:
+        - points (int): Number of measurement points, to show the time per point. (Default to be None)
+        - top (int): Number of rows. (Default to be 10)
+        """
+        lines = [f"{'Instrument':<18}{'Command':<28}{'Calls':>8}{'Total(s)':>10}{'Mean(ms)':>10}"
+                 f"{'p90(ms)':>10}" + (f"{'ms/point':>10}" if points else "")]
+        for row in self.rows()[:top]:
+            line = (f"{row['instrument'][:17]:<18}{row['command'][:27]:<28}{row['count']:>8}"
+                    f"{row['total_s']:>10.3f}{row['mean_ms']:>10.3f}{row['p90_ms']:>10.3f}")
+            if points:
+                line += f"{row['total_s']/points*1000:>10.3f}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def to_json(self, path):
+        """
+        Write the statistics, including the histograms, to a JSON file.
+        """
+        data = {
+            "started": self.started,
+            "bin_edges_s": [e if math.isfinite(e) else None for e in self.edges],
+            "commands": [],
+        }
+        for row in self.rows():
+            stats = self.stats[(row["instrument"], row["command"])]
+            data["commands"].append(dict(row, histogram=stats.histogram))
+        with open(path, "w") as fp:
+            json.dump(data, fp, indent=1)
+
+    def to_csv(self, path):
+        """
+        Write one summary row per (instrument, mnemonic) to a CSV file.
+        """
+        rows = self.rows()
+        with open(path, "w", newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, list(rows[0].keys()) if rows else ["instrument", "command"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+class InstrumentedResource:
+    def __init__(self, resource, recorder, name=None):
+        """
+        Wrap a pyvisa resource so that its write/query/read calls are recorded.
+        The read that follows a write of a query is recorded together with it.
+
+        Parameters:
+        - resource: The pyvisa resource.
+        - recorder (LatencyRecorder): Where to record.
+        - name (str): Instrument name in the statistics. (Default to the resource name)
+        """
+        self._resource = resource
+        self._recorder = recorder
+        self._name = name or getattr(resource, "resource_name", str(resource))
+        self._pending = None
+
+    def __getattr__(self, attr):
+        return getattr(self._resource, attr)
+
+    def __setattr__(self, attr, value):
+        if attr.startswith("_"):
+            object.__setattr__(self, attr, value)
+        else:
+            setattr(self._resource, attr, value)
+
+    def write(self, message, *args, **kwargs):
+        t0 = time.perf_counter()
+        result = self._resource.write(message, *args, **kwargs)
+        if message.rstrip().endswith("?"):
+            self._pending = (message, t0)
+        else:
+            self._recorder.record(self._name, message, time.perf_counter() - t0, len(message))
+        return result
+
+    def read(self, *args, **kwargs):
+        response = self._resource.read(*args, **kwargs)
+        self._complete(len(response))
+        return response
+
+    def read_raw(self, *args, **kwargs):
+        response = self._resource.read_raw(*args, **kwargs)
+        self._complete(len(response))
+        return response
+
+    def query(self, message, *args, **kwargs):
+        t0 = time.perf_counter()
+        response = self._resource.query(message, *args, **kwargs)
+        self._recorder.record(self._name, message, time.perf_counter() - t0, len(message), len(response))
+        return response
+
+    def _complete(self, nbytes):
+        if self._pending is not None:
+            message, t0 = self._pending
+            self._pending = None
+            self._recorder.record(self._name, message, time.perf_counter() - t0, len(message), nbytes)
+
+
+def instrument_adapter(adapter, recorder, name=None):
+    """
+    Record the write/read calls of a pymeasure adapter, e.g.
+    instrument_adapter(keithley.adapter, recorder, "Keithley2400").
+
+    Parameters:
+    - adapter: The pymeasure adapter of an instrument.
+    - recorder (LatencyRecorder): Where to record.
+    - name (str): Instrument name in the statistics. (Default to the adapter's class name)
+    """
+    name = name or type(adapter).__name__
+    write, read = adapter.write, adapter.read
+    pending = []
+
+    def timed_write(command, **kwargs):
+        t0 = time.perf_counter()
+        write(command, **kwargs)
+        if command.rstrip().rstrip(";").endswith("?"):
+            pending[:] = [command, t0]
+        else:
+            recorder.record(name, command, time.perf_counter() - t0, len(command))
+
+    def timed_read(**kwargs):
+        response = read(**kwargs)
+        if pending:
+            command, t0 = pending
+            del pending[:]
+            recorder.record(name, command, time.perf_counter() - t0, len(command), len(response))
+        return response
+
+    adapter.write = timed_write
+    adapter.read = timed_read
+    return adapter
+
+
+# Shared recorder used by enable()
+recorder = LatencyRecorder()
+
+
+def enable(latency_recorder=None):
+    """
+    Record the get_values/set_values calls of every MeasurementDevice.
+
+    Parameters:
+    - latency_recorder (LatencyRecorder): Where to record. (Default to the shared recorder)
+
+    Returns:
+    - LatencyRecorder: The recorder in use.
+    """
+    from device import MeasurementDevice
+    MeasurementDevice.recorder = latency_recorder or recorder
+    return MeasurementDevice.recorder
+
+
+def disable():
+    from device import MeasurementDevice
+    MeasurementDevice.recorder = None
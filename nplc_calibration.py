@@ -0,0 +1,184 @@
+"""
+Noise versus speed calibration of the sourcemeter readings.
+
+At a fixed field, every combination of NPLC and cycle length is measured
+repeatedly: the spread of the resistance is its resolution, the time per
+point its cost. The Pareto front shows the settings worth using, and the
+fastest one meeting a target resolution is stored per sample, so later runs
+pick it up:
+
+    points = calibrate(sourcemeter, 0.001)
+    for point in pareto_front(points):
+        print(point)
+    best = choose(points, resolution=0.5)
+    save_setting("MTJ 7", best)
+    ...
+    setting = load_setting("MTJ 7")    # {"nplc": ..., "cycle_length": ..., ...}
+"""
+import os
+import json
+import time
+import numpy as np
+
+# Per sample settings, next to this module
+SETTINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_settings.json")
+
+NPLC_GRID = (0.01, 0.03, 0.1, 0.3, 1)
+CYCLE_LENGTH_GRID = (1, 2, 5, 10)
+
+
+class CalibrationPoint:
+    def __init__(self, nplc, cycle_length, resistance, noise, time_per_point):
+        """
+        The resolution and cost of one sourcemeter setting.
+
+        Parameters:
+        - nplc (float): Integration time in power line cycles.
+        - cycle_length (int): Readings per current polarity of the source list.
+        - resistance (float): Mean resistance(Ohm).
+        - noise (float): Standard deviation of the resistance(Ohm) between points.
+        - time_per_point (float): Time(s) of one point.
+        """
+        self.nplc = nplc
+        self.cycle_length = cycle_length
+        self.resistance = resistance
+        self.noise = noise
+        self.time_per_point = time_per_point
+
+    def dominates(self, other):
+        return (self.noise <= other.noise and self.time_per_point <= other.time_per_point
+                and (self.noise < other.noise or self.time_per_point < other.time_per_point))
+
+    def __repr__(self):
+        return (f"CalibrationPoint(NPLC {self.nplc}, cycle {self.cycle_length}: {self.noise:.4g} Ohm, "
+                f"{self.time_per_point*1000:.3g} ms)")
+
+
+def differential_volt(readings, currents):
+    """
+    Return (sum(pos) - sum(neg))/n of one source list, by the polarity of each
+    list current, or the one voltage the sourcemeter averaged itself.
+    """
+    if len(readings) == 1:
+        return float(readings[0])
+    signs = np.sign(currents)
+    return float(np.dot(signs*signs[0], readings)/len(readings))
+
+
+def measure_setting(sourcemeter, nplc, cycle_length, curr, repeats=20, square_wave=True):
+    """
+    Measure the resistance repeatedly with one setting.
+
+    Parameters:
+    - sourcemeter (Agilent2400_SourceMeter): The sourcemeter, connected with its output on.
+    - nplc (float): Integration time in power line cycles.
+    - cycle_length (int): Readings per current polarity.
+    - curr (float): Sample current(A).
+    - repeats (int): Points measured. (Default to be 20)
+    - square_wave (boolean): Reverse the current within the list. (Default to be on)
+
+    Returns:
+    - CalibrationPoint: The setting with its noise and time per point.
+
+    Raises:
+    - Exception: If any issues with communication or data retrieval occur.
+    """
+    if square_wave == True:
+        currents = np.repeat([curr, -curr], cycle_length)
+    else:
+        currents = np.repeat(curr, cycle_length)
+    sourcemeter.NPLC(nplc)
+    sourcemeter.source_list_I(currents)
+    # The first point also carries the settings
+    sourcemeter.read_buffer()
+    resistances = []
+    start = time.perf_counter()
+    for i in range(repeats):
+        resistances.append(differential_volt(sourcemeter.read_buffer(), currents)/curr)
+    elapsed = time.perf_counter() - start
+    return CalibrationPoint(nplc, cycle_length, float(np.mean(resistances)),
+                            float(np.std(resistances, ddof=1)), elapsed/repeats)
+
+
+def calibrate(sourcemeter, curr, nplcs=NPLC_GRID, cycle_lengths=CYCLE_LENGTH_GRID, repeats=20, square_wave=True):
+    """
+    Measure every combination of NPLC and cycle length, at the present field.
+
+    Parameters:
+    - sourcemeter (Agilent2400_SourceMeter): The sourcemeter, connected with its output on.
+    - curr (float): Sample current(A).
+    - nplcs (list of float): NPLC values. (Default to be NPLC_GRID)
+    - cycle_lengths (list of int): Cycle lengths. (Default to be CYCLE_LENGTH_GRID)
+    - repeats (int): Points measured per setting. (Default to be 20)
+    - square_wave (boolean): Reverse the current within the list. (Default to be on)
+
+    Returns:
+    - list of CalibrationPoint: One per setting.
+
+    Raises:
+    - Exception: If any issues with communication or data retrieval occur.
+    """
+    return [measure_setting(sourcemeter, nplc, cycle_length, curr, repeats, square_wave)
+            for nplc in nplcs for cycle_length in cycle_lengths]
+
+
+def pareto_front(points):
+    """
+    Return the settings no other setting beats in both noise and time, fastest first.
+    """
+    front = [p for p in points if not any(q.dominates(p) for q in points)]
+    return sorted(front, key=lambda p: p.time_per_point)
+
+
+def choose(points, resolution):
+    """
+    Return the fastest setting whose noise meets the target resolution.
+
+    Parameters:
+    - points (list of CalibrationPoint): From calibrate().
+    - resolution (float): Largest accepted noise(Ohm).
+
+    Returns:
+    - CalibrationPoint: The chosen setting.
+
+    Raises:
+    - Exception: If no setting meets the resolution.
+    """
+    meeting = [p for p in points if p.noise <= resolution]
+    if not meeting:
+        best = min(points, key=lambda p: p.noise)
+        raise Exception(f"choose: No setting reaches {resolution} Ohm, the best is {best}")
+    return min(meeting, key=lambda p: p.time_per_point)
+
+
+def save_setting(sample, point, resolution=None, path=SETTINGS_FILE):
+    """
+    Store the chosen setting of a sample, keeping those of other samples.
+
+    Parameters:
+    - sample (str): Name of the sample.
+    - point (CalibrationPoint): The chosen setting.
+    - resolution (float): Target resolution(Ohm) it was chosen for. (Default to be None)
+    - path (str): JSON file of the settings. (Default to be SETTINGS_FILE)
+    """
+    settings = {}
+    if os.path.exists(path):
+        with open(path) as fp:
+            settings = json.load(fp)
+    settings[sample] = {"nplc": point.nplc, "cycle_length": int(point.cycle_length),
+                        "resistance": point.resistance, "noise": point.noise,
+                        "time_per_point": point.time_per_point, "resolution": resolution,
+                        "calibrated": time.strftime("%Y-%m-%d %H:%M:%S")}
+    with open(path, "w") as fp:
+        json.dump(settings, fp, indent=1)
+
+
+def load_setting(sample, path=SETTINGS_FILE):
+    """
+    Return the stored setting of a sample as a dict with "nplc" and
+    "cycle_length", or None if the sample was not calibrated.
+    """
+    if sample is None or not os.path.exists(path):
+        return None
+    with open(path) as fp:
+        return json.load(fp).get(sample)
@@ -25,7 +25,7 @@
 import logging
 
 from pymeasure.instruments import Instrument
-from pymeasure.instruments.validators import truncated_range
+from pymeasure.instruments.validators import truncated_range, strict_discrete_set
 
 from pymeasure.adapters import VISAAdapter
 
@@ -78,7 +78,7 @@ class Agilent6613C(Instrument):
     )
 
     output_relay_polarity = Instrument.control(
-        "OUTP:REL:POL?", "OUTP:REL:POL %d",
+        "OUTP:REL:POL?", "OUTP:REL:POL %s",
         """ A boolean property that controls whether the output relay polarity is reversed, takes
         values True or False. When the output relay polarity is reversed, the direction of the current will
         be reversed, that is, positive current becomes negative current. """,
@@ -144,16 +144,23 @@ class Agilent6613C(Instrument):
         configuration of the instrument. """
         self.write("OUTP OFF")
         
-    def output_current(self, curr):
-            self.output_relay = True
-        if -max(voltage_range) <= curr < min(voltage_range):
-            self.output_relay_polarity = True
-        elif min(voltage_range) <= curr <= max(voltage_range):
-            self.output_relay_polarity = False
-        else:
+    def output_current_relay(self, curr, reverse=None):
+        """ Sets the output current in Amps, using the output relay to source
+        negative currents: the polarity is reversed for negative values and the
+        magnitude is written to :attr:`~.Agilent6613C.output_current`.
+
+        :param curr: A current in Amps, between -1.05 and 1.05 A
+        :param reverse: The relay polarity to use, e.g. from a sweep plan, which
+                        matters for a zero current. Defaults to reversed for
+                        negative currents.
+        """
+        if not -max(self.current_range) <= curr <= max(self.current_range):
             raise ValueError('Value of {:g} is not in range [{:g},{:g}]'.format(
-            curr, min(voltage_range), max(voltage_range)
-            
-    def output_voltage(self, curr):
-        if min(voltage_range) <= volt <= max(voltage_range):
-            
\ No newline at end of file
+                curr, -max(self.current_range), max(self.current_range)))
+        if reverse is None:
+            reverse = curr < 0
+        elif curr != 0 and reverse != (curr < 0):
+            raise ValueError('Relay polarity does not match the sign of {:g} A'.format(curr))
+        self.output_relay = True
+        self.output_relay_polarity = reverse
+        self.output_current = abs(curr)
@@ -26,6 +26,7 @@ import logging
 from time import sleep, time
 
 import numpy as np
+from pyvisa import constants
 
 from pymeasure.instruments import Instrument
 from pymeasure.instruments.validators import truncated_range
@@ -35,10 +36,39 @@ log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
 
+def read_block(instrument, dtype="<f4", terminated=True):
+    """ Reads an IEEE-488.2 arbitrary block from the instrument into a
+    numpy array. The header is read first so that the payload is read with
+    its exact length, even if it contains newline bytes.
+
+    :param instrument: The instrument, after the query has been written.
+    :param dtype: The numpy type of the values, including the byte order.
+    :param terminated: Whether a newline follows the block.
+    """
+    header = instrument.read_bytes(2)
+    if header[:1] != b"#" or not header[1:2].isdigit():
+        raise ValueError("Invalid binary block header: %r" % header)
+    digits = int(header[1:2])
+    if digits == 0:
+        # Indefinite length block, ends with the message terminator
+        payload = instrument.read_bytes(-1)
+        if payload.endswith(b"\n") and len(payload) % np.dtype(dtype).itemsize:
+            payload = payload[:-1]
+    else:
+        length = int(instrument.read_bytes(digits))
+        payload = instrument.read_bytes(length) if length else b""
+        if terminated:
+            instrument.read_bytes(1)
+    return np.frombuffer(payload, dtype=dtype)
+
+
 class KeithleyBuffer:
     """ Implements the basic buffering capability found in
     many Keithley instruments. """
 
+    #: Buffers of this many points or more are read as binary blocks
+    binary_threshold = 100
+
     buffer_points = Instrument.control(
         ":TRAC:POIN?", ":TRAC:POIN %d",
         """ An integer property that controls the number of buffer points. This
@@ -77,12 +107,40 @@ class KeithleyBuffer:
         returns early if the :code:`should_stop` function returns True or
         the timeout is reached before the buffer is full.
 
+        The wait is driven by the service request that :meth:`config_buffer`
+        enables for a full buffer, so it returns as soon as the buffer fills.
+        Adapters without VISA events fall back to polling the status byte.
+
         :param should_stop: A function that returns True when this function should return early
         :param timeout: A time in seconds after which this function should return early
-        :param interval: A time in seconds for how often to check if the buffer is full
+        :param interval: A time in seconds for how often to check :code:`should_stop`
+                         (or, when polling, if the buffer is full)
         """
-        # TODO: Use SRQ initially instead of constant polling
-        # self.adapter.wait_for_srq()
+        connection = getattr(self.adapter, "connection", None)
+        event = constants.EventType.service_request
+        mechanism = constants.EventMechanism.queue
+        try:
+            connection.enable_event(event, mechanism)
+        except Exception:
+            log.debug("Service requests unavailable, polling for a full buffer")
+            self._poll_for_buffer(should_stop, timeout, interval)
+            return
+        try:
+            t = time()
+            # The serial poll also clears the request once the buffer is full
+            while not connection.read_stb() & 1:
+                if should_stop():
+                    return
+                remaining = timeout - (time() - t)
+                if remaining <= 0:
+                    raise Exception("Timed out waiting for Keithley buffer to fill.")
+                connection.wait_on_event(event, int(min(interval, remaining)*1000),
+                                         capture_timeout=True)
+        finally:
+            connection.discard_events(event, mechanism)
+            connection.disable_event(event, mechanism)
+
+    def _poll_for_buffer(self, should_stop, timeout, interval):
         t = time()
         while not self.is_buffer_full():
             sleep(interval)
@@ -93,7 +151,18 @@ class KeithleyBuffer:
 
     @property
     def buffer_data(self):
-        """ Returns a numpy array of values from the buffer. """
+        """ Returns a numpy array of values from the buffer. Buffers of
+        :attr:`binary_threshold` points or more are transferred as
+        little-endian single precision binary blocks, the format is set back
+        to ASCII afterwards. """
+        if self.buffer_points >= self.binary_threshold:
+            self.write(":FORM:DATA SREAL;:FORM:BORD SWAP")
+            try:
+                self.write(":TRAC:DATA?")
+                data = read_block(self, "<f4").astype(np.float64)
+            finally:
+                self.write(":FORM:DATA ASCII")
+            return data
         self.write(":FORM:DATA ASCII")
         return np.array(self.values(":TRAC:DATA?"), dtype=np.float64)
 
@@ -23,6 +23,7 @@
 #
 
 import logging
+import re
 import time
 
 import numpy as np
@@ -30,7 +31,7 @@ import numpy as np
 from pymeasure.instruments import Instrument, RangeException
 from pymeasure.instruments.validators import truncated_range, strict_discrete_set
 
-from .buffer import KeithleyBuffer
+from .buffer import KeithleyBuffer, read_block
 
 
 log = logging.getLogger(__name__)
@@ -518,29 +519,115 @@ class Keithley2400(KeithleyBuffer, Instrument):
         message = err[1].replace('"', '')
         return (code, message)
 
+    def error_available(self):
+        """ Returns True if the error available bit of the status byte is
+        set. The status byte is read by serial poll where the adapter
+        supports it, which costs no message round trip. """
+        try:
+            status = self.adapter.connection.read_stb()
+        except AttributeError:
+            status = int(self.ask("*STB?"))
+        return bool(status & 4)
+
     def check_errors(self):
-        """ Logs any system errors reported by the instrument.
+        """ Logs any system errors reported by the instrument. The error
+        queue is only read when the status byte shows an error, and then
+        in one :code:`:SYST:ERR:ALL?` burst instead of one round trip per
+        error. A serial poll may run ahead of the command being parsed, in
+        which case its error is reported by the next call.
+
+        :return: A list of (code, message) tuples, oldest first.
         """
-        code, message = self.error
-        while code != 0:
-            t = time.time()
+        if not self.error_available():
+            return []
+        response = self.ask(":SYST:ERR:ALL?")
+        errors = [(int(code), message) for code, message
+                  in re.findall(r'([-+]?\d+)\s*,\s*"([^"]*)"', response) if int(code) != 0]
+        for code, message in errors:
             log.info("Keithley 2400 reported error: %d, %s" % (code, message))
-            code, message = self.error
-            if (time.time() - t) > 10:
-                log.warning("Timed out for Keithley 2400 error retrieval.")
+        return errors
 
     def reset(self):
         """ Resets the instrument and clears the queue.  """
         self.write("status:queue:clear;*RST;:stat:pres;:*CLS;")
 
+    #: Run ramps as a staircase sweep on the instrument where possible,
+    #: see :meth:`~.Keithley2400.ramp_to_current`
+    hardware_ramp = True
+
+    def _sweep_source(self, function, target, steps, pause):
+        """ Runs a linear ramp of the source level to the target as one
+        :code:`SOUR:SWE` staircase sweep and leaves the source fixed at the
+        target. Each step measures once, so the source delay is the pause
+        less the integration time. The target is also made the bias level
+        the 2400 returns to when a sweep ends, so the output stays there
+        instead of dropping back to the start. Settings changed for the
+        sweep are restored in the same program message.
+
+        Nothing is changed, and False is returned, unless the sweep is safe
+        to run: the source function matches, the output is on with auto
+        output-off disabled, the arm and trigger sources are immediate and
+        the buffer is not being filled.
+
+        :param function: 'CURR' or 'VOLT'
+        :return: True if the ramp ran on the instrument.
+        """
+        state = self.ask(":SOUR:FUNC?;:OUTP?;:SOUR:CLE:AUTO?;:ARM:SOUR?;:TRIG:SOUR?;"
+                         ":TRAC:FEED:CONT?;:ARM:COUN?;:TRIG:COUN?;:SOUR:DEL?;:SOUR:DEL:AUTO?;"
+                         ":SOUR:%s:MODE?;:SOUR:%s?;:SENS:CURR:NPLC?;:SYST:LFR?;"
+                         ":SOUR:SWE:RANG?;:SOUR:SWE:SPAC?;:SOUR:SWE:POIN?" % (function, function))
+        values = [v.strip().strip('"').upper() for v in state.strip().split(";")]
+        if len(values) != 17:
+            return False
+        (source, output, auto_off, arm_source, trigger_source, feed, arm_count,
+         trigger_count, delay, delay_auto, mode, level, nplc, line_frequency,
+         ranging, spacing, points) = values
+        if (not source.startswith(function) or int(float(output)) != 1 or int(float(auto_off)) != 0
+                or not arm_source.startswith("IMM") or not trigger_source.startswith("IMM")
+                or not feed.startswith("NEV")):
+            return False
+        # The 2400 sweeps 2 to 2500 points
+        steps = min(max(int(steps), 2), 2500)
+        step_delay = max(pause - float(nplc) / float(line_frequency), 0)
+        restore_delay = ":SOUR:DEL:AUTO 1" if int(float(delay_auto)) else ":SOUR:DEL %s" % delay
+        command = (
+            ":SOUR:{f}:STAR {start};:SOUR:{f}:STOP {stop:g};:SOUR:SWE:POIN {steps:d};"
+            ":SOUR:SWE:SPAC LIN;:SOUR:SWE:RANG BEST;:SOUR:DEL {pause:g};"
+            ":ARM:COUN 1;:TRIG:COUN {steps:d};:SOUR:{f}:MODE SWE;"
+            # In sweep mode the source level is the bias the output returns to after the sweep
+            ":SOUR:{f} {stop:g};:INIT;*WAI;:SOUR:{f}:MODE {mode};"
+            ":SOUR:SWE:RANG {ranging};:SOUR:SWE:SPAC {spacing};:SOUR:SWE:POIN {points};"
+            ":ARM:COUN {arm};:TRIG:COUN {trigger};{delay};*OPC?"
+        ).format(f=function, start=level, stop=target, steps=steps, pause=step_delay,
+                 mode=mode, ranging=ranging, spacing=spacing, points=points,
+                 arm=arm_count, trigger=trigger_count, delay=restore_delay)
+        connection = getattr(self.adapter, "connection", None)
+        timeout = getattr(connection, "timeout", None)
+        try:
+            if timeout is not None:
+                # Each step takes the pause plus one measurement of up to 10 NPLC
+                connection.timeout = max(timeout, (steps * (pause + 0.2) + 2) * 1000)
+            self.ask(command)
+        finally:
+            if timeout is not None:
+                connection.timeout = timeout
+        self.check_errors()
+        return True
+
     def ramp_to_current(self, target_current, steps=30, pause=20e-3):
         """ Ramps to a target current from the set current value over
         a certain number of linear steps, each separated by a pause duration.
+        The ramp runs as one staircase sweep on the instrument, without a
+        message per step; while the instrument is not free to sweep (see
+        :meth:`~.Keithley2400._sweep_source`), or with :attr:`hardware_ramp`
+        off, it is stepped with one write per step instead.
 
         :param target_current: A current in Amps
         :param steps: An integer number of steps
         :param pause: A pause duration in seconds to wait between steps
         """
+        if self.hardware_ramp and self._sweep_source("CURR", target_current, steps, pause):
+            return
         currents = np.linspace(
             self.source_current,
             target_current,
@@ -553,11 +640,14 @@ class Keithley2400(KeithleyBuffer, Instrument):
     def ramp_to_voltage(self, target_voltage, steps=30, pause=20e-3):
         """ Ramps to a target voltage from the set voltage value over
         a certain number of linear steps, each separated by a pause duration.
+        Runs on the instrument like :meth:`~.Keithley2400.ramp_to_current`.
 
         :param target_voltage: A voltage in Amps
         :param steps: An integer number of steps
         :param pause: A pause duration in seconds to wait between steps
         """
+        if self.hardware_ramp and self._sweep_source("VOLT", target_voltage, steps, pause):
+            return
         voltages = np.linspace(
             self.source_voltage,
             target_voltage,
@@ -705,43 +795,130 @@ class Keithley2400(KeithleyBuffer, Instrument):
     def status(self):
         return self.ask("status:queue?;")
 
-    def RvsI(self, startI, stopI, stepI, compliance, delay=10.0e-3, backward=False):
+    #: Points per chunk of :meth:`~.Keithley2400.sweep_chunks`, at most the
+    #: 2500 points the 2400 sweeps at once
+    sweep_chunk = 2500
+    #: Values per :code:`SOUR:LIST` command
+    list_limit = 100
+
+    def sweep_chunks(self, currents, compliance, delay=10.0e-3, chunk=None):
+        """ Sources a list of currents of any length as consecutive sweeps
+        of at most :attr:`sweep_chunk` points, and yields the results chunk
+        by chunk. Evenly spaced chunks run as a :code:`SOUR:SWE` staircase,
+        others as a :code:`SOUR:LIST` sent in segments of :attr:`list_limit`
+        values. Each chunk is read as a binary block; the next chunk is
+        started before the previous one is decoded and yielded, so the
+        instrument measures while the results are processed, and only one
+        chunk is held in memory. Between chunks, and after the last one, the
+        output holds the last current sourced, in fixed mode at the end.
+
+        :param currents: The currents in Amps, in order
+        :param compliance: Voltage compliance in Volts
+        :param delay: Source delay of each point in seconds
+        :param chunk: Points per chunk, defaults to :attr:`sweep_chunk`
+        :return: A generator of numpy arrays with one row per point: the
+                 set current followed by the elements of :code:`FORM:ELEM`.
+        """
+        currents = np.asarray(currents, dtype=float).ravel()
+        num = len(currents)
+        chunk = min(max(int(chunk or self.sweep_chunk), 1), 2500)
+        currRange = 1.2 * np.max(np.abs(currents)) if num else 0
+        elements = len(self.ask(":FORM:ELEM?").split(","))
+        self.write(":SENS:VOLT:PROT %g;:SOUR:DEL %g;:SOUR:CURR:RANG %g;:SOUR:SWE:RANG FIX;"
+                   ":SOUR:SWE:SPAC LIN;:FORM:DATA SREAL;:FORM:BORD SWAP"
+                   % (compliance, delay, currRange))
+        self.enable_source()
+        connection = getattr(self.adapter, "connection", None)
+        timeout = getattr(connection, "timeout", None)
+        pending = None
+        try:
+            for first in range(0, num + chunk, chunk):
+                # The previous chunk has to be read before the next message
+                raw = read_block(self, "<f4") if pending is not None else None
+                part = currents[first:first + chunk]
+                if len(part):
+                    if timeout is not None:
+                        # Each point takes the delay plus one measurement of up to 10 NPLC
+                        connection.timeout = max(timeout, (len(part) * (delay + 0.2) + 2) * 1000)
+                    self.write(self._sweep_command(part) + ";:TRIG:COUN %d;:READ?" % len(part))
+                previous, pending = pending, (part if len(part) else None)
+                if raw is not None:
+                    yield np.column_stack((previous, raw.astype(np.float64).reshape(len(previous), elements)))
+        finally:
+            if pending is not None:
+                # Closed early, drop the response of the running chunk
+                if connection is not None and hasattr(connection, "clear"):
+                    connection.clear()
+                else:
+                    read_block(self, "<f4")
+            if timeout is not None:
+                connection.timeout = timeout
+            # The output stays at the last current sourced
+            self.write(":FORM:DATA ASCII;:SOUR:CURR:MODE FIX")
+        self.check_errors()
+
+    def _sweep_command(self, part):
+        """ Returns the commands that source the currents of one chunk. The
+        bias level, which the output returns to when the chunk ends, is its
+        last current, so the output holds there until the next chunk starts.
+        """
+        # In sweep and list mode the source level is the bias
+        bias = ";:SOUR:CURR %.10g" % part[-1]
+        steps = np.diff(part)
+        if len(part) < 3 or np.allclose(steps, steps[0], rtol=1e-6, atol=1e-15):
+            # The 2400 sweeps 2 points or more, a single point is the first of two
+            return (":SOUR:CURR:MODE SWE;:SOUR:CURR:STAR %.10g;:SOUR:CURR:STOP %.10g;:SOUR:SWE:POIN %d"
+                    % (part[0], part[-1], max(len(part), 2))) + bias
+        segments = [",".join(map("%.10g".__mod__, part[i:i + self.list_limit].tolist()))
+                    for i in range(0, len(part), self.list_limit)]
+        return ":SOUR:CURR:MODE LIST;:SOUR:LIST:CURR " + ";:SOUR:LIST:CURR:APP ".join(segments) + bias
+
+    def RvsI_chunks(self, startI, stopI, stepI, compliance, delay=10.0e-3, backward=False,
+                    chunk=None):
+        """ Runs a linear current sweep of any length chunk by chunk, see
+        :meth:`~.Keithley2400.sweep_chunks`.
+
+        :param startI: First current in Amps
+        :param stopI: Last current in Amps
+        :param stepI: Current step in Amps
+        :param compliance: Voltage compliance in Volts
+        :param delay: Source delay of each point in seconds
+        :param backward: Sweep from stopI to startI
+        :param chunk: Points per chunk, defaults to :attr:`sweep_chunk`
+        :return: A generator of numpy arrays, as from :meth:`~.Keithley2400.sweep_chunks`.
+        """
         num = int(float(stopI - startI) / float(stepI)) + 1
-        currRange = 1.2 * max(abs(stopI), abs(startI))
-        # self.write(":SOUR:CURR 0.0")
-        self.write(":SENS:VOLT:PROT %g" % compliance)
-        self.write(":SOUR:DEL %g" % delay)
-        self.write(":SOUR:CURR:RANG %g" % currRange)
-        self.write(":SOUR:SWE:RANG FIX")
-        self.write(":SOUR:CURR:MODE SWE")
-        self.write(":SOUR:SWE:SPAC LIN")
-        self.write(":SOUR:CURR:STAR %g" % startI)
-        self.write(":SOUR:CURR:STOP %g" % stopI)
-        self.write(":SOUR:CURR:STEP %g" % stepI)
-        self.write(":TRIG:COUN %d" % num)
         if backward:
             currents = np.linspace(stopI, startI, num)
-            self.write(":SOUR:SWE:DIR DOWN")
         else:
             currents = np.linspace(startI, stopI, num)
-            self.write(":SOUR:SWE:DIR UP")
-        self.connection.timeout = 30.0
-        self.enable_source()
-        data = self.values(":READ?")
+        return self.sweep_chunks(currents, compliance, delay=delay, chunk=chunk)
 
-        self.check_errors()
-        return zip(currents, data)
+    def RvsI(self, startI, stopI, stepI, compliance, delay=10.0e-3, backward=False):
+        """ Runs a current sweep, see :meth:`~.Keithley2400.RvsI_chunks`.
+
+        :return: (current, first reading) pairs.
+        """
+        data = np.concatenate(list(self.RvsI_chunks(startI, stopI, stepI, compliance,
+                                                    delay=delay, backward=backward)))
+        return zip(data[:, 0], data[:, 1])
 
     def RvsIaboutZero(self, minI, maxI, stepI, compliance, delay=10.0e-3):
-        data = []
-        data.extend(self.RvsI(minI, maxI, stepI, compliance=compliance, delay=delay))
-        data.extend(self.RvsI(minI, maxI, stepI, compliance=compliance, delay=delay, backward=True))
+        """ Sweeps from minI to maxI and back, then the same at negative currents.
+
+        :return: A numpy array with one row per point, as from
+                 :meth:`~.Keithley2400.RvsI_chunks`.
+        """
+        blocks = []
+        blocks.extend(self.RvsI_chunks(minI, maxI, stepI, compliance=compliance, delay=delay))
+        blocks.extend(self.RvsI_chunks(minI, maxI, stepI, compliance=compliance, delay=delay,
+                                       backward=True))
         self.disable_source()
-        data.extend(self.RvsI(-minI, -maxI, -stepI, compliance=compliance, delay=delay))
-        data.extend(self.RvsI(-minI, -maxI, -stepI, compliance=compliance, delay=delay,
-                              backward=True))
+        blocks.extend(self.RvsI_chunks(-minI, -maxI, -stepI, compliance=compliance, delay=delay))
+        blocks.extend(self.RvsI_chunks(-minI, -maxI, -stepI, compliance=compliance, delay=delay,
+                                       backward=True))
         self.disable_source()
-        return data
+        return np.concatenate(blocks)
 
     def use_rear_terminals(self):
         """ Enables the rear terminals for measurement, and
@@ -31,7 +31,10 @@ from pymeasure.instruments import Instrument, RangeException
 from pymeasure.instruments.validators import truncated_range, strict_discrete_set
 #from pymeasure.instruments import Instrument, RangeException
 #from pymeasure.instruments.validators import truncated_range, strict_discrete_set
-import zhinst.core
+try:
+    import zhinst.core
+except ImportError:
+    zhinst = None
 
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
@@ -54,9 +57,18 @@ class MFLI(Instrument):
     num_bursts = int(np.ceil(total_duration / burst_duration))
     
     
-    def __init__(self):
-        # Create an API session to the Data Server.
-        self.daq = zhinst.core.ziDAQServer(self.server_host, self.server_port, self.api_level)
+    def __init__(self, daq=None):
+        """ Connects to the Data Server, or uses the given API session
+        (e.g. a simulated one) instead.
+
+        :param daq: An object with the ziDAQServer interface, or None
+        """
+        if daq is None:
+            if zhinst is None:
+                raise ImportError("zhinst is required to connect to the MFLI Data Server")
+            # Create an API session to the Data Server.
+            daq = zhinst.core.ziDAQServer(self.server_host, self.server_port, self.api_level)
+        self.daq = daq
         # Establish a connection between Data Server and Device.
         self.daq.connectDevice(self.device_id, self.interface)
         
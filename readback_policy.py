@@ -0,0 +1,156 @@
+"""
+Readback policies for the magnet supply current.
+
+MEAS:CURR? digitizes SENS:SWE:POIN samples per reading, which makes it one
+of the slowest commands of a point. A policy decides per point whether the
+current is measured, and with how many sweep points, or inferred from the
+setpoint and the offset of the measured points around it:
+
+    supply.readback_policy = EveryNth(5)
+    programs = compile_sweep(plan, supply.cached_state(), policy=EveryNth(5))
+    ...
+    currents = infer(setpoints, currents, measured)
+
+Every sample keeps a measured flag, so inferred values can be told apart.
+"""
+import numpy as np
+
+# Sweep points of a full readback, as set by Agilent6613C_PowerSupply.initialize()
+FULL_SWEEP_POINTS = 256
+
+
+class ReadbackPolicy:
+    def __init__(self, sweep_points=FULL_SWEEP_POINTS):
+        """
+        Measure every point. Base of the other policies.
+
+        Parameters:
+        - sweep_points (int): SENS:SWE:POIN of each readback. (Default to be 256)
+        """
+        self.sweep_points = sweep_points
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the points seen so far, before a new sweep.
+        """
+        self.index = 0
+        self.last_setpoint = None
+        self.last_rel = None
+        self.offset = 0.0
+
+    def decide(self, setpoint, rel, force=False):
+        """
+        Decide how the current of the next point is obtained.
+
+        Parameters:
+        - setpoint (float): Signed current setpoint(A) of the point.
+        - rel (int/boolean): Relay polarity of the point.
+        - force (boolean): The point has to be measured, e.g. after a settle wait. (Default to be off)
+
+        Returns:
+        - int: SENS:SWE:POIN to measure with, or None to infer the current.
+        """
+        points = self._decide(setpoint, rel)
+        if points is None and force:
+            points = self.sweep_points
+        if points is not None:
+            self.last_setpoint = setpoint
+            self.last_rel = rel
+        self.index += 1
+        return points
+
+    def _decide(self, setpoint, rel):
+        return self.sweep_points
+
+    def observe(self, setpoint, value):
+        """
+        Keep the offset of a measured point for estimate().
+        """
+        self.offset = value - setpoint
+
+    def estimate(self, setpoint):
+        """
+        Return the current inferred for a setpoint from the latest measured offset.
+        """
+        return setpoint + self.offset
+
+
+class EveryNth(ReadbackPolicy):
+    def __init__(self, n=5, sweep_points=FULL_SWEEP_POINTS):
+        """
+        Measure every nth point and infer the points in between; infer()
+        interpolates them between their measured neighbours afterwards.
+
+        Parameters:
+        - n (int): Measure one point in n. (Default to be 5)
+        """
+        self.n = n
+        super().__init__(sweep_points)
+
+    def _decide(self, setpoint, rel):
+        return self.sweep_points if self.index % self.n == 0 else None
+
+
+class OnChange(ReadbackPolicy):
+    def __init__(self, threshold=0.005, sweep_points=FULL_SWEEP_POINTS):
+        """
+        Measure only once the setpoint has moved more than threshold from the
+        last measured point, or the relay polarity changed.
+
+        Parameters:
+        - threshold (float): Setpoint change(A) that calls for a readback. (Default to be 0.005)
+        """
+        self.threshold = threshold
+        super().__init__(sweep_points)
+
+    def _decide(self, setpoint, rel):
+        if self.last_setpoint is None or rel != self.last_rel \
+                or abs(setpoint - self.last_setpoint) > self.threshold:
+            return self.sweep_points
+        return None
+
+
+class ReducedPoints(ReadbackPolicy):
+    def __init__(self, points=32, threshold=0.005, sweep_points=FULL_SWEEP_POINTS):
+        """
+        Measure every point, with a short digitizing sweep while the setpoint
+        moves in small steps and a full one after a large step or a relay flip.
+
+        Parameters:
+        - points (int): SENS:SWE:POIN of the short readbacks. (Default to be 32)
+        - threshold (float): Setpoint step(A) that calls for a full readback. (Default to be 0.005)
+        """
+        self.points = points
+        self.threshold = threshold
+        super().__init__(sweep_points)
+
+    def _decide(self, setpoint, rel):
+        if self.last_setpoint is None or rel != self.last_rel \
+                or abs(setpoint - self.last_setpoint) > self.threshold:
+            return self.sweep_points
+        return self.points
+
+
+def infer(setpoints, values, measured):
+    """
+    Replace the inferred values of a sweep by their setpoints plus the offset
+    (value - setpoint) interpolated between the nearest measured points.
+
+    Parameters:
+    - setpoints (list/numpy.ndarray): Signed setpoints(A).
+    - values (list/numpy.ndarray): Currents(A), measured or estimated.
+    - measured (list/numpy.ndarray): True where the value was measured.
+
+    Returns:
+    - numpy.ndarray: The values, with the inferred ones interpolated.
+    """
+    setpoints = np.asarray(setpoints, dtype=float)
+    values = np.array(values, dtype=float)
+    measured = np.asarray(measured, dtype=bool)
+    if not measured.any() or measured.all():
+        return values
+    index = np.arange(len(values))
+    offsets = values[measured] - setpoints[measured]
+    values[~measured] = setpoints[~measured] + np.interp(index[~measured], index[measured], offsets)
+    return values
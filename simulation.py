@@ -0,0 +1,1250 @@
+"""
+Simulated GPIB bench for developing and benchmarking off-hardware.
+
+The models follow the instruments used on the magnetotransport setup:
+    GPIB0::5   Agilent 6613C power supply driving the X electromagnet
+    GPIB0::9   Agilent 6613C power supply driving the Y electromagnet
+    GPIB0::10  Agilent 34401A multimeter reading the Helmholtz coil shunt
+    GPIB0::19  Agilent 33220A function generator driving the Helmholtz coil
+    GPIB0::20  Keithley 2400 sourcemeter biasing the MTJ
+    GPIB0::26  Keithley 182 nanovoltmeter
+and an MFLI lock-in amplifier reached through SimulatedDAQServer.
+
+Every instrument processes messages with a realistic latency, answers queries
+only once its conversion is over, and shares one bus lock with the others, so
+timings measured against the bench are comparable with the real setup.
+
+Usage:
+    bench = simulation.enable()                      # MeasurementDevice and the scripts
+    keithley = Keithley2400(bench.adapter(20))       # pymeasure drivers
+    lockin = MFLI(daq=SimulatedDAQServer(bench))     # MFLI
+"""
+import math
+import re
+import threading
+import time
+from collections import deque
+import numpy as np
+import pyvisa
+
+try:
+    from pymeasure.adapters import Adapter
+except ImportError:
+    Adapter = object
+
+# Nodes that SCPI allows to be omitted
+OPTIONAL_NODES = {"IMM", "LEV", "AMPL", "SEQ", "DC"}
+
+
+def normalize_header(header):
+    """
+    Reduce a SCPI header to its canonical short form, e.g.
+    ":SOURce:CURRent:LEVel?" -> "SOUR:CURR?".
+
+    Parameters:
+    - header (str): The header of one command, without arguments.
+
+    Returns:
+    - str: The normalized header.
+    """
+    header = header.strip().lstrip(":").upper()
+    if header.startswith("*"):
+        return header
+    query = header.endswith("?")
+    nodes = []
+    for node in header.rstrip("?").split(":"):
+        name, suffix = re.match(r"([A-Z]*)(\d*)$", node).groups()
+        if len(name) > 4:
+            name = name[:3] if name[3] in "AEIOU" else name[:4]
+        if suffix == "1":
+            suffix = ""
+        node = name + suffix
+        if nodes and node in OPTIONAL_NODES:
+            continue
+        nodes.append(node)
+    return ":".join(nodes) + ("?" if query else "")
+
+
+def split_message(message):
+    """
+    Split a program message into (header, arguments) pairs.
+    """
+    commands = []
+    for command in message.strip().split(";"):
+        command = command.strip()
+        if not command:
+            continue
+        parts = command.split(None, 1)
+        commands.append((normalize_header(parts[0]), parts[1].strip() if len(parts) > 1 else ""))
+    return commands
+
+
+def parse_number(text, default=0.0):
+    """
+    Parse a SCPI numeric argument, ignoring units and mapping ON/OFF.
+    """
+    text = text.strip().strip('"').strip("'").upper()
+    if text in ("ON", "TRUE"):
+        return 1.0
+    if text in ("OFF", "FALSE"):
+        return 0.0
+    if text in ("DEF", "MIN", "MAX", ""):
+        return default
+    match = re.match(r"[-+]?(\d+\.?\d*|\.\d+)(E[-+]?\d+)?", text)
+    if match is None:
+        raise SimulationError(-104, "Data type error")
+    return float(match.group(0))
+
+
+def parse_list(text):
+    """
+    Parse a comma separated list of numeric arguments.
+    """
+    return [parse_number(i) for i in text.split(",") if i.strip()]
+
+
+class SimulationError(Exception):
+    """
+    Raised by a command handler to push an entry on the error queue.
+    """
+    def __init__(self, code, message):
+        super().__init__(code, message)
+        self.code = code
+        self.message = message
+
+
+class SimulatedMTJ:
+    def __init__(self):
+        """
+        Resistance of a magnetic tunnel junction versus in-plane field,
+        with a hysteretic free layer switching around the coercive field.
+        A transverse field Hy lowers the coercivity and closes the loop.
+        """
+        self.R_parallel = 2200.0        # Ohm
+        self.R_antiparallel = 5300.0    # Ohm
+        self.coercivity = 12.0          # G
+        self.width = 3.0                # G, width of the switching edge
+        self.anisotropy = 80.0          # G, transverse field closing the loop
+        self.offset = 2.0               # G, exchange bias shift
+        self.branch = 1                 # 1: came from positive saturation, -1: from negative
+
+    def _magnetization(self, hx, hy, branch):
+        hc = self.coercivity * max(0.0, 1 - (hy/self.anisotropy)**2)
+        return math.tanh((hx - self.offset + branch*hc) / self.width)
+
+    def _update_branch(self, hx, hy):
+        hc = self.coercivity * max(0.0, 1 - (hy/self.anisotropy)**2)
+        h = hx - self.offset
+        if h > hc + 3*self.width:
+            self.branch = 1
+        elif h < -hc - 3*self.width:
+            self.branch = -1
+
+    def resistance(self, hx, hy=0.0):
+        """
+        Return the resistance(Ohm) at the field, updating the magnetic history.
+        """
+        self._update_branch(hx, hy)
+        m = self._magnetization(hx, hy, self.branch)
+        return self.R_parallel + (self.R_antiparallel - self.R_parallel)*(1 - m)/2
+
+    def slope(self, hx, hy=0.0):
+        """
+        Return dR/dH(Ohm/G) at the field on the current branch, without
+        changing the magnetic history.
+        """
+        m = self._magnetization(hx, hy, self.branch)
+        return -(self.R_antiparallel - self.R_parallel)/2 * (1 - m**2) / self.width
+
+
+class WaitResponse:
+    def __init__(self, event_type, timed_out):
+        """
+        Result of SimulatedInstrument.wait_on_event, like pyvisa's WaitResponse.
+        """
+        self.event_type = event_type
+        self.timed_out = timed_out
+
+
+class SimulatedInstrument:
+    idn = "SIMULATED,INSTRUMENT,0,0"
+    command_latency = 0.001     # s to parse one program message
+    error_queue_all = False     # SYST:ERR:ALL? supported
+    srq_resolution = 0.0002     # s between checks of the SRQ condition
+
+    def __init__(self, bench, address):
+        """
+        Base class of a simulated message based instrument. It mimics the
+        part of the pyvisa resource interface used in this repository.
+
+        Parameters:
+        - bench (SimulatedBench): The bench the instrument is connected to.
+        - address (int): GPIB primary address.
+        """
+        self.bench = bench
+        self.address = address
+        self.resource_name = f"GPIB0::{address}::INSTR"
+        self.session = None
+        self.timeout = 2000
+        self.read_termination = None
+        self.write_termination = "\n"
+        self._lock = threading.RLock()
+        self.reset()
+
+    # --------------------------------------------------------------- state
+    def reset(self):
+        with self._lock:
+            self.errors = deque()
+            self.event_status = 0
+            self.event_enable = 0
+            self.service_enable = 0
+            self.settings = {}
+            self._output = bytearray()
+            self._ready_at = 0.0
+            self._busy_until = 0.0
+
+    def push_error(self, code, message):
+        self.errors.append((code, message))
+        if -199 <= code <= -100:
+            self.event_status |= 32
+        elif -299 <= code <= -200:
+            self.event_status |= 16
+        elif -499 <= code <= -400:
+            self.event_status |= 4
+        else:
+            self.event_status |= 8
+
+    def next_error(self):
+        if self.errors:
+            code, message = self.errors.popleft()
+            return f'{code:+d},"{message}"'
+        return '0,"No error"'
+
+    def summary_status(self):
+        """
+        Instrument specific status byte bits (bits 0, 1 and 7).
+        """
+        return 0
+
+    def status_byte(self):
+        status = self.summary_status()
+        if self.errors:
+            status |= 4
+        if self._output and self.bench.now() >= self._ready_at:
+            status |= 16
+        if self.event_status & self.event_enable:
+            status |= 32
+        if status & self.service_enable & ~64:
+            status |= 64
+        return status
+
+    # ------------------------------------------------------------ commands
+    def busy(self, seconds):
+        """
+        Add conversion time to the message being executed.
+        """
+        self._pending += seconds
+
+    def execute(self, header, args):
+        """
+        Execute one command, returning the response text of a query.
+        """
+        if header in ("*RST",):
+            self.reset()
+        elif header == "*CLS":
+            self.errors.clear()
+            self.event_status = 0
+        elif header == "*IDN?":
+            return self.idn
+        elif header == "*OPC?":
+            return "1"
+        elif header in ("*OPC", "*WAI"):
+            pass
+        elif header == "*ESR?":
+            status, self.event_status = self.event_status, 0
+            return str(status)
+        elif header == "*ESE":
+            self.event_enable = int(parse_number(args))
+        elif header == "*ESE?":
+            return str(self.event_enable)
+        elif header == "*SRE":
+            self.service_enable = int(parse_number(args))
+        elif header == "*SRE?":
+            return str(self.service_enable)
+        elif header == "*STB?":
+            return str(self.status_byte())
+        elif header in ("SYST:ERR?", "SYST:ERR:NEXT?", "STAT:QUE?", "STAT:QUE:NEXT?"):
+            return self.next_error()
+        elif header == "SYST:ERR:ALL?" and self.error_queue_all:
+            errors = [self.next_error() for i in range(len(self.errors))]
+            return ",".join(errors) or self.next_error()
+        elif header == "STAT:QUE:CLE":
+            self.errors.clear()
+        elif header == "STAT:PRES":
+            pass
+        else:
+            return self.execute_setting(header, args)
+
+    def execute_setting(self, header, args):
+        """
+        Store settings this model does not act on, and answer their queries.
+        """
+        if header.endswith("?"):
+            if header[:-1] in self.settings:
+                return self.settings[header[:-1]]
+            raise SimulationError(-113, "Undefined header")
+        self.settings[header] = args
+
+    # ----------------------------------------------------- pyvisa interface
+    def write(self, message, termination=None, encoding=None):
+        self.bench.transfer(len(message) + 1)
+        with self._lock:
+            now = self.bench.now()
+            if self._output:
+                self.push_error(-410, "Query INTERRUPTED")
+                self._output = bytearray()
+            self._pending = self.command_latency
+            replies = []
+            for header, args in split_message(message):
+                try:
+                    reply = self.execute(header, args)
+                except SimulationError as e:
+                    self.push_error(e.code, e.message)
+                    continue
+                if reply is not None:
+                    replies.append(reply)
+            self._busy_until = max(now, self._busy_until) + self._pending
+            if replies:
+                replies = [r if isinstance(r, bytes) else r.encode("ascii") for r in replies]
+                self._output = bytearray(b";".join(replies) + b"\n")
+                self._ready_at = self._busy_until
+        return len(message)
+
+    def write_raw(self, message):
+        return self.write(bytes(message).decode("ascii"))
+
+    def read_bytes(self, count=-1, chunk_size=None, break_on_termchar=False):
+        # A talker that is not ready holds the handshake, and with it the bus
+        with self.bench.bus:
+            deadline = self.bench.now() + self.timeout/1000.0
+            while True:
+                with self._lock:
+                    if self._output and self.bench.now() >= self._ready_at:
+                        break
+                    wait = (self._ready_at if self._output else deadline) - self.bench.now()
+                if self.bench.now() >= deadline:
+                    raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+                self.bench.sleep(min(max(wait, 0.0), deadline - self.bench.now()))
+            with self._lock:
+                if count is None or count < 0:
+                    count = len(self._output)
+                data = bytes(self._output[:count])
+                del self._output[:count]
+            self.bench.sleep(self.bench.byte_time * len(data))
+        return data
+
+    def read_raw(self, size=None):
+        return self.read_bytes(-1)
+
+    def read(self, termination=None, encoding=None):
+        text = self.read_raw().decode("ascii")
+        termination = termination or self.read_termination
+        if termination and text.endswith(termination):
+            text = text[:-len(termination)]
+        return text
+
+    def query(self, message, delay=None):
+        self.write(message)
+        if delay:
+            time.sleep(delay)
+        return self.read()
+
+    def read_stb(self):
+        self.bench.transfer(1)
+        with self._lock:
+            return self.status_byte()
+
+    def enable_event(self, event_type, mechanism, context=None):
+        self._events_enabled = True
+
+    def disable_event(self, event_type, mechanism):
+        self._events_enabled = False
+
+    def discard_events(self, event_type, mechanism):
+        pass
+
+    def wait_on_event(self, in_event_type, timeout, capture_timeout=False):
+        """
+        Wait for the instrument to request service, i.e. for bit 6 (RQS) of
+        its status byte, as a VISA service request event.
+        """
+        if not getattr(self, "_events_enabled", False):
+            raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_not_enabled)
+        deadline = self.bench.now() + timeout/1000.0
+        while True:
+            with self._lock:
+                requesting = self.status_byte() & 64
+            if requesting:
+                return WaitResponse(in_event_type, False)
+            if self.bench.now() >= deadline:
+                if capture_timeout:
+                    return WaitResponse(in_event_type, True)
+                raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+            # The SRQ line is sensed without any bus traffic
+            self.bench.sleep(min(self.srq_resolution, deadline - self.bench.now()))
+
+    def assert_trigger(self):
+        self.write("*TRG")
+
+    def clear(self):
+        with self._lock:
+            self._output = bytearray()
+
+    def open(self):
+        self.session = self.address
+
+    def close(self):
+        self.session = None
+
+
+class Simulated6613C(SimulatedInstrument):
+    idn = "HEWLETT-PACKARD,6613C,0,A.02.01"
+    command_latency = 0.004     # s, the 6613C parser is slow
+    coil_resistance = 45.0      # Ohm, sets the current reachable at each compliance voltage
+    step_tau = 0.002            # s, settling after a setpoint step
+    compliance_tau = 0.12       # s, settling after a compliance voltage change
+    relay_dead_time = 0.02      # s, output interrupted while the relay moves
+    relay_tau = 0.08            # s, settling once the relay has switched
+    sample_period = 15.6e-6     # s, digitizer sample period of MEAS
+    measure_overhead = 0.003    # s
+    noise = 20e-6               # A rms readback noise
+
+    def reset(self):
+        super().reset()
+        self.output = False
+        self.relay = False
+        self.polarity = "NORM"
+        self.voltage = 0.0
+        self.current = 0.0
+        self.sweep_points = 2048
+        self._segment = (0.0, 0.0, 0.0, self.step_tau)
+
+    def target(self):
+        if not self.output:
+            return 0.0
+        magnitude = min(self.current, self.voltage/self.coil_resistance)
+        return -magnitude if (self.relay and self.polarity == "REV") else magnitude
+
+    def output_current(self, t=None):
+        """
+        Return the signed current(A) through the magnet at time t.
+        """
+        t = self.bench.now() if t is None else t
+        start, i_start, target, tau = self._segment
+        if t < start:
+            return i_start
+        return target + (i_start - target)*math.exp(-(t - start)/tau)
+
+    def _retarget(self, tau, dead_time=0.0):
+        now = self.bench.now()
+        i_start = 0.0 if dead_time else self.output_current(now)
+        self._segment = (now + dead_time, i_start, self.target(), tau)
+
+    def _measure_time(self):
+        return self.sweep_points*self.sample_period + self.measure_overhead
+
+    def execute(self, header, args):
+        if header in ("OUTP", "OUTP:STAT"):
+            self.output = bool(parse_number(args))
+            self._retarget(self.step_tau)
+        elif header in ("OUTP?", "OUTP:STAT?"):
+            return str(int(self.output))
+        elif header == "OUTP:REL":
+            relay = bool(parse_number(args))
+            if relay != self.relay:
+                self.relay = relay
+                self._retarget(self.relay_tau, self.relay_dead_time)
+        elif header == "OUTP:REL?":
+            return str(int(self.relay))
+        elif header == "OUTP:REL:POL":
+            polarity = args.strip().upper()[:3]
+            polarity = "REV" if polarity in ("REV", "1") else "NORM"
+            if polarity != self.polarity:
+                self.polarity = polarity
+                if self.relay:
+                    self._retarget(self.relay_tau, self.relay_dead_time)
+        elif header == "OUTP:REL:POL?":
+            return self.polarity
+        elif header in ("VOLT", "SOUR:VOLT"):
+            volt = parse_number(args)
+            if not 0 <= volt <= 51:
+                raise SimulationError(-222, "Data out of range")
+            if volt != self.voltage:
+                self.voltage = volt
+                self._retarget(self.compliance_tau)
+        elif header in ("VOLT?", "SOUR:VOLT?"):
+            return f"{self.voltage:.6E}"
+        elif header in ("CURR", "SOUR:CURR"):
+            curr = parse_number(args)
+            if not 0 <= curr <= 1.1:
+                raise SimulationError(-222, "Data out of range")
+            self.current = curr
+            self._retarget(self.step_tau)
+        elif header in ("CURR?", "SOUR:CURR?"):
+            return f"{self.current:.6E}"
+        elif header == "SENS:SWE:POIN":
+            self.sweep_points = int(parse_number(args, 2048))
+        elif header == "SENS:SWE:POIN?":
+            return str(self.sweep_points)
+        elif header == "MEAS:CURR?":
+            duration = self._measure_time()
+            t = max(self.bench.now(), self._busy_until) + self._pending + duration/2
+            self.busy(duration)
+            reading = abs(self.output_current(t)) + self.bench.rng.normal(0, self.noise)
+            return f"{reading:.6E}"
+        elif header == "MEAS:VOLT?":
+            self.busy(self._measure_time())
+            return f"{min(abs(self.output_current())*self.coil_resistance, self.voltage):.6E}"
+        else:
+            return super().execute(header, args)
+
+
+class Simulated2400(SimulatedInstrument):
+    idn = "KEITHLEY INSTRUMENTS INC.,MODEL 2400,0,C32"
+    command_latency = 0.0005
+    line_frequency = 60
+    reading_overhead = 0.0012   # s per reading on top of the integration time
+    list_limit = 100            # values per SOUR:LIST command
+    memory_limit = 2500         # readings in the trace buffer
+    error_queue_all = True
+    voltage_noise = 2e-6        # V rms at NPLC 1
+    thermal_offset = 40e-6      # V, removed by current reversal
+
+    ELEMENTS = ("VOLT", "CURR", "RES", "TIME", "STAT")
+
+    def reset(self):
+        super().reset()
+        self.output = False
+        self.source_function = "VOLT"
+        self.source_mode = "FIX"
+        self.source_level = {"CURR": 0.0, "VOLT": 0.0}
+        self.source_list = []
+        self.sweep_start = {"CURR": 0.0, "VOLT": 0.0}
+        self.sweep_stop = {"CURR": 0.0, "VOLT": 0.0}
+        self.sweep_points = 2500
+        self.sweep_ranging = "BEST"
+        self.sweep_spacing = "LIN"
+        # Levels the output went through, to check what a device under test saw
+        self.output_levels = deque([0.0], maxlen=10000)
+        self.source_delay = 0.0     # s, the auto delay is part of reading_overhead
+        self.source_delay_auto = True
+        self.auto_output_off = False
+        self.arm_source = "IMM"
+        self.trigger_source = "IMM"
+        self.armed = 0              # arm cycles left waiting for a bus trigger
+        self.compliance = {"VOLT": 21.0, "CURR": 105e-6}
+        self.nplc = 1.0
+        self.elements = list(self.ELEMENTS)
+        self.data_format = "ASC"
+        self.byte_order = "NORM"
+        self.trigger_count = 1
+        self.arm_count = 1
+        self.buffer_points = 100
+        self.buffer_feed = "SENS"
+        self.buffer_control = "NEV"
+        self.buffer = []
+        self.calc3_format = "MEAN"
+        self.math_expressions = {}
+        self.math_name = None
+        self.math_selected = None
+        self.math_state = False
+        self.measurement_enable = 0
+        self.readings = np.zeros((0, len(self.ELEMENTS)))
+        self._acquired_at = 0.0
+        self._buffer_full_at = None
+        self._t0 = self.bench.now()
+
+    def summary_status(self):
+        status = 0
+        if self._buffer_full_at is not None and self.bench.now() >= self._buffer_full_at:
+            if self.measurement_enable & 512:
+                status |= 1
+        return status
+
+    def _source_values(self, count):
+        function = self.source_function
+        if self.source_mode == "LIST" and self.source_list:
+            values = [self.source_list[i % len(self.source_list)] for i in range(count)]
+        elif self.source_mode == "SWE":
+            # Linear staircase, repeated if the trigger count exceeds the sweep points
+            steps = np.linspace(self.sweep_start[function], self.sweep_stop[function], self.sweep_points)
+            values = [steps[i % len(steps)] for i in range(count)]
+        else:
+            values = [self.source_level[function]]*count
+        return np.array(values, dtype=float)
+
+    def _output_level(self, value):
+        if self.output and value != self.output_levels[-1]:
+            self.output_levels.append(float(value))
+
+    def _reading_time(self):
+        return self.nplc/self.line_frequency + self.reading_overhead + self.source_delay
+
+    def acquire(self, count=None):
+        """
+        Run one INIT: arm_count x trigger_count source-measure cycles, or count
+        cycles. Returns the readings and stores them in sample memory and the buffer.
+        """
+        if count is None:
+            count = self.arm_count*self.trigger_count
+        dt = self._reading_time()
+        start = max(self.bench.now(), self._busy_until) + self._pending
+        source = self._source_values(count)
+        if not self.output:
+            source = np.zeros(count)
+        for value in source:
+            self._output_level(value)
+        if self.source_mode != "FIX":
+            # A sweep or list ends at the bias level, the fixed source level
+            self._output_level(self.source_level[self.source_function])
+        readings = np.zeros((count, len(self.ELEMENTS)))
+        noise = self.voltage_noise/math.sqrt(max(self.nplc, 0.01))
+        for k in range(count):
+            t = start + (k + 0.5)*dt
+            if self.source_function == "CURR":
+                i = source[k]
+                v = i*self.bench.sample_resistance(t) + (self.thermal_offset if self.output else 0.0)
+                v += self.bench.rng.normal(0, noise)
+                v = float(np.clip(v, -self.compliance["VOLT"], self.compliance["VOLT"]))
+            else:
+                v = source[k]
+                i = v/self.bench.sample_resistance(t)
+            readings[k] = (v, i, v/i if i else 9.91e37, t - self._t0, 0)
+        self.busy(count*dt)
+        if self.auto_output_off:
+            self.output = False
+        self.readings = readings
+        self._acquired_at = start + count*dt
+        if self.buffer_control == "NEXT":
+            room = self.buffer_points - len(self.buffer)
+            if self.buffer_feed == "CALC":
+                self.buffer.extend(self.math(readings)[:room, np.newaxis])
+            else:
+                self.buffer.extend(readings[:room])
+            if len(self.buffer) >= self.buffer_points:
+                self.buffer_control = "NEV"
+                self._buffer_full_at = self._acquired_at
+        return readings
+
+    def math(self, readings):
+        """
+        Evaluate the selected CALC1 expression on each reading.
+        """
+        if not self.math_state or self.math_selected not in self.math_expressions:
+            raise SimulationError(-230, "Data corrupt or stale")
+        readings = np.asarray(readings)
+        names = {e: readings[:, k] for k, e in enumerate(self.ELEMENTS)}
+        names.update({"LOG": np.log10, "LN": np.log, "SIN": np.sin, "COS": np.cos,
+                      "TAN": np.tan, "EXP": np.exp})
+        expression = self.math_expressions[self.math_selected].replace("^", "**")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = eval(expression, {"__builtins__": {}}, names)
+        return np.nan_to_num(np.asarray(values, dtype=float)*np.ones(len(readings)), nan=9.91e37, posinf=9.91e37)
+
+    def format_readings(self, readings):
+        columns = [self.ELEMENTS.index(e) for e in self.elements]
+        values = np.asarray(readings)[:, columns].ravel()
+        return self.format_values(values)
+
+    def format_values(self, values):
+        if self.data_format == "SRE":
+            # IEEE-488.2 definite length block of single precision floats
+            payload = values.astype("<f4" if self.byte_order == "SWAP" else ">f4").tobytes()
+            length = str(len(payload))
+            return f"#{len(length)}{length}".encode("ascii") + payload
+        return ",".join(f"{v:+.6E}" for v in values)
+
+    def calc3(self):
+        if not self.buffer:
+            raise SimulationError(-230, "Data corrupt or stale")
+        data = np.array(self.buffer)[:, :3]
+        # VOLT, CURR, RES of sense readings, the one value of CALC1 results
+        operation = {"MEAN": np.mean, "MAX": np.max, "MIN": np.min,
+                     "SDEV": lambda a, axis: np.std(a, axis=axis, ddof=1),
+                     "PKPK": np.ptp}[self.calc3_format]
+        return ",".join(f"{v:+.6E}" for v in operation(data, axis=0))
+
+    def execute(self, header, args):
+        if header in ("OUTP", "OUTP:STAT"):
+            self.output = bool(parse_number(args))
+            if not self.output and self.output_levels[-1] != 0.0:
+                self.output_levels.append(0.0)
+            self._output_level(self.source_level[self.source_function])
+        elif header in ("OUTP?", "OUTP:STAT?"):
+            return str(int(self.output))
+        elif header == "SOUR:FUNC":
+            self.source_function = "CURR" if args.strip().upper().startswith("CURR") else "VOLT"
+        elif header == "SOUR:FUNC?":
+            return self.source_function
+        elif header in ("SOUR:CURR:MODE", "SOUR:VOLT:MODE"):
+            mode = args.strip().upper()
+            self.source_mode = "LIST" if mode.startswith("LIST") else "SWE" if mode.startswith("SWE") else "FIX"
+            self._output_level(self.source_level[self.source_function])
+        elif header in ("SOUR:CURR:MODE?", "SOUR:VOLT:MODE?"):
+            return self.source_mode
+        elif header in ("SOUR:CURR:STAR", "SOUR:VOLT:STAR"):
+            self.sweep_start[header[5:9]] = parse_number(args)
+        elif header in ("SOUR:CURR:STOP", "SOUR:VOLT:STOP"):
+            self.sweep_stop[header[5:9]] = parse_number(args)
+        elif header == "SOUR:SWE:POIN":
+            points = int(parse_number(args, 2500))
+            if not 2 <= points <= 2500:
+                raise SimulationError(-222, "Data out of range")
+            self.sweep_points = points
+        elif header == "SOUR:SWE:POIN?":
+            return str(self.sweep_points)
+        elif header == "SOUR:SWE:RANG":
+            self.sweep_ranging = {"BES": "BEST", "AUT": "AUTO", "FIX": "FIX"}.get(args.strip().upper()[:3], self.sweep_ranging)
+        elif header == "SOUR:SWE:RANG?":
+            return self.sweep_ranging
+        elif header == "SOUR:SWE:SPAC":
+            self.sweep_spacing = "LOG" if args.strip().upper().startswith("LOG") else "LIN"
+        elif header == "SOUR:SWE:SPAC?":
+            return self.sweep_spacing
+        elif header == "SOUR:DEL":
+            self.source_delay = parse_number(args)
+            self.source_delay_auto = False
+        elif header == "SOUR:DEL?":
+            return f"{self.source_delay:+.6E}"
+        elif header == "SOUR:DEL:AUTO":
+            self.source_delay_auto = bool(parse_number(args))
+            if self.source_delay_auto:
+                self.source_delay = 0.0
+        elif header == "SOUR:DEL:AUTO?":
+            return str(int(self.source_delay_auto))
+        elif header == "SOUR:CLE:AUTO":
+            self.auto_output_off = bool(parse_number(args))
+        elif header == "SOUR:CLE:AUTO?":
+            return str(int(self.auto_output_off))
+        elif header in ("ARM:SOUR", "TRIG:SOUR"):
+            source = args.strip().upper()[:3]
+            if header == "ARM:SOUR":
+                self.arm_source = source
+            else:
+                self.trigger_source = source
+        elif header == "ARM:SOUR?":
+            return {"IMM": "IMM", "BUS": "BUS", "TIM": "TIM", "TLI": "TLIN"}.get(self.arm_source, self.arm_source)
+        elif header == "TRIG:SOUR?":
+            return {"IMM": "IMM", "BUS": "BUS", "TLI": "TLIN"}.get(self.trigger_source, self.trigger_source)
+        elif header in ("SOUR:CURR", "SOUR:VOLT"):
+            self.source_level[header[5:]] = parse_number(args)
+            # In sweep and list mode this is the bias level, output when the sweep ends
+            if self.source_mode == "FIX" and header[5:] == self.source_function:
+                self._output_level(self.source_level[header[5:]])
+        elif header in ("SOUR:CURR?", "SOUR:VOLT?"):
+            return f"{self.source_level[header[5:9]]:+.6E}"
+        elif header in ("SOUR:LIST:CURR", "SOUR:LIST:VOLT"):
+            values = parse_list(args)
+            if len(values) > self.list_limit:
+                raise SimulationError(-223, "Too much data")
+            self.source_list = values
+        elif header in ("SOUR:LIST:CURR:APP", "SOUR:LIST:VOLT:APP"):
+            values = parse_list(args)
+            if len(values) > self.list_limit or len(self.source_list) + len(values) > self.memory_limit:
+                raise SimulationError(-223, "Too much data")
+            self.source_list.extend(values)
+        elif header in ("SOUR:LIST:CURR:POIN?", "SOUR:LIST:VOLT:POIN?"):
+            return str(len(self.source_list))
+        elif header in ("SENS:VOLT:PROT", "SENS:CURR:PROT"):
+            self.compliance[header[5:9]] = parse_number(args)
+        elif header in ("NPLC", "SENS:VOLT:NPLC", "SENS:CURR:NPLC", "SENS:RES:NPLC"):
+            self.nplc = min(max(parse_number(args, 1.0), 0.01), 10)
+        elif header in ("NPLC?", "SENS:VOLT:NPLC?", "SENS:CURR:NPLC?", "SENS:RES:NPLC?"):
+            return f"{self.nplc:.6E}"
+        elif header == "SYST:LFR?":
+            return str(self.line_frequency)
+        elif header == "FORM:ELEM":
+            elements = [normalize_header(e) for e in args.replace(",", " ").split()]
+            self.elements = [e for e in elements if e in self.ELEMENTS] or ["VOLT"]
+        elif header == "FORM:ELEM?":
+            return ",".join(self.elements)
+        elif header == "FORM:DATA":
+            form = args.replace(" ", "").upper()
+            if form.startswith("ASC"):
+                self.data_format = "ASC"
+            elif form.startswith("SRE") or form == "REAL,32":
+                self.data_format = "SRE"
+            else:
+                raise SimulationError(-224, "Illegal parameter value")
+        elif header == "FORM:DATA?":
+            return "ASC" if self.data_format == "ASC" else "REAL,32"
+        elif header == "FORM:BORD":
+            self.byte_order = "SWAP" if args.strip().upper().startswith("SWAP") else "NORM"
+        elif header == "FORM:BORD?":
+            return self.byte_order
+        elif header == "TRIG:COUN":
+            self.trigger_count = int(parse_number(args, 1))
+        elif header == "TRIG:COUN?":
+            return str(self.trigger_count)
+        elif header == "ARM:COUN":
+            self.arm_count = int(parse_number(args, 1))
+        elif header == "ARM:COUN?":
+            return str(self.arm_count)
+        elif header == "INIT":
+            if self.armed:
+                raise SimulationError(-213, "Init ignored")
+            if self.arm_source == "BUS":
+                # Each *TRG runs one arm cycle
+                self.armed = self.arm_count
+            else:
+                self.acquire()
+        elif header == "*TRG":
+            # Also while the cycle of the previous trigger is still measuring
+            if not self.armed or self.bench.now() < self._busy_until:
+                raise SimulationError(-211, "Trigger ignored")
+            self.armed -= 1
+            self.acquire(self.trigger_count)
+        elif header == "ABOR":
+            self.armed = 0
+        elif header == "FETC?":
+            if self._acquired_at > max(self.bench.now(), self._busy_until) + self._pending:
+                self.busy(self._acquired_at - max(self.bench.now(), self._busy_until) - self._pending)
+            return self.format_readings(self.readings)
+        elif header in ("READ?", "MEAS?", "MEAS:VOLT?", "MEAS:CURR?"):
+            if self.armed:
+                raise SimulationError(-213, "Init ignored")
+            return self.format_readings(self.acquire())
+        elif header == "TRAC:POIN":
+            points = int(parse_number(args, 100))
+            if not 1 <= points <= self.memory_limit:
+                raise SimulationError(-222, "Data out of range")
+            self.buffer_points = points
+        elif header == "TRAC:POIN?":
+            return str(self.buffer_points)
+        elif header == "TRAC:POIN:ACT?":
+            return str(len(self.buffer))
+        elif header == "TRAC:CLE":
+            self.buffer = []
+            self._buffer_full_at = None
+        elif header == "TRAC:FEED":
+            self.buffer_feed = normalize_header(args.strip())
+        elif header == "TRAC:FEED:CONT":
+            self.buffer_control = "NEXT" if args.strip().upper().startswith("NEX") else "NEV"
+        elif header == "TRAC:FEED:CONT?":
+            return self.buffer_control
+        elif header == "TRAC:DATA?":
+            if not self.buffer:
+                return ""
+            if self.buffer_feed == "CALC":
+                return self.format_values(np.array(self.buffer).ravel())
+            return self.format_readings(self.buffer)
+        elif header == "CALC3:FORM":
+            self.calc3_format = {"MEA": "MEAN", "MAX": "MAX", "MIN": "MIN", "SDE": "SDEV",
+                                 "PKP": "PKPK"}.get(args.strip().upper()[:3], self.calc3_format)
+        elif header == "CALC3:DATA?":
+            return self.calc3()
+        elif header == "CALC:MATH:EXPR:NAME":
+            self.math_name = args.strip().strip('"').upper()
+        elif header == "CALC:MATH:EXPR":
+            self.math_expressions[self.math_name] = args.strip().upper()
+        elif header == "CALC:MATH:NAME":
+            self.math_selected = args.strip().strip('"').upper()
+        elif header == "CALC:STAT":
+            self.math_state = bool(parse_number(args))
+        elif header == "CALC:DATA?":
+            return self.format_values(self.math(self.readings))
+        elif header == "STAT:MEAS:ENAB":
+            self.measurement_enable = int(parse_number(args))
+        elif header == "STAT:MEAS?":
+            return str(512 if self.summary_status() & 1 else 0)
+        elif header == "STAT:PRES":
+            self.measurement_enable = 0
+        else:
+            return super().execute(header, args)
+
+
+class SimulatedMultimeter(SimulatedInstrument):
+    idn = "HEWLETT-PACKARD,34401A,0,11-5-2"
+    command_latency = 0.002
+    ac_measure_time = 0.1       # s, slow AC filter
+    shunt = 982.7692212         # Ohm, shunt in series with the Helmholtz coil
+
+    def execute(self, header, args):
+        if header in ("MEAS:VOLT:AC?", "READ?"):
+            self.busy(self.ac_measure_time)
+            vrms = self.bench.helmholtz_current()/math.sqrt(2)*self.shunt
+            return f"{vrms*(1 + self.bench.rng.normal(0, 1e-4)):+.8E}"
+        return super().execute(header, args)
+
+
+class SimulatedFunctionGenerator(SimulatedInstrument):
+    idn = "Agilent Technologies,33220A,0,2.02-2.02-22-2"
+    command_latency = 0.003
+
+    def reset(self):
+        super().reset()
+        self.shape = "DC"
+        self.frequency = 1000.0
+        self.amplitude = 0.0    # Vpp
+        self.offset = 0.0
+
+    def execute(self, header, args):
+        if header in ("APPL:SIN", "APPL:SQU", "APPL:TRI"):
+            values = [parse_number(a, d) for a, d in
+                      zip((args.split(",") + ["", "", ""])[:3], (self.frequency, 0.1, 0.0))]
+            self.shape = header[5:]
+            self.frequency, self.amplitude, self.offset = values
+        elif header == "APPL:DC":
+            self.shape = "DC"
+            self.amplitude = 0.0
+            self.offset = parse_number((args.split(",") + ["", "", ""])[2])
+        elif header in ("FREQ", "SOUR:FREQ"):
+            self.frequency = parse_number(args, self.frequency)
+        elif header in ("VOLT", "SOUR:VOLT"):
+            self.amplitude = parse_number(args, self.amplitude)
+        else:
+            return super().execute(header, args)
+
+
+class SimulatedNanovoltmeter(SimulatedInstrument):
+    idn = "KEITHLEY,182,0,0"
+    command_latency = 0.002
+    measure_time = 0.05
+
+    def write(self, message, termination=None, encoding=None):
+        # The 182 uses device dependent commands; every message returns a reading
+        self.bench.transfer(len(message) + 1)
+        with self._lock:
+            now = self.bench.now()
+            voltage = self.bench.sample_voltage()
+            self._busy_until = max(now, self._busy_until) + self.command_latency + self.measure_time
+            self._output = bytearray(f"NDCV{voltage:+.5E}\n".encode("ascii"))
+            self._ready_at = self._busy_until
+        return len(message)
+
+
+class SimulatedBench:
+    X_magnet_GPA = 132.3129
+    Y_magnet_GPA = 129.76684
+    X_HHC_GPA = 31.72649
+    helmholtz_resistance = 50.0     # Ohm, generator load of the Helmholtz coil
+    bus_overhead = 0.0002           # s, addressing cost of every GPIB transfer
+    byte_time = 2e-6                # s per byte on the bus
+
+    def __init__(self, time_scale=1.0, seed=None):
+        """
+        The simulated setup: instruments, bus and sample.
+
+        Parameters:
+        - time_scale (float): Wall clock seconds per simulated second, below 1 to run faster
+                              than real time. (Default to be 1)
+        - seed (int): Seed of the noise generator. (Default to be None)
+        """
+        if time_scale <= 0:
+            raise Exception("SimulatedBench: time_scale must be positive")
+        self.time_scale = time_scale
+        self.rng = np.random.default_rng(seed)
+        self.bus = threading.RLock()
+        self.mtj = SimulatedMTJ()
+        self._t0 = time.perf_counter()
+        self.instruments = {}
+        for address, model in ((5, Simulated6613C), (9, Simulated6613C), (10, SimulatedMultimeter),
+                               (19, SimulatedFunctionGenerator), (20, Simulated2400),
+                               (26, SimulatedNanovoltmeter)):
+            self.instruments[address] = model(self, address)
+
+    # --------------------------------------------------------------- timing
+    def now(self):
+        return (time.perf_counter() - self._t0)/self.time_scale
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds*self.time_scale)
+
+    def transfer(self, nbytes):
+        with self.bus:
+            self.sleep(self.bus_overhead + nbytes*self.byte_time)
+
+    # -------------------------------------------------------------- physics
+    def field(self, t=None):
+        """
+        Return the (Hx, Hy) field(G) produced by the electromagnets at time t.
+        """
+        return (self.instruments[5].output_current(t)*self.X_magnet_GPA,
+                self.instruments[9].output_current(t)*self.Y_magnet_GPA)
+
+    def sample_resistance(self, t=None):
+        return self.mtj.resistance(*self.field(t))
+
+    def sample_voltage(self):
+        sourcemeter = self.instruments[20]
+        if not sourcemeter.output or sourcemeter.source_function != "CURR":
+            return 0.0
+        return sourcemeter.source_level["CURR"]*self.sample_resistance()
+
+    def helmholtz_current(self):
+        """
+        Return the peak AC current(A) driven through the Helmholtz coil.
+        """
+        generator = self.instruments[19]
+        if generator.shape == "DC":
+            return 0.0
+        return generator.amplitude/2/self.helmholtz_resistance
+
+    # ----------------------------------------------------------- interfaces
+    def instrument(self, address):
+        """
+        Return the instrument at a GPIB primary address or VISA resource name.
+        """
+        if isinstance(address, str):
+            match = re.match(r"GPIB\d*::(\d+)", address.upper())
+            if match is None:
+                raise Exception(f"SimulatedBench: Invalid resource name {address}")
+            address = int(match.group(1))
+        if address not in self.instruments:
+            raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_resource_not_found)
+        return self.instruments[address]
+
+    def adapter(self, address):
+        """
+        Return a pymeasure adapter connected to the instrument at the address.
+        """
+        return SimulatedAdapter(self.instrument(address))
+
+
+class SimulatedResourceManager:
+    def __init__(self, bench=None):
+        """
+        Drop-in replacement of pyvisa.ResourceManager opening simulated instruments.
+
+        Parameters:
+        - bench (SimulatedBench): The simulated setup. (Default to a new SimulatedBench)
+        """
+        self.bench = SimulatedBench() if bench is None else bench
+
+    def list_resources(self, query="?*::INSTR"):
+        return tuple(i.resource_name for i in self.bench.instruments.values())
+
+    def open_resource(self, resource_name, **kwargs):
+        resource = self.bench.instrument(resource_name)
+        for key, value in kwargs.items():
+            setattr(resource, key, value)
+        resource.open()
+        return resource
+
+    def close(self):
+        for resource in self.bench.instruments.values():
+            resource.close()
+
+
+class SimulatedAdapter(Adapter):
+    """ pymeasure adapter talking to a simulated instrument, so the pymeasure
+    drivers (Keithley2400, Agilent6613C) run against the simulated bench.
+
+    .. code-block:: python
+
+        bench = SimulatedBench()
+        keithley = Keithley2400(bench.adapter(20))
+    """
+
+    def __init__(self, resource, **kwargs):
+        super().__init__(**kwargs)
+        resource.open()
+        self.connection = resource
+
+    def _write(self, command, **kwargs):
+        self.connection.write(command)
+
+    def _read(self, **kwargs):
+        return self.connection.read().rstrip("\n")
+
+    def _write_bytes(self, content, **kwargs):
+        self.connection.write_raw(content)
+
+    def _read_bytes(self, count=-1, break_on_termchar=False, **kwargs):
+        return self.connection.read_bytes(count)
+
+    def close(self):
+        self.connection.close()
+
+
+class SimulatedDAQModule:
+    def __init__(self, daq):
+        """
+        Continuous dataAcquisitionModule of the simulated MFLI.
+        """
+        self.daq = daq
+        self.params = {"count": 1, "duration": 0.2, "grid/cols": 100}
+        self.paths = []
+        self._start = None
+        self._delivered = 0
+
+    def set(self, key, value):
+        self.params[key] = value
+
+    def get(self, key):
+        return self.params[key]
+
+    def subscribe(self, path):
+        self.paths.append(path)
+
+    def unsubscribe(self, path):
+        self.paths = [] if path == "*" else [p for p in self.paths if p != path]
+
+    def execute(self):
+        self._start = self.daq.bench.now()
+        self._delivered = 0
+
+    def _completed(self):
+        if self._start is None:
+            return 0
+        done = int((self.daq.bench.now() - self._start)/self.params["duration"])
+        return min(done, int(self.params["count"]))
+
+    def finished(self):
+        return self._start is not None and self._completed() >= int(self.params["count"])
+
+    def progress(self):
+        return [self._completed()/max(int(self.params["count"]), 1)]
+
+    def read(self, flat=False):
+        completed = self._completed()
+        data = {}
+        for path in self.paths:
+            bursts = []
+            for k in range(self._delivered, completed):
+                cols = int(self.params["grid/cols"])
+                t0 = self._start + k*self.params["duration"]
+                sample = self.daq.demod_sample(path.rsplit(".", 1)[0], cols/self.params["duration"], cols, t0)
+                bursts.append({"value": sample[path.rsplit(".", 1)[1].lower()][np.newaxis, :],
+                               "timestamp": sample["timestamp"][np.newaxis, :]})
+            data[path.lower()] = bursts
+        self._delivered = completed
+        return data
+
+    def finish(self):
+        pass
+
+
+class SimulatedDAQServer:
+    clockbase = 60e6
+
+    def __init__(self, bench=None, device_id="dev7173"):
+        """
+        Drop-in replacement of zhinst.core.ziDAQServer for the MFLI class.
+        The demodulator sees the AC response of the MTJ to the Helmholtz coil field.
+
+        Parameters:
+        - bench (SimulatedBench): The simulated setup. (Default to a new SimulatedBench)
+        - device_id (str): Device serial. (Default to be "dev7173")
+        """
+        self.bench = SimulatedBench() if bench is None else bench
+        self.device_id = device_id
+        self.nodes = {f"/{device_id}/clockbase": self.clockbase,
+                      f"/{device_id}/demods/0/rate": 1.0e3}
+        self.subscribed = set()
+
+    def connectDevice(self, device, interface):
+        self.device_id = device
+
+    def set(self, path, value=None):
+        if value is None:
+            for p, v in path:
+                self.nodes[p.lower()] = v
+        else:
+            self.nodes[path.lower()] = value
+
+    setInt = set
+    setDouble = set
+
+    def get(self, path, flat=True):
+        return self.nodes.get(path.lower(), 0)
+
+    def getInt(self, path):
+        return int(self.get(path))
+
+    def getDouble(self, path):
+        return float(self.get(path))
+
+    def subscribe(self, path):
+        self.subscribed.add(path.lower())
+
+    def unsubscribe(self, path):
+        self.subscribed = set() if path == "*" else self.subscribed - {path.lower()}
+
+    def demod_sample(self, path, rate, n, t0):
+        """
+        Return a demodulator sample dict of n points starting at time t0.
+        """
+        generator = self.bench.instruments[19]
+        sourcemeter = self.bench.instruments[20]
+        hx, hy = self.bench.field()
+        h_ac = self.bench.helmholtz_current()*self.bench.X_HHC_GPA
+        i_dc = sourcemeter.source_level["CURR"] if sourcemeter.output else 0.0
+        r = abs(i_dc*self.bench.mtj.slope(hx, hy)*h_ac)/math.sqrt(2)
+        t = t0 + np.arange(n)/rate
+        x = r + self.bench.rng.normal(0, 2e-7, n)
+        y = self.bench.rng.normal(0, 2e-7, n)
+        return {"timestamp": (t*self.clockbase).astype(np.int64),
+                "x": x, "y": y, "r": np.hypot(x, y), "theta": np.arctan2(y, x),
+                "frequency": np.full(n, generator.frequency), "phase": np.zeros(n)}
+
+    def poll(self, recording_time, timeout, flags=0, flat=False):
+        self.bench.sleep(recording_time)
+        rate = float(self.nodes.get(f"/{self.device_id}/demods/0/rate", 1.0e3))
+        n = max(int(recording_time*rate), 1)
+        t0 = self.bench.now() - recording_time
+        return {path: self.demod_sample(path, rate, n, t0) for path in self.subscribed}
+
+    def dataAcquisitionModule(self):
+        return SimulatedDAQModule(self)
+
+    def disconnect(self):
+        pass
+
+
+def enable(bench=None):
+    """
+    Point the shared session registry at a simulated bench, so
+    MeasurementDevice, the GPIB_instruments classes and the scripts
+    talk to the simulation instead of the GPIB board.
+
+    Parameters:
+    - bench (SimulatedBench): The simulated setup. (Default to a new SimulatedBench)
+
+    Returns:
+    - SimulatedBench: The bench in use.
+    """
+    from device import sessions
+    resource_manager = SimulatedResourceManager(bench)
+    sessions.use(resource_manager)
+    return resource_manager.bench
+
+
+if __name__ == "__main__":
+    import timeit
+    from GPIB_instruments import Agilent6613C_PowerSupply, Agilent2400_SourceMeter
+
+    # Benchmark of the class based per-point loop against the simulation
+    bench = enable()
+    ps = Agilent6613C_PowerSupply("GPIB0::5::INSTR")
+    sm = Agilent2400_SourceMeter("GPIB0::20::INSTR")
+    ps.initialize()
+    sm.initialize()
+    sm.NPLC()
+    sm.source_list_I([0.001, -0.001])
+    ps.output(True)
+    sm.output(True)
+
+    seq = np.concatenate((np.arange(0, 0.3, 0.003), np.arange(0.3, -0.3, -0.003), np.arange(-0.3, 0.3, 0.003)))
+    start = timeit.default_timer()
+    resist = []
+    for i in seq:
+        ps.compliance_level()
+        ps.source_I(i)
+        curr = ps.read_I()
+        volt = sm.read_buffer()
+        resist.append((volt[0] - volt[1])/2/0.001)
+    stop = timeit.default_timer()
+    print('Time per measurement: ', str((stop - start)/len(seq)*1000), 'ms')
+    print('Resistance range: ', min(resist), max(resist), 'Ohm')
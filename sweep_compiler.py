@@ -0,0 +1,244 @@
+"""
+Compile a planned sweep into the program messages of each point.
+
+Per point the supply gets the smallest message that moves it to the point:
+the relay polarity only where it flips, the compliance only where the band
+changes, and the current setpoint, with the MEAS:CURR? readback fused into
+the same message. Points that need a settle wait (relay flip, compliance
+change) send the settings first and read back after the wait. The
+executor then only streams the precompiled messages:
+
+    plan = plan_sweep(seq)
+    programs = compile_sweep(plan, supply.cached_state())
+    for curr, measured, readings in execute_sweep(programs, supply, sourcemeter):
+        ...
+
+execute_sweep_buffered() runs the same programs with the sourcemeter
+readings kept in its trace buffer, read once per block.
+"""
+from device import join_commands
+from GPIB_instruments import settle_together
+
+
+class PointProgram:
+    def __init__(self, curr, rel, volt, settings, settle, writes, query):
+        """
+        The precompiled supply messages of one sweep point.
+
+        Parameters:
+        - curr (float): Signed current(A) of the point.
+        - rel (boolean): Relay reversed.
+        - volt (float): Compliance voltage(V).
+        - settings (list of tuple): (header, value) of the settings the messages change.
+        - settle (str): "relay" or "compliance" if the output has to settle before the readback, else None.
+        - writes (list of str): Program messages to write before the query.
+        - query (str): Program message ending with the readback query, None if the
+                       current of the point is inferred (see readback_policy).
+        """
+        self.curr = curr
+        self.rel = rel
+        self.volt = volt
+        self.settings = settings
+        self.settle = settle
+        self.writes = writes
+        self.query = query
+
+    @property
+    def measured(self):
+        return self.query is not None
+
+    def __repr__(self):
+        return f"PointProgram({self.curr} A, writes={self.writes}, query={self.query!r}, settle={self.settle})"
+
+
+def compliance_first(volt, state):
+    """
+    Return True if the compliance voltage is to be set before the current:
+    it is raised before the current goes up, or not known yet, and lowered
+    only after the current went down.
+
+    Parameters:
+    - volt (float): Compliance voltage(V) of the next point.
+    - state (dict): Settings the supply holds, as from cached_state().
+    """
+    previous = state.get("VOLT")
+    return previous is None or volt >= float(previous)
+
+
+def compile_sweep(plan, state=None, max_length=256, readback="MEAS:CURR?", policy=None):
+    """
+    Compile a sweep plan into per point supply messages.
+
+    Parameters:
+    - plan (SweepPlan): The planned sweep.
+    - state (dict): Settings the supply holds before the sweep, as from
+                    cached_state(). (Default to be None, every setting is sent at the first point)
+    - max_length (int): Maximum length of one program message. (Default to be 256)
+    - readback (str): Readback query of each point. (Default to be "MEAS:CURR?")
+    - policy (ReadbackPolicy): Decides which points are read back, and with how many
+                               sweep points. Points that settle are always read back.
+                               (Default to be None, every point with the present sweep points)
+
+    Returns:
+    - list of PointProgram: One program per point, in order.
+    """
+    state = dict(state or {})
+    programs = []
+    if policy is not None:
+        policy.reset()
+    for curr, rel, volt in plan.steps():
+        relay = [("OUTP:REL", "ON"), ("OUTP:REL:POL", "REV" if rel else "NORM")]
+        setpoint = ("CURR", str(abs(curr)))
+        compliance = ("VOLT", str(volt))
+        if compliance_first(volt, state):
+            settings = relay + [compliance, setpoint]
+        else:
+            settings = relay + [setpoint, compliance]
+        settings = [(header, value) for header, value in settings if state.get(header) != value]
+        headers = [header for header, value in settings]
+        settle = "relay" if "OUTP:REL:POL" in headers else "compliance" if "VOLT" in headers else None
+
+        measure = True
+        if policy is not None:
+            points = policy.decide(curr, rel, force=settle is not None)
+            measure = points is not None
+            if measure and state.get("SENS:SWE:POIN") != str(points):
+                settings.append(("SENS:SWE:POIN", str(points)))
+        state.update(settings)
+
+        commands = [f"{header} {value}" for header, value in settings]
+        if not measure:
+            writes, query = join_commands(commands, max_length), None
+        elif settle is None:
+            messages = join_commands(commands + [readback], max_length)
+            writes, query = messages[:-1], messages[-1]
+        else:
+            writes, query = join_commands(commands, max_length), join_commands([readback], max_length)[0]
+        programs.append(PointProgram(curr, rel, volt, settings, settle, writes, query))
+    return programs
+
+
+def summary(programs):
+    """
+    Return a one line description of the compiled sweep.
+    """
+    queries = sum(1 for p in programs if p.measured)
+    messages = sum(len(p.writes) for p in programs) + queries
+    nbytes = sum(len(m) for p in programs for m in p.writes + ([p.query] if p.measured else []))
+    settles = sum(1 for p in programs if p.settle)
+    return (f"{len(programs)} points, {messages} supply messages ({nbytes} bytes), "
+            f"{queries} readbacks, {settles} settle waits")
+
+
+def _source_point(point, supply, waits):
+    # Write the point's supply messages and wait for the output to settle
+    for message in point.writes:
+        supply.set_values(message)
+    supply.update_state(point.settings)
+    supply.curr, supply.volt = point.curr, point.volt
+    supply.rel = -1 if point.rel else 1
+    settle = point.settle
+    if settle == "relay" and not supply.settle_on_relay:
+        settle = None
+    if waits:
+        settle_together(list(waits) + [(supply, settle)])
+    elif settle is not None:
+        supply.wait_settled(settle)
+
+
+def _abort_point(supply, sourcemeter):
+    # Part of the messages may have been applied
+    supply.invalidate_state()
+    supply.discard_query()
+    sourcemeter.discard_query()
+    supply.report_errors()
+
+
+def execute_sweep(programs, supply, sourcemeter, before=None):
+    """
+    Stream compiled programs: per point write the supply messages, wait for
+    the output to settle where the program asks for it, then send the supply
+    readback and trigger the sourcemeter before reading either, so that the
+    two conversions overlap.
+
+    Parameters:
+    - programs (list of PointProgram): From compile_sweep().
+    - supply (Agilent6613C_PowerSupply): The magnet supply, connected.
+    - sourcemeter (Agilent2400_SourceMeter): The sourcemeter, with its source list loaded.
+    - before (function): Called with the index of each point before it is sourced, e.g. to
+                         move a second supply. It may return (supply, reason) settle waits,
+                         which run together with the point's own (see settle_together()).
+                         (Default to be None)
+
+    Yields:
+    - tuple: Signed current(A), True if it was read back (else it is the setpoint plus the
+             latest measured offset, see readback_policy.infer()), and the sourcemeter readings.
+
+    Raises:
+    - Exception: If any issues with communication or data retrieval occur.
+    """
+    offset = 0.0
+    for index, point in enumerate(programs):
+        waits = before(index) if before is not None else None
+        try:
+            _source_point(point, supply, waits)
+            if point.measured:
+                # Both instruments convert at the same time, the supply is read first
+                supply_query = supply.send_query(point.query)
+                buffer = sourcemeter.trigger_buffer()
+                curr = supply.rel*float(supply.collect(supply_query))
+                offset = curr - point.curr
+            else:
+                buffer = sourcemeter.trigger_buffer()
+                curr = point.curr + offset
+            readings = sourcemeter.collect_buffer(buffer)
+        except Exception as e:
+            _abort_point(supply, sourcemeter)
+            raise Exception(f"execute_sweep: Failed at {point.curr} A: {str(e)}")
+        yield curr, point.measured, readings
+
+
+def execute_sweep_buffered(programs, supply, sourcemeter, before=None):
+    """
+    Stream compiled programs like execute_sweep(), with the sourcemeter
+    readings kept in its trace buffer: per point the sourcemeter only gets a
+    bus trigger, and the buffer is read in binary once per block of up to
+    trace_limit readings, then split back into points. The points of a block
+    are yielded when the block has been read.
+
+    Parameters and yields as in execute_sweep().
+
+    Raises:
+    - Exception: If any issues with communication or data retrieval occur.
+    """
+    block = max(sourcemeter.trace_limit//sourcemeter.counts, 1)
+    offset = 0.0
+    try:
+        for first in range(0, len(programs), block):
+            chunk = programs[first:first + block]
+            results = []
+            point = chunk[0]
+            try:
+                sourcemeter.arm_buffer(len(chunk))
+                for index, point in enumerate(chunk, first):
+                    waits = before(index) if before is not None else None
+                    _source_point(point, supply, waits)
+                    if point.measured:
+                        supply_query = supply.send_query(point.query)
+                        sourcemeter.trigger_point()
+                        curr = supply.rel*float(supply.collect(supply_query))
+                        offset = curr - point.curr
+                    else:
+                        sourcemeter.trigger_point()
+                        curr = point.curr + offset
+                    results.append((curr, point.measured))
+                    # Hold the field until the source list of the point has run
+                    sourcemeter.wait_point()
+                readings = sourcemeter.read_trace()
+            except Exception as e:
+                _abort_point(supply, sourcemeter)
+                raise Exception(f"execute_sweep_buffered: Failed at {point.curr} A: {str(e)}")
+            for (curr, measured), row in zip(results, readings):
+                yield curr, measured, row
+    finally:
+        sourcemeter.disarm_buffer()
@@ -0,0 +1,424 @@
+"""
+Execution plans for electromagnet current sweeps.
+
+The 6613C supplies reverse the magnet current with an output relay and are
+run at one of three compliance voltages depending on the current. Every relay
+flip and every compliance change costs a settle wait, so a plan assigns each
+point of a sweep its relay polarity and compliance band such that:
+    - the order of the points is kept, the hysteresis loop depends on it,
+    - zero current points take the polarity of their neighbours instead of
+      forcing a flip of their own,
+    - the band is raised as soon as a point needs it, but only lowered again
+      once the current has dropped clearly below the threshold and stays there
+      for enough points to be worth the switch.
+The plan also predicts the dead time of the run before it starts:
+
+    plan = plan_sweep(seq)
+    print(plan.summary())
+    for curr, rel, volt in plan.steps():
+        ...
+
+AdaptiveStepper instead chooses the points of a branch while it is measured,
+fine at the switching edges and coarse in saturation:
+
+    stepper = AdaptiveStepper(0.2, -0.2, 0.0003, 0.006, target_change=1)
+    for curr in stepper:
+        stepper.record(curr, measure(curr))
+"""
+import numpy as np
+
+# (Highest current(A), compliance voltage(V)) of each band, lowest band first
+COMPLIANCE_BANDS = ((0.001, 0.1), (0.015, 1), (1.1, 51))
+
+
+class Segment:
+    def __init__(self, start, stop, polarity, volt):
+        """
+        A run of consecutive points sourced with the same relay polarity and compliance.
+
+        Parameters:
+        - start (int): Index of the first point.
+        - stop (int): Index after the last point.
+        - polarity (int): 1 for the normal relay polarity, -1 for reversed.
+        - volt (float): Compliance voltage(V).
+        """
+        self.start = start
+        self.stop = stop
+        self.polarity = polarity
+        self.volt = volt
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __repr__(self):
+        return f"Segment({self.start}:{self.stop}, {'REV' if self.polarity < 0 else 'NORM'}, {self.volt} V)"
+
+
+class SweepPlan:
+    def __init__(self, points, polarity, volt, relay_time=0.3, compliance_time=0.3):
+        """
+        The points of a sweep with the relay polarity and compliance voltage of each.
+
+        Parameters:
+        - points (numpy.ndarray): Signed currents(A) in execution order.
+        - polarity (numpy.ndarray): 1 or -1 per point.
+        - volt (numpy.ndarray): Compliance voltage(V) per point.
+        - relay_time (float): Expected settle time(s) after a relay flip. (Default to be 0.3)
+        - compliance_time (float): Expected settle time(s) after a compliance change. (Default to be 0.3)
+        """
+        self.points = points
+        self.polarity = polarity
+        self.volt = volt
+        self.relay_time = relay_time
+        self.compliance_time = compliance_time
+        self.segments = []
+        start = 0
+        for i in range(1, len(points) + 1):
+            if i == len(points) or polarity[i] != polarity[start] or volt[i] != volt[start]:
+                self.segments.append(Segment(start, i, int(polarity[start]), float(volt[start])))
+                start = i
+
+    def __len__(self):
+        return len(self.points)
+
+    @property
+    def relay_flips(self):
+        return int(np.count_nonzero(np.diff(self.polarity)))
+
+    @property
+    def compliance_switches(self):
+        return int(np.count_nonzero(np.diff(self.volt)))
+
+    def dead_time(self):
+        """
+        Return the predicted settle time(s) of the whole sweep. The first point's
+        relay and compliance settings are counted as switches too.
+        """
+        if not len(self.points):
+            return 0.0
+        return (self.relay_flips + 1)*self.relay_time + (self.compliance_switches + 1)*self.compliance_time
+
+    def duration(self, point_time):
+        """
+        Return the predicted duration(s) of the sweep.
+
+        Parameters:
+        - point_time (float): Time(s) to source and measure one point without settling.
+        """
+        return len(self.points)*point_time + self.dead_time()
+
+    def steps(self):
+        """
+        Iterate over (current(A), relay reversed (boolean), compliance voltage(V)) per point.
+        """
+        for curr, polarity, volt in zip(self.points, self.polarity, self.volt):
+            yield float(curr), bool(polarity < 0), float(volt)
+
+    def summary(self, point_time=None):
+        """
+        Return a one paragraph description of the plan.
+
+        Parameters:
+        - point_time (float): Time(s) per point, to predict the duration. (Default to be None)
+        """
+        text = (f"{len(self.points)} points in {len(self.segments)} segments, "
+                f"{self.relay_flips} relay flips, {self.compliance_switches} compliance switches, "
+                f"predicted dead time {self.dead_time():.1f} s")
+        if point_time is not None:
+            text += f", predicted duration {self.duration(point_time):.1f} s"
+        return text
+
+
+def band_of(curr, bands=COMPLIANCE_BANDS):
+    """
+    Return the index of the lowest band that can source the current.
+    """
+    for k, (limit, volt) in enumerate(bands):
+        if abs(curr) <= limit:
+            return k
+    raise Exception(f"sweep_planner: Current {curr} A exceeds every compliance band")
+
+
+def assign_polarity(points, zero_tolerance=1e-12):
+    """
+    Return the relay polarity of each point. Nonzero points take the sign of
+    their current; zero points take the polarity of the previous point, or of
+    the next nonzero point at the start of the sweep, so they never flip the relay.
+
+    Parameters:
+    - points (numpy.ndarray): Signed currents(A).
+    - zero_tolerance (float): Currents(A) this small count as zero. (Default to be 1e-12)
+    """
+    sign = np.where(np.abs(points) <= zero_tolerance, 0, np.sign(points)).astype(int)
+    nonzero = np.flatnonzero(sign)
+    polarity = np.ones(len(points), dtype=int)
+    if not len(nonzero):
+        return polarity
+    # Carry the last nonzero sign forward, and the first one backward
+    index = np.maximum.accumulate(np.where(sign != 0, np.arange(len(points)), -1))
+    index[index < 0] = nonzero[0]
+    polarity[:] = sign[index]
+    return polarity
+
+
+def assign_bands(points, bands=COMPLIANCE_BANDS, hysteresis=0.2, min_dwell=20):
+    """
+    Return the compliance band index of each point. A band is raised at the
+    first point that needs it. It is lowered only for a run of at least min_dwell
+    points that all sit below (1 - hysteresis) of the lower band's limit;
+    shorter excursions stay in the higher band, which sources them equally well.
+
+    Parameters:
+    - points (numpy.ndarray): Signed currents(A).
+    - bands (tuple): (Highest current(A), compliance voltage(V)) per band. (Default to be COMPLIANCE_BANDS)
+    - hysteresis (float): Fraction below a threshold the current has to drop to lower the band. (Default to be 0.2)
+    - min_dwell (int): Fewest points worth a switch to a lower band. (Default to be 20)
+    """
+    needed = np.array([band_of(p, bands) for p in points], dtype=int)
+    # Band each point could run in with hysteresis: the band needed by a current 1/(1 - h) larger
+    relaxed = np.array([band_of(min(abs(p)/(1 - hysteresis), bands[-1][0]), bands) for p in points], dtype=int)
+    band = needed.copy()
+    current = needed[0] if len(points) else 0
+    i = 0
+    while i < len(points):
+        if needed[i] > current:
+            current = needed[i]
+        elif relaxed[i] < current:
+            # Length of the run that could run in a lower band
+            j = i
+            while j < len(points) and relaxed[j] < current:
+                j += 1
+            if j - i >= min_dwell:
+                lower = max(relaxed[i:j].max(), needed[i:j].max())
+                band[i:j] = lower
+                current = lower
+                i = j
+                continue
+            band[i:j] = current
+            i = j
+            continue
+        band[i] = current
+        i += 1
+    return band
+
+
+def plan_sweep(points, bands=COMPLIANCE_BANDS, hysteresis=0.2, min_dwell=20, relay_time=0.3,
+               compliance_time=0.3, zero_tolerance=1e-12):
+    """
+    Plan a sweep, keeping the order of its points.
+
+    Parameters:
+    - points (list/numpy.ndarray): Signed currents(A) in the order they have to be measured.
+    - bands (tuple): (Highest current(A), compliance voltage(V)) per band. (Default to be COMPLIANCE_BANDS)
+    - hysteresis (float): See assign_bands(). (Default to be 0.2)
+    - min_dwell (int): See assign_bands(). (Default to be 20)
+    - relay_time (float): Expected settle time(s) after a relay flip. (Default to be 0.3)
+    - compliance_time (float): Expected settle time(s) after a compliance change. (Default to be 0.3)
+    - zero_tolerance (float): Currents(A) this small count as zero. (Default to be 1e-12)
+
+    Returns:
+    - SweepPlan: The plan.
+    """
+    points = np.asarray(points, dtype=float)
+    # Rounding in np.arange leaves values like -1e-18 where zero was meant
+    points = np.where(np.abs(points) <= zero_tolerance, 0.0, points)
+    polarity = assign_polarity(points, zero_tolerance)
+    band = assign_bands(points, bands, hysteresis, min_dwell)
+    volt = np.array([bands[k][1] for k in band], dtype=float)
+    return SweepPlan(points, polarity, volt, relay_time, compliance_time)
+
+
+def naive_plan(points, bands=COMPLIANCE_BANDS, relay_time=0.3, compliance_time=0.3):
+    """
+    Plan a sweep the way the per-point code switches: polarity from the sign
+    (zero counts as positive) and the lowest band for every point. Useful to
+    compare against plan_sweep().
+    """
+    points = np.asarray(points, dtype=float)
+    polarity = np.where(points < 0, -1, 1)
+    volt = np.array([bands[band_of(p, bands)][1] for p in points], dtype=float)
+    return SweepPlan(points, polarity, volt, relay_time, compliance_time)
+
+
+class AdaptiveStepper:
+    def __init__(self, start, stop, min_step, max_step, target_change, growth=1.5, edges=(), edge_width=None,
+                 edge_change=None, max_edges=2):
+        """
+        Choose the points of one monotonic sweep branch online, from the values
+        measured so far. The step shrinks where the measured value changes
+        quickly (switching edges) and grows in flat regions (saturation), aiming
+        for target_change between consecutive points. The branch only ever moves
+        from start towards stop: going back would trace a minor loop instead of
+        the hysteresis branch, so an edge found between two points is refined
+        on the next branch of the same direction, through edges.
+
+        Parameters:
+        - start (float): First point of the branch.
+        - stop (float): Last point of the branch.
+        - min_step (float): Smallest step.
+        - max_step (float): Largest step.
+        - target_change (float): Wanted change of the measured value between points.
+        - growth (float): Largest factor between consecutive steps. (Default to be 1.5)
+        - edges (list): Points where earlier branches of the same direction switched. (Default to be none)
+        - edge_width (float): Distance from an edge within which min_step is used. (Default to be 2*max_step)
+        - edge_change (float): Change between consecutive points that marks a switching edge,
+                               well above target_change so that slopes are not. (Default to be 5*target_change)
+        - max_edges (int): Edges kept per branch, the largest changes. (Default to be 2)
+        """
+        self.start = start
+        self.stop = stop
+        self.direction = 1 if stop >= start else -1
+        self.min_step = min_step
+        self.max_step = max_step
+        self.target_change = target_change
+        self.growth = growth
+        self.edges = list(edges)
+        self.edge_width = 2*max_step if edge_width is None else edge_width
+        self.edge_change = 5*target_change if edge_change is None else edge_change
+        self.max_edges = max_edges
+        self.points = []
+        self.values = []
+        self._jumps = []
+        self.step = min_step
+
+    def __iter__(self):
+        point = self.next_point()
+        while point is not None:
+            yield point
+            point = self.next_point()
+
+    def next_point(self):
+        """
+        Return the next point of the branch, or None once stop has been measured.
+        record() has to be called for the previous point first.
+        """
+        if not self.points:
+            return self.start
+        if len(self.values) < len(self.points):
+            raise Exception("AdaptiveStepper: record() the previous point first")
+        last = self.points[-1]
+        if last == self.stop:
+            return None
+        point = last + self.direction*self._next_step(last)
+        if (point - self.stop)*self.direction > 0:
+            point = self.stop
+        return point
+
+    def record(self, point, value):
+        """
+        Add the value measured at a point.
+        """
+        if self.points and len(self.values) < len(self.points) and point == self.points[-1]:
+            self.values.append(value)
+        else:
+            self.points.append(point)
+            self.values.append(value)
+        if len(self.values) >= 2:
+            change = abs(self.values[-1] - self.values[-2])
+            if change > self.edge_change:
+                self._jumps.append((change, (self.points[-1] + self.points[-2])/2))
+
+    @property
+    def detected(self):
+        """
+        Points where this branch switched: the middle of the max_edges largest
+        changes above edge_change, in sweep order.
+        """
+        largest = sorted(self._jumps, reverse=True)[:self.max_edges]
+        return sorted((point for change, point in largest), key=lambda point: point*self.direction)
+
+    def _next_step(self, last):
+        if len(self.values) < 2:
+            step = self.min_step
+        else:
+            dx = abs(self.points[-1] - self.points[-2])
+            dv = abs(self.values[-1] - self.values[-2])
+            step = self.max_step if dv == 0 else self.target_change*dx/dv
+            step = min(step, self.step*self.growth)
+        # Approach known edges in fine steps
+        for edge in self.edges:
+            ahead = (edge - last)*self.direction
+            if -self.edge_width <= ahead <= step + self.edge_width:
+                step = self.min_step
+        step = min(max(step, self.min_step), self.max_step)
+        self.step = step
+        return step
+
+
+def loop_branches(max_curr, loops, start=0):
+    """
+    Return the (start, stop) of each branch of a hysteresis loop sweep:
+    start to +max_curr, then max_curr to -max_curr and back, loops times.
+    """
+    branches = [(start, max_curr)]
+    for i in range(loops):
+        branches += [(max_curr, -max_curr), (-max_curr, max_curr)]
+    return branches
+
+
+def _hilbert(x, y, ax, ay, bx, by):
+    # Generalized Hilbert curve over the rectangle spanned by (ax, ay) and (bx, by) from (x, y)
+    w = abs(ax + ay)
+    h = abs(bx + by)
+    dax, day = int(np.sign(ax)), int(np.sign(ay))
+    dbx, dby = int(np.sign(bx)), int(np.sign(by))
+    if h == 1:
+        for i in range(w):
+            yield x, y
+            x, y = x + dax, y + day
+        return
+    if w == 1:
+        for i in range(h):
+            yield x, y
+            x, y = x + dbx, y + dby
+        return
+    ax2, ay2 = ax//2, ay//2
+    bx2, by2 = bx//2, by//2
+    w2 = abs(ax2 + ay2)
+    h2 = abs(bx2 + by2)
+    if 2*w > 3*h:
+        # Long rectangle: two halves along a
+        if w2 % 2 and w > 2:
+            ax2, ay2 = ax2 + dax, ay2 + day
+        yield from _hilbert(x, y, ax2, ay2, bx, by)
+        yield from _hilbert(x + ax2, y + ay2, ax - ax2, ay - ay2, bx, by)
+    else:
+        # Up, across and back down
+        if h2 % 2 and h > 2:
+            bx2, by2 = bx2 + dbx, by2 + dby
+        yield from _hilbert(x, y, bx2, by2, ax2, ay2)
+        yield from _hilbert(x + bx2, y + by2, ax, ay, bx - bx2, by - by2)
+        yield from _hilbert(x + (ax - dax) + (bx2 - dbx), y + (ay - day) + (by2 - dby),
+                            -bx2, -by2, -(ax - ax2), -(ay - ay2))
+
+
+def grid_order(nx, ny, order="serpentine"):
+    """
+    Return the order to visit the cells of an nx by ny grid in, as (ix, iy) pairs.
+    Consecutive cells are neighbours, so the fields never jump across the grid.
+    Serpentine sweeps x back and forth, stepping y once per row, which keeps
+    the y supply's relay and compliance changes to the rows that need them.
+    Hilbert keeps both fields local at every scale; on any rectangle it
+    steps between neighbours, with a diagonal step where both sides are odd.
+
+    Parameters:
+    - nx (int): Number of x values.
+    - ny (int): Number of y values.
+    - order (str): "serpentine", "hilbert" or "raster". (Default to be "serpentine")
+
+    Returns:
+    - list of tuple: (ix, iy) of every cell, in visiting order.
+    """
+    if order == "raster":
+        return [(ix, iy) for iy in range(ny) for ix in range(nx)]
+    if order == "serpentine":
+        cells = []
+        for iy in range(ny):
+            xs = range(nx) if iy % 2 == 0 else range(nx - 1, -1, -1)
+            cells.extend((ix, iy) for ix in xs)
+        return cells
+    if order == "hilbert":
+        if nx >= ny:
+            return list(_hilbert(0, 0, nx, 0, 0, ny))
+        return list(_hilbert(0, 0, 0, ny, nx, 0))
+    raise Exception(f"sweep_planner: Invalid grid order: {order}")
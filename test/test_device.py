@@ -0,0 +1,90 @@
+import struct
+
+import numpy as np
+import pytest
+
+from device import CommandJournal, SessionRegistry, join_commands, parse_block
+
+
+def test_join_commands_makes_headers_absolute():
+    assert join_commands(["VOLT 1", ":CURR 0.1;", "*OPC?"], 256) == [":VOLT 1;:CURR 0.1;*OPC?"]
+
+
+def test_join_commands_splits_at_max_length():
+    messages = join_commands(["VOLT 1", "CURR 0.1", "OUTP ON"], 18)
+    assert messages == [":VOLT 1;:CURR 0.1", ":OUTP ON"]
+    assert join_commands([], 256) == []
+
+
+def test_parse_definite_block():
+    payload = struct.pack("<3f", 1.0, 2.5, -3.0)
+    data = b"#2" + b"12" + payload + b"\n"
+    assert parse_block(data).tolist() == [1.0, 2.5, -3.0]
+
+
+def test_parse_block_with_newline_byte_in_data():
+    # 0x0a inside the payload is data, not the terminator
+    payload = struct.pack(">2f", 1.0, 2.0) + b"\n\x00\x00\x00"
+    values = parse_block(b"#3012" + payload, ">f4")
+    assert values[:2].tolist() == [1.0, 2.0]
+    assert len(values) == 3
+
+
+def test_parse_indefinite_block():
+    payload = struct.pack("<2f", 1.0, 2.0)
+    assert parse_block(b"#0" + payload + b"\n").tolist() == [1.0, 2.0]
+
+
+def test_parse_block_errors():
+    with pytest.raises(Exception):
+        parse_block(b"1.0,2.0")
+    with pytest.raises(Exception):
+        parse_block(b"#212" + b"\x00"*8)
+
+
+def test_journal_since_filters():
+    journal = CommandJournal()
+    journal.log("A", "write", "VOLT 1")
+    journal.log("B", "query", "CURR?")
+    journal.log("A", "read", "0.1")
+    assert [e[3] for e in journal.since(0)] == ["VOLT 1", "CURR?"]
+    assert [e[3] for e in journal.since(0, address="A")] == ["VOLT 1"]
+    assert journal.tail(1)[0][3] == "0.1"
+
+
+def test_journal_dump_appends_new_entries_and_keeps_them(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = CommandJournal(path=path)
+    journal.log("A", "write", "VOLT 1")
+    journal.dump()
+    journal.log("A", "write", "CURR 0.1")
+    journal.dump()
+    journal.dump()
+    lines = open(path).read().splitlines()
+    assert len(lines) == 2
+    assert lines[0].endswith("VOLT 1")
+    assert lines[1].endswith("CURR 0.1")
+    assert len(journal.entries) == 2
+
+
+class _Resource:
+    session = 1
+
+    def close(self):
+        self.session = None
+
+
+class _ResourceManager:
+    def open_resource(self, address):
+        return _Resource()
+
+
+def test_session_state_shared_and_cleared_on_acquire():
+    registry = SessionRegistry(_ResourceManager())
+    first = registry.acquire("GPIB0::1::INSTR")
+    registry.state("GPIB0::1::INSTR")["VOLT"] = "1"
+    assert registry.acquire("GPIB0::1::INSTR") is first
+    assert registry.state("GPIB0::1::INSTR") == {}
+    registry.state("GPIB0::1::INSTR")["VOLT"] = "1"
+    registry.invalidate("GPIB0::1::INSTR")
+    assert registry.state("GPIB0::1::INSTR") == {}
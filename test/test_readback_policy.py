@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from readback_policy import FULL_SWEEP_POINTS, EveryNth, OnChange, ReadbackPolicy, ReducedPoints, infer
+
+
+def test_every_point():
+    policy = ReadbackPolicy(sweep_points=64)
+    assert [policy.decide(0.001*i, False) for i in range(3)] == [64, 64, 64]
+
+
+def test_every_nth():
+    policy = EveryNth(3)
+    assert [policy.decide(0.001*i, False) for i in range(7)] == \
+        [FULL_SWEEP_POINTS, None, None, FULL_SWEEP_POINTS, None, None, FULL_SWEEP_POINTS]
+
+
+def test_force_measures_and_reset_restarts():
+    policy = EveryNth(3)
+    policy.decide(0.0, False)
+    assert policy.decide(0.001, True, force=True) == FULL_SWEEP_POINTS
+    assert policy.last_setpoint == 0.001
+    policy.reset()
+    assert policy.index == 0
+    assert policy.last_setpoint is None
+
+
+def test_on_change():
+    policy = OnChange(threshold=0.005)
+    assert policy.decide(0.0, False) == FULL_SWEEP_POINTS
+    assert policy.decide(0.004, False) is None
+    assert policy.decide(0.006, False) == FULL_SWEEP_POINTS
+    # A relay flip is always measured
+    assert policy.decide(0.006, True) == FULL_SWEEP_POINTS
+
+
+def test_reduced_points():
+    policy = ReducedPoints(points=32, threshold=0.005)
+    assert policy.decide(0.0, False) == FULL_SWEEP_POINTS
+    assert policy.decide(0.001, False) == 32
+    assert policy.decide(0.01, False) == FULL_SWEEP_POINTS
+
+
+def test_estimate_uses_latest_offset():
+    policy = EveryNth(2)
+    assert policy.estimate(0.01) == 0.01
+    policy.observe(0.01, 0.0102)
+    assert policy.estimate(0.02) == pytest.approx(0.0202)
+
+
+def test_infer_interpolates_offsets():
+    setpoints = [0.0, 0.1, 0.2, 0.3, 0.4]
+    values = [0.01, 0.0, 0.0, 0.34, 0.0]
+    measured = [True, False, False, True, False]
+    result = infer(setpoints, values, measured)
+    assert result == pytest.approx([0.01, 0.12, 0.23, 0.34, 0.44])
+    # The input is not changed
+    assert values[1] == 0.0
+
+
+def test_infer_all_or_nothing_measured():
+    values = np.array([1.0, 2.0])
+    assert infer([0, 0], values, [True, True]).tolist() == [1.0, 2.0]
+    assert infer([0, 0], values, [False, False]).tolist() == [1.0, 2.0]
@@ -0,0 +1,70 @@
+from readback_policy import EveryNth
+from sweep_compiler import compile_sweep, compliance_first, summary
+from sweep_planner import plan_sweep
+
+
+def test_compliance_first():
+    assert compliance_first(1.0, {})
+    assert compliance_first(51.0, {"VOLT": "1.0"})
+    assert compliance_first(1.0, {"VOLT": "1.0"})
+    assert not compliance_first(0.1, {"VOLT": "1.0"})
+
+
+def test_first_point_sends_every_setting():
+    programs = compile_sweep(plan_sweep([0.0005, 0.0006]))
+    first, second = programs
+    assert [header for header, value in first.settings] == ["OUTP:REL", "OUTP:REL:POL", "VOLT", "CURR"]
+    assert first.settle == "relay"
+    assert first.writes == [":OUTP:REL ON;:OUTP:REL:POL NORM;:VOLT 0.1;:CURR 0.0005"]
+    assert first.query == ":MEAS:CURR?"
+    # Only the setpoint changes, fused with the readback
+    assert second.settle is None
+    assert second.writes == []
+    assert second.query == ":CURR 0.0006;:MEAS:CURR?"
+
+
+def test_cached_settings_are_skipped():
+    state = {"OUTP:REL": "ON", "OUTP:REL:POL": "NORM", "VOLT": "0.1"}
+    program, = compile_sweep(plan_sweep([0.0005]), state)
+    assert program.settings == [("CURR", "0.0005")]
+    assert program.query == ":CURR 0.0005;:MEAS:CURR?"
+    # The caller's state is not changed
+    assert "CURR" not in state
+
+
+def test_compliance_raised_before_and_lowered_after_the_current():
+    plan = plan_sweep([0.0005]*20 + [0.01] + [0.0005]*20)
+    programs = compile_sweep(plan)
+    up = [header for header, value in programs[20].settings]
+    down = [header for header, value in programs[21].settings]
+    assert up == ["VOLT", "CURR"]
+    assert down == ["CURR", "VOLT"]
+    assert programs[20].settle == programs[21].settle == "compliance"
+
+
+def test_relay_flip_settles():
+    programs = compile_sweep(plan_sweep([0.0005, -0.0005]))
+    assert programs[1].settings == [("OUTP:REL:POL", "REV")]
+    assert programs[1].settle == "relay"
+    assert programs[1].writes == [":OUTP:REL:POL REV"]
+
+
+def test_policy_infers_points_but_measures_settles():
+    plan = plan_sweep([0.0001*i for i in range(1, 8)] + [-0.0001])
+    programs = compile_sweep(plan, policy=EveryNth(3))
+    assert [p.measured for p in programs] == [True, False, False, True, False, False, True, True]
+    assert ("SENS:SWE:POIN", "256") in programs[0].settings
+    assert all(header != "SENS:SWE:POIN" for p in programs[1:] for header, value in p.settings)
+    assert programs[1].writes == [":CURR 0.0002"]
+
+
+def test_messages_respect_max_length():
+    programs = compile_sweep(plan_sweep([0.0005]), max_length=30)
+    assert all(len(m) <= 30 for m in programs[0].writes + [programs[0].query])
+    assert len(programs[0].writes) > 1
+
+
+def test_summary():
+    programs = compile_sweep(plan_sweep([0.0005, 0.0006]))
+    assert summary(programs).startswith("2 points, 3 supply messages")
+    assert summary(programs).endswith("2 readbacks, 1 settle waits")
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from sweep_planner import AdaptiveStepper, assign_bands, assign_polarity, band_of, loop_branches, naive_plan, \
+    plan_sweep
+
+
+def test_band_of():
+    assert band_of(0.0005) == 0
+    assert band_of(-0.001) == 0
+    assert band_of(0.01) == 1
+    assert band_of(-1.0) == 2
+    with pytest.raises(Exception):
+        band_of(2.0)
+
+
+def test_assign_polarity_keeps_zero_points_with_their_neighbours():
+    points = np.array([0, 0, -1, -2, 0, 1, 0, -1])
+    assert assign_polarity(points).tolist() == [-1, -1, -1, -1, -1, 1, 1, -1]
+    assert assign_polarity(np.zeros(3)).tolist() == [1, 1, 1]
+
+
+def test_assign_bands_raises_at_once_and_lowers_after_dwell():
+    points = np.array([0.0005]*3 + [0.01]*3 + [0.0005]*5)
+    assert assign_bands(points, min_dwell=5).tolist() == [0]*3 + [1]*3 + [0]*5
+    # Too short an excursion to switch back
+    assert assign_bands(points, min_dwell=6).tolist() == [0]*3 + [1]*8
+
+
+def test_assign_bands_hysteresis():
+    # 0.0009 A fits band 0, but not 20% below its 0.001 A limit
+    points = np.array([0.01] + [0.0009]*30)
+    assert assign_bands(points).tolist() == [1]*31
+    points = np.array([0.01] + [0.0007]*30)
+    assert assign_bands(points).tolist() == [1] + [0]*30
+
+
+def test_plan_sweep_counts():
+    points = np.concatenate([np.linspace(0, 0.01, 11), np.linspace(0.01, -0.01, 21)])
+    plan = plan_sweep(points, min_dwell=5)
+    assert len(plan) == 32
+    assert plan.relay_flips == 1
+    assert sum(len(segment) for segment in plan.segments) == len(plan)
+    assert plan.dead_time() == pytest.approx((plan.relay_flips + 1)*0.3 + (plan.compliance_switches + 1)*0.3)
+    assert plan.duration(0.1) == pytest.approx(32*0.1 + plan.dead_time())
+    steps = list(plan.steps())
+    assert steps[0] == (0.0, False, 0.1)
+    assert steps[-1] == (-0.01, True, 1.0)
+
+
+def test_plan_sweep_rounds_small_values_to_zero():
+    plan = plan_sweep([-1e-18, 0.001, 1e-18, -0.001])
+    assert plan.points[0] == 0.0
+    assert plan.polarity.tolist() == [1, 1, 1, -1]
+
+
+def test_plan_sweep_beats_naive_plan():
+    points = np.concatenate([np.linspace(0, 0.02, 41), np.linspace(0.02, -0.02, 81)])
+    assert plan_sweep(points).dead_time() <= naive_plan(points).dead_time()
+
+
+def test_empty_plan():
+    plan = plan_sweep([])
+    assert len(plan) == 0
+    assert plan.segments == []
+    assert plan.dead_time() == 0.0
+
+
+def test_loop_branches():
+    assert loop_branches(1, 2) == [(0, 1), (1, -1), (-1, 1), (1, -1), (-1, 1)]
+
+
+def _run(stepper, edge=0.05):
+    # Step of 1 at the edge, a gentle slope elsewhere
+    for point in stepper:
+        stepper.record(point, (1 if point*stepper.direction > edge*stepper.direction else 0) + 0.1*point)
+    return stepper
+
+
+def test_adaptive_stepper_is_monotonic_and_ends_at_stop():
+    stepper = _run(AdaptiveStepper(-0.2, 0.2, 0.001, 0.02, target_change=0.05))
+    assert stepper.points[0] == -0.2
+    assert stepper.points[-1] == 0.2
+    assert np.all(np.diff(stepper.points) > 0)
+    steps = np.diff(stepper.points)
+    assert steps.min() >= 0.001 - 1e-12
+    assert steps.max() <= 0.02 + 1e-12
+
+
+def test_adaptive_stepper_detects_edge():
+    stepper = _run(AdaptiveStepper(-0.2, 0.2, 0.001, 0.02, target_change=0.05))
+    assert len(stepper.detected) == 1
+    assert stepper.detected[0] == pytest.approx(0.05, abs=0.02)
+
+
+def test_adaptive_stepper_keeps_largest_edges_in_sweep_order():
+    stepper = AdaptiveStepper(0, -1, 0.1, 0.1, target_change=0.1, max_edges=2)
+    for point, value in zip([0, -0.1, -0.2, -0.3, -0.4], [0, 1, 1.6, 4.6, 4.6]):
+        stepper.record(point, value)
+    assert stepper.detected == pytest.approx([-0.05, -0.25])
+
+
+def test_adaptive_stepper_refines_known_edges():
+    coarse = _run(AdaptiveStepper(-0.2, 0.2, 0.001, 0.02, target_change=0.05))
+    fine = _run(AdaptiveStepper(-0.2, 0.2, 0.001, 0.02, target_change=0.05, edges=coarse.detected))
+    near = lambda points: np.count_nonzero(np.abs(np.asarray(points) - 0.05) < 0.01)
+    assert near(fine.points) > near(coarse.points)
+
+
+def test_adaptive_stepper_requires_record():
+    stepper = AdaptiveStepper(0, 1, 0.1, 0.1, target_change=1)
+    stepper.record(stepper.next_point(), 0)
+    stepper.next_point()
+    stepper.points.append(0.1)
+    with pytest.raises(Exception):
+        stepper.next_point()